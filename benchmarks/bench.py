@@ -0,0 +1,202 @@
+"""
+Offline benchmarks of ComfyAPIManager against the fake server in mock_comfyui.py.
+
+For each batch size it measures:
+
+- submit throughput (batch_submit, prompts per second)
+- completion-detection latency: from the server writing a prompt's history entry (or the
+  wait starting, if it was already done) to the client reporting it finished (p50 / p95 / max)
+- batch wait overhead: how long wait_and_get_all_outputs returns after the last prompt finished
+- download throughput of the outputs (download_outputs)
+- client CPU time per job and resident memory
+
+The server runs in a subprocess, so CPU and memory figures are the client's alone.
+
+    python benchmarks/bench.py                                # 1, 100 and 5000 jobs
+    python benchmarks/bench.py --jobs 100 --save base.json    # record a baseline
+    python benchmarks/bench.py --jobs 100 --baseline base.json   # exit 1 on a regression
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+import requests
+
+import comfyapi
+
+_HERE = os.path.dirname(os.path.abspath(__file__))
+_WORKFLOW = os.path.join(_HERE, os.pardir, "examples", "workflow_t2i.json")
+_SEED_PATH = ["3", "inputs", "seed"]
+
+# Metric -> (True if higher is better, absolute change always treated as noise); used for the
+# table and the baseline comparison
+_METRICS = {
+    "submit_per_s": (True, 0.0),
+    "detect_p50_ms": (False, 10.0),
+    "detect_p95_ms": (False, 10.0),
+    "detect_max_ms": (False, 10.0),
+    "wait_overhead_ms": (False, 10.0),
+    "download_mb_per_s": (True, 0.0),
+    "cpu_ms_per_job": (False, 1.0),
+    "rss_mb": (False, 5.0),
+}
+
+
+def _percentile(values, fraction):
+    values = sorted(values)
+    return values[int(fraction * (len(values) - 1))] if values else 0.0
+
+
+def _rss_mb():
+    """Current resident memory of this process, or its peak where /proc is unavailable."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return 0.0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10 # Bytes on macOS, KiB elsewhere
+
+
+class _MockProcess:
+    """mock_comfyui.py running in a subprocess."""
+
+    def __init__(self, latency, failure_rate, output_size):
+        command = [sys.executable, os.path.join(_HERE, "mock_comfyui.py"), "--port", "0",
+                   "--latency", str(latency), "--failure-rate", str(failure_rate), "--output-size", str(output_size)]
+        self._process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+        line = self._process.stdout.readline()
+        if "listening on" not in line:
+            self._process.kill()
+            raise RuntimeError(f"Mock server failed to start: {line!r}")
+        self.url = line.rsplit(" ", 1)[-1].strip()
+
+    def stats(self):
+        return requests.get(f"{self.url}/mock/stats", timeout=30).json()
+
+    def stop(self):
+        self._process.terminate()
+        self._process.wait(timeout=10)
+
+
+def run_scenario(jobs, latency=0.005, failure_rate=0.0, output_size=256 * 1024, concurrency=8, downloads=100):
+    """Runs one batch of `jobs` prompts against a fresh mock server and returns its metrics."""
+    server = _MockProcess(latency, failure_rate, output_size)
+    save_path = tempfile.mkdtemp(prefix="comfyapi-bench-")
+    detected = {}
+    try:
+        manager = comfyapi.ComfyAPIManager()
+        manager.set_base_url(server.url)
+        manager.load_workflow(_WORKFLOW)
+        manager.client.get_queue() # Opens the HTTP session before timing starts
+
+        def on_status(uid, status):
+            if status == "finished":
+                detected[uid] = time.time()
+
+        cpu_start = time.process_time()
+        start = time.perf_counter()
+        uids = manager.batch_submit(seeds=list(range(jobs)), seed_node_path=_SEED_PATH, concurrency=concurrency)
+        submit_time = time.perf_counter() - start
+
+        wait_started = time.time()
+        results, errors = manager.wait_and_get_all_outputs(uids, status_callback=on_status)
+        wait_returned = time.time()
+
+        batch = results[:downloads]
+        start = time.perf_counter()
+        saved, download_errors = manager.download_outputs(batch, save_path=save_path, concurrency=concurrency)
+        download_time = time.perf_counter() - start
+        cpu_time = time.process_time() - cpu_start
+        rss = _rss_mb()
+        manager.close()
+
+        finished_at = server.stats()["finished_at"]
+        latencies = [(detected[uid] - max(finished_at[uid], wait_started)) * 1000 for uid in detected if uid in finished_at]
+        downloaded = sum(os.path.getsize(path) for path in saved)
+        return {
+            "jobs": jobs,
+            "errors": len(errors) + len(download_errors),
+            "submit_per_s": jobs / submit_time if submit_time else 0.0,
+            "detect_p50_ms": _percentile(latencies, 0.5),
+            "detect_p95_ms": _percentile(latencies, 0.95),
+            "detect_max_ms": max(latencies, default=0.0),
+            "wait_overhead_ms": (wait_returned - max(finished_at.values(), default=wait_returned)) * 1000,
+            "download_mb_per_s": downloaded / 2**20 / download_time if download_time else 0.0,
+            "cpu_ms_per_job": cpu_time * 1000 / jobs,
+            "rss_mb": rss,
+        }
+    finally:
+        server.stop()
+        shutil.rmtree(save_path, ignore_errors=True)
+
+
+def _print_table(rows):
+    columns = ["jobs", "errors"] + list(_METRICS)
+    print("  ".join(f"{name:>17}" for name in columns))
+    for row in rows:
+        print("  ".join(f"{row[name]:>17.1f}" if isinstance(row[name], float) else f"{row[name]:>17}" for name in columns))
+
+
+def compare(rows, baseline, tolerance):
+    """Returns a description of every metric that is worse than baseline by more than tolerance."""
+    previous = {row["jobs"]: row for row in baseline}
+    regressions = []
+    for row in rows:
+        base = previous.get(row["jobs"])
+        if base is None:
+            continue
+        for name, (higher_is_better, noise) in _METRICS.items():
+            old, new = base.get(name), row[name]
+            if not old or abs(new - old) <= noise:
+                continue
+            change = (old - new) / old if higher_is_better else (new - old) / old
+            if change > tolerance:
+                regressions.append(f"{row['jobs']} jobs: {name} {old:.1f} -> {new:.1f} ({change:+.0%} worse)")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark comfyapi against a local mock ComfyUI server.")
+    parser.add_argument("--jobs", default="1,100,5000", help="Comma-separated batch sizes.")
+    parser.add_argument("--latency", type=float, default=0.005, help="Seconds the mock server spends per job.")
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--output-size", type=int, default=256 * 1024, help="Bytes per output file.")
+    parser.add_argument("--concurrency", type=int, default=8, help="Parallel submissions and downloads.")
+    parser.add_argument("--downloads", type=int, default=100, help="Outputs downloaded per batch.")
+    parser.add_argument("--save", help="Write the results to this JSON file.")
+    parser.add_argument("--baseline", help="Compare with results saved by --save; exit 1 on a regression.")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative slowdown per metric.")
+    args = parser.parse_args()
+
+    rows = []
+    for jobs in [int(size) for size in args.jobs.split(",")]:
+        rows.append(run_scenario(jobs, args.latency, args.failure_rate, args.output_size,
+                                 args.concurrency, args.downloads))
+    _print_table(rows)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(rows, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(rows, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,529 @@
+"""
+A small fake ComfyUI server for offline benchmarking.
+
+Implements the subset of the ComfyUI HTTP/WebSocket API that comfyapi uses:
+``/prompt``, ``/queue``, ``/interrupt``, ``/history``, ``/history/{id}``,
+``/view``, ``/upload/image`` and the ``/ws`` WebSocket. Jobs are executed by a
+single worker thread (like a single GPU) with a configurable latency, failure
+rate and output size. ``GET /mock/stats`` reports request counters and when
+each prompt started and finished, for the benchmark harness.
+
+Run standalone with::
+
+    python benchmarks/mock_comfyui.py --port 8188 --latency 0.05
+"""
+import argparse
+import base64
+import hashlib
+import json
+import os
+import random
+import socket
+import struct
+import threading
+import time
+import urllib.parse
+import uuid
+import weakref
+from collections import OrderedDict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+_WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+
+class MockComfyUI:
+    """State and job runner of the fake server."""
+
+    def __init__(self, latency=0.05, failure_rate=0.0, output_size=64 * 1024, seed=None):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.output_size = output_size
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        self._pending = deque()  # (number, prompt_id, prompt, client_id)
+        self._running = None
+        self._interrupt = threading.Event()
+        self._history = OrderedDict()
+        self._number = 0
+        self._sockets = {}  # client_id -> list of sockets
+        self._uploads = {}
+        self._output_blob = os.urandom(output_size)
+        self.counters = {}
+        self.view_truncate = 0 # If set, /view drops the connection after this many bytes
+        self.view_truncate_hits = 0
+        self.extra_outputs = False # If set, prompts also report a temp preview and a video
+        self.view_delay = 0.0 # Seconds of simulated network latency per /view GET
+        self.unavailable = 0 # If set, this many requests are answered with 503 before serving again
+        self.view_range_shift = 0 # If set, ranged /view responses start this many bytes before the requested offset
+        self.connections = set()
+        self.max_pending = 0 # Longest pending queue seen
+        self.started_at = {} # prompt_id -> time.time() its execution started
+        self.finished_at = {} # prompt_id -> time.time() its history entry was written
+        self._stop = False
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+
+    # --- bookkeeping ---
+
+    def count(self, name):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + 1
+
+    def refuse(self):
+        """True if this request should be answered with 503 (see `unavailable`)."""
+        with self._lock:
+            if self.unavailable <= 0:
+                return False
+            self.unavailable -= 1
+            return True
+
+    def stop(self):
+        with self._cond:
+            self._stop = True
+            self._cond.notify_all()
+
+    # --- WebSocket fan-out ---
+
+    def add_socket(self, client_id, sock):
+        with self._lock:
+            self._sockets.setdefault(client_id, []).append(sock)
+            remaining = len(self._pending) + (1 if self._running else 0)
+        self._send(client_id, {"type": "status", "data": {"status": {"exec_info": {"queue_remaining": remaining}}, "sid": client_id}})
+
+    def remove_socket(self, client_id, sock):
+        with self._lock:
+            socks = self._sockets.get(client_id, [])
+            if sock in socks:
+                socks.remove(sock)
+
+    def _send(self, client_id, message):
+        payload = json.dumps(message).encode("utf-8")
+        frame = _encode_frame(payload)
+        with self._lock:
+            socks = list(self._sockets.get(client_id, []))
+        for sock in socks:
+            try:
+                with _send_lock(sock):
+                    sock.sendall(frame)
+            except OSError:
+                self.remove_socket(client_id, sock)
+
+    def _broadcast_status(self):
+        with self._lock:
+            remaining = len(self._pending) + (1 if self._running else 0)
+            clients = list(self._sockets)
+        for client_id in clients:
+            self._send(client_id, {"type": "status", "data": {"status": {"exec_info": {"queue_remaining": remaining}}}})
+
+    # --- queue API ---
+
+    def queue_prompt(self, prompt, client_id, prompt_id=None, front=False):
+        if not isinstance(prompt, dict) or not prompt:
+            return None
+        prompt_id = str(prompt_id or uuid.uuid4())
+        with self._cond:
+            self._number += 1
+            number = -self._number if front else self._number
+            if front:
+                self._pending.insert(0, (number, prompt_id, prompt, client_id))
+            else:
+                self._pending.append((number, prompt_id, prompt, client_id))
+            self._cond.notify_all()
+        self._broadcast_status()
+        with self._lock:
+            self.max_pending = max(self.max_pending, len(self._pending))
+        return {"prompt_id": prompt_id, "number": number, "node_errors": {}}
+
+    def queue_state(self):
+        with self._lock:
+            running = [list(self._running[:3]) + [{"client_id": self._running[3]}, []]] if self._running else []
+            pending = [[n, pid, prompt, {"client_id": cid}, []] for n, pid, prompt, cid in self._pending]
+        return {"queue_running": running, "queue_pending": pending}
+
+    def delete(self, prompt_ids):
+        with self._lock:
+            self._pending = deque(item for item in self._pending if item[1] not in prompt_ids)
+        self._broadcast_status()
+
+    def interrupt(self, prompt_id=None):
+        with self._lock:
+            running = self._running
+        if running and (prompt_id is None or running[1] == prompt_id):
+            self._interrupt.set()
+
+    def stats(self):
+        with self._lock:
+            return {"counters": dict(self.counters), "max_pending": self.max_pending,
+                    "started_at": dict(self.started_at), "finished_at": dict(self.finished_at)}
+
+    def history(self, prompt_id=None, max_items=None):
+        with self._lock:
+            if prompt_id is not None:
+                entry = self._history.get(prompt_id)
+                return {prompt_id: entry} if entry else {}
+            items = list(self._history.items())
+        if max_items is not None:
+            items = items[-max_items:]
+        return dict(items)
+
+    # --- execution ---
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._stop:
+                    self._cond.wait()
+                if self._stop:
+                    return
+                job = self._pending.popleft()
+                self._running = job
+                self._interrupt.clear()
+            number, prompt_id, prompt, client_id = job
+            self._execute(number, prompt_id, prompt, client_id)
+            with self._lock:
+                self._running = None
+            self._broadcast_status()
+
+    def _execute(self, number, prompt_id, prompt, client_id):
+        with self._lock:
+            self.started_at[prompt_id] = time.time()
+        started = int(time.time() * 1000)
+        self._send(client_id, {"type": "execution_start", "data": {"prompt_id": prompt_id, "timestamp": started}})
+        node_ids = sorted(prompt.keys())
+        for node_id in node_ids:
+            self._send(client_id, {"type": "executing", "data": {"node": node_id, "display_node": node_id, "prompt_id": prompt_id}})
+        interrupted = self._interrupt.wait(self.latency)
+        status_messages = [["execution_start", {"prompt_id": prompt_id, "timestamp": started}]]
+        entry = {"prompt": [number, prompt_id, prompt, {"client_id": client_id}, []], "outputs": {}}
+        if interrupted:
+            data = {"prompt_id": prompt_id, "node_id": node_ids[-1], "node_type": "", "executed": []}
+            self._send(client_id, {"type": "execution_interrupted", "data": data})
+            status_messages.append(["execution_interrupted", data])
+            entry["status"] = {"status_str": "error", "completed": False, "messages": status_messages}
+        elif self._random.random() < self.failure_rate:
+            data = {"prompt_id": prompt_id, "node_id": node_ids[-1], "node_type": "KSampler",
+                    "exception_message": "Mock failure", "exception_type": "RuntimeError", "traceback": []}
+            self._send(client_id, {"type": "execution_error", "data": data})
+            status_messages.append(["execution_error", data])
+            entry["status"] = {"status_str": "error", "completed": False, "messages": status_messages}
+        else:
+            save_node = node_ids[-1]
+            output = {"images": [{"filename": f"ComfyUI_{number:05d}_.png", "subfolder": "", "type": "output"}]}
+            entry["outputs"] = {save_node: output}
+            if self.extra_outputs:
+                # A preview in the temp folder and an animation saved to a subfolder
+                entry["outputs"][node_ids[0]] = {"images": [{"filename": f"ComfyUI_temp_{number:05d}.png", "subfolder": "", "type": "temp"}]}
+                entry["outputs"]["vhs"] = {"gifs": [{"filename": f"anim_{number:05d}.mp4", "subfolder": "videos", "type": "output", "format": "video/h264-mp4"}],
+                                           "text": ["not a file"]}
+            self._send(client_id, {"type": "executed", "data": {"node": save_node, "display_node": save_node, "output": output, "prompt_id": prompt_id}})
+            data = {"prompt_id": prompt_id, "timestamp": int(time.time() * 1000)}
+            self._send(client_id, {"type": "execution_success", "data": data})
+            status_messages.append(["execution_success", data])
+            entry["status"] = {"status_str": "success", "completed": True, "messages": status_messages}
+        # Like ComfyUI, history is written before the final "executing: None" message.
+        with self._lock:
+            self._history[prompt_id] = entry
+            self.finished_at[prompt_id] = time.time()
+        self._send(client_id, {"type": "executing", "data": {"node": None, "prompt_id": prompt_id}})
+
+    def output_bytes(self):
+        return self._output_blob
+
+    def store_upload(self, name, data):
+        with self._lock:
+            self._uploads[name] = data
+
+
+_SEND_LOCKS = weakref.WeakKeyDictionary() # socket -> lock serializing frames written to it
+_SEND_LOCKS_GUARD = threading.Lock()
+
+
+def _send_lock(sock):
+    with _SEND_LOCKS_GUARD:
+        lock = _SEND_LOCKS.get(sock)
+        if lock is None:
+            lock = _SEND_LOCKS[sock] = threading.Lock()
+        return lock
+
+
+def _encode_frame(payload, opcode=0x1):
+    header = bytes([0x80 | opcode])
+    length = len(payload)
+    if length < 126:
+        header += bytes([length])
+    elif length < 65536:
+        header += bytes([126]) + struct.pack("!H", length)
+    else:
+        header += bytes([127]) + struct.pack("!Q", length)
+    return header + payload
+
+
+def _read_frame(sock):
+    """Reads one client frame; returns (opcode, payload) or (None, None) on EOF."""
+    def recv_exact(n):
+        data = b""
+        while len(data) < n:
+            chunk = sock.recv(n - len(data))
+            if not chunk:
+                return None
+            data += chunk
+        return data
+
+    header = recv_exact(2)
+    if header is None:
+        return None, None
+    opcode = header[0] & 0x0F
+    length = header[1] & 0x7F
+    if length == 126:
+        length = struct.unpack("!H", recv_exact(2))[0]
+    elif length == 127:
+        length = struct.unpack("!Q", recv_exact(8))[0]
+    mask = recv_exact(4) if header[1] & 0x80 else None
+    payload = recv_exact(length) if length else b""
+    if payload is None:
+        return None, None
+    if mask:
+        payload = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+    return opcode, payload
+
+
+def _make_handler(state):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def log_message(self, format, *args):
+            pass
+
+        def setup(self):
+            super().setup()
+            with state._lock:
+                state.connections.add(self.connection)
+
+        def finish(self):
+            with state._lock:
+                state.connections.discard(self.connection)
+            try:
+                super().finish()
+            except OSError:
+                pass
+
+        def _json(self, obj, status=200):
+            body = json.dumps(obj).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _body(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            return self.rfile.read(length) if length else b""
+
+        def do_GET(self):
+            parsed = urllib.parse.urlparse(self.path)
+            query = urllib.parse.parse_qs(parsed.query)
+            path = parsed.path
+            state.count("GET " + (path if not path.startswith("/history/") else "/history/{id}"))
+            if state.refuse():
+                return self._json({"error": "unavailable"}, status=503)
+            if path == "/ws":
+                return self._websocket(query.get("clientId", [""])[0])
+            if path == "/queue":
+                return self._json(state.queue_state())
+            if path == "/history":
+                max_items = query.get("max_items")
+                return self._json(state.history(max_items=int(max_items[0]) if max_items else None))
+            if path.startswith("/history/"):
+                return self._json(state.history(prompt_id=path[len("/history/"):]))
+            if path == "/view":
+                return self._view(head=False)
+            if path == "/mock/stats":
+                return self._json(state.stats())
+            self._json({"error": "not found"}, status=404)
+
+        def do_HEAD(self):
+            if urllib.parse.urlparse(self.path).path == "/view":
+                state.count("HEAD /view")
+                return self._view(head=True)
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+        def do_POST(self):
+            path = urllib.parse.urlparse(self.path).path
+            state.count("POST " + path)
+            body = self._body()
+            if state.refuse():
+                return self._json({"error": "unavailable"}, status=503)
+            if path == "/prompt":
+                try:
+                    payload = json.loads(body)
+                except ValueError:
+                    return self._json({"error": "invalid json"}, status=400)
+                result = state.queue_prompt(payload.get("prompt"), payload.get("client_id"), payload.get("prompt_id"),
+                                            bool(payload.get("front")))
+                if result is None:
+                    return self._json({"error": {"type": "invalid_prompt"}, "node_errors": {}}, status=400)
+                return self._json(result)
+            if path == "/queue":
+                payload = json.loads(body or b"{}")
+                if payload.get("clear"):
+                    state.delete({item[1] for item in state.queue_state()["queue_pending"]})
+                if "delete" in payload:
+                    state.delete(set(payload["delete"]))
+                return self._json({})
+            if path == "/interrupt":
+                payload = json.loads(body or b"{}")
+                state.interrupt(payload.get("prompt_id"))
+                return self._json({})
+            if path == "/upload/image":
+                return self._upload(body)
+            self._json({"error": "not found"}, status=404)
+
+        def _view(self, head):
+            blob = state.output_bytes()
+            etag = '"%s"' % hashlib.sha1(blob).hexdigest()[:16]
+            start = 0
+            status = 200
+            range_header = self.headers.get("Range")
+            if_range = self.headers.get("If-Range")
+            if range_header and if_range is not None and if_range != etag:
+                range_header = None # Changed since the client's copy: send the whole file
+            if range_header and range_header.startswith("bytes="):
+                start = int(range_header[len("bytes="):].split("-")[0] or 0)
+                status = 206
+                if start >= len(blob):
+                    self.send_response(416)
+                    self.send_header("Content-Range", f"bytes */{len(blob)}")
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                start = max(0, start - state.view_range_shift)
+            chunk = blob[start:]
+            if state.view_delay and not head:
+                time.sleep(state.view_delay)
+            self.send_response(status)
+            self.send_header("Content-Type", "image/png")
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", str(len(chunk)))
+            if status == 206:
+                self.send_header("Content-Range", f"bytes {start}-{len(blob) - 1}/{len(blob)}")
+            self.end_headers()
+            if not head:
+                if state.view_truncate and len(chunk) > state.view_truncate:
+                    # Simulate a connection dropped mid-transfer
+                    state.view_truncate_hits += 1
+                    self.wfile.write(chunk[:state.view_truncate])
+                    self.wfile.flush()
+                    self.close_connection = True
+                    return
+                self.wfile.write(chunk)
+
+        def _upload(self, body):
+            content_type = self.headers.get("Content-Type", "")
+            boundary = content_type.split("boundary=")[-1].encode("ascii")
+            name, data = None, None
+            for part in body.split(b"--" + boundary):
+                if b"\r\n\r\n" not in part:
+                    continue
+                headers, _, content = part.partition(b"\r\n\r\n")
+                content = content[:-2] if content.endswith(b"\r\n") else content
+                if b'name="image"' in headers:
+                    name = headers.split(b'filename="')[1].split(b'"')[0].decode("utf-8")
+                    data = content
+            if name is None:
+                return self._json({"error": "no image"}, status=400)
+            state.store_upload(name, data)
+            self._json({"name": name, "subfolder": "", "type": "input"})
+
+        def _websocket(self, client_id):
+            key = self.headers.get("Sec-WebSocket-Key")
+            accept = base64.b64encode(hashlib.sha1((key + _WS_GUID).encode("ascii")).digest()).decode("ascii")
+            self.send_response(101)
+            self.send_header("Upgrade", "websocket")
+            self.send_header("Connection", "Upgrade")
+            self.send_header("Sec-WebSocket-Accept", accept)
+            self.end_headers()
+            self.wfile.flush()
+            sock = self.connection
+            state.add_socket(client_id, sock)
+            try:
+                while True:
+                    opcode, payload = _read_frame(sock)
+                    if opcode is None or opcode == 0x8:
+                        break
+                    if opcode == 0x9:
+                        with _send_lock(sock):
+                            sock.sendall(_encode_frame(payload, opcode=0xA))
+            except OSError:
+                pass
+            finally:
+                state.remove_socket(client_id, sock)
+                self.close_connection = True
+
+    return Handler
+
+
+class MockServer:
+    """Runs a :class:`MockComfyUI` behind a threaded HTTP server."""
+
+    def __init__(self, host="127.0.0.1", port=0, **kwargs):
+        self.state = MockComfyUI(**kwargs)
+        self.httpd = ThreadingHTTPServer((host, port), _make_handler(self.state))
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.state.stop()
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def kill(self):
+        """Stops the server and drops every open connection, like a crashed backend."""
+        self.stop()
+        with self.state._lock:
+            connections = list(self.state.connections)
+        for sock in connections:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a fake ComfyUI server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8188)
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds per job.")
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--output-size", type=int, default=64 * 1024)
+    args = parser.parse_args()
+    server = MockServer(args.host, args.port, latency=args.latency, failure_rate=args.failure_rate,
+                        output_size=args.output_size)
+    print(f"Mock ComfyUI listening on {server.url}", flush=True)
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
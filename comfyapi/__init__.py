@@ -1,30 +1,45 @@
-import json
-import copy
-import os
-import urllib
-import base64
+import logging
+import functools
+import threading
+import uuid
 
 # Import core functions and exceptions from the client module
 from .client import (
-    set_base_url as _set_base_url,
-    _queue_prompt,
-    _wait_for_finish_single,
-    _batch_submit_internal,
-    _wait_and_get_all_outputs_internal,
-    _download_output,
-    _generate_client_id, # Need this for fallback filename generation
-    _find_output,
+    ComfyClient,
+    _sweep_variants,
+    _split_outcomes,
+    _wait_and_download,
+    _submit_variants,
+    _submit_seeds,
+    _collect_batch,
     ComfyAPIError,
     ConnectionError,
     QueueError,
     HistoryError,
     ExecutionError,
     TimeoutError,
-    _get_history,
-    _find_output_in_history
+    CancelledError,
+    _known_prompt_ids,
 )
-import requests # Need requests here now
-import urllib.parse # Need urllib here now
+from .template import WorkflowTemplate, _encode
+from .cache import ResultCache
+from .journal import JobJournal
+from .instrumentation import (
+    add_instrumentation,
+    remove_instrumentation,
+    MetricsRecorder,
+    PrometheusHook,
+    OpenTelemetryHook,
+    _span,
+)
+from .workflow import _WorkflowEditor
+from .jobs import _JobRegistry, _JobQueries
+from .feeder import _PromptFeeder, _check_priority
+from .aio import AsyncComfyAPIManager
+from .cluster import ComfyClusterManager
+
+# Library log records are dropped unless the application configures logging
+logging.getLogger("comfyapi").addHandler(logging.NullHandler())
 
 # --- Public API Functions ---
 
@@ -36,234 +51,440 @@ __all__ = [
     "HistoryError",
     "ExecutionError",
     "TimeoutError",
-    "ComfyAPIManager"
+    "CancelledError",
+    "ComfyAPIManager",
+    "AsyncComfyAPIManager",
+    "ComfyClusterManager",
+    "ComfyClient",
+    "WorkflowTemplate",
+    "ResultCache",
+    "JobJournal",
+    "add_instrumentation",
+    "remove_instrumentation",
+    "MetricsRecorder",
+    "PrometheusHook",
+    "OpenTelemetryHook",
 ]
 
-class ComfyAPIManager:
-    def __init__(self):
+class ComfyAPIManager(_WorkflowEditor, _JobQueries):
+    def __init__(self, max_finished_jobs=10000, client=None, max_queued=None, tenant_weights=None, result_cache=None,
+                 journal=None):
         self.workflow = None
-        self.base_url = None
-        # Track queued jobs: list of dicts {"prompt_id": str, "status": str}
-        self.queue = []
+        self.base_url = client.base_url if client is not None else None
+        # Connection state (URLs, client ID, session, WebSocket tracker) belongs to this manager,
+        # so managers pointed at different servers never affect each other
+        self.client = client if client is not None else ComfyClient()
+        # Submitted jobs indexed by prompt_id; the oldest finished ones are evicted.
+        # With an opt-in JobJournal they are also recorded on disk for resume()
+        self._jobs = _JobRegistry(max_finished=max_finished_jobs, journal=journal)
+        # With max_queued set, prompts are held locally and fed to the server a few at a time
+        self.max_queued = max_queued
+        self.tenant_weights = dict(tenant_weights or {})
+        self._feeder = None
+        self._feeder_lock = threading.Lock()
+        # Opt-in ResultCache: identical prompts are answered with earlier outputs or share one run
+        self.result_cache = result_cache
+        if result_cache is not None:
+            result_cache._attach()
 
     def set_base_url(self, url):
-        self.base_url = url
-        _set_base_url(url)
+        self._stop_feeder()
+        self.client.set_base_url(url)
+        self.base_url = self.client.base_url
 
-    def load_workflow(self, filepath):
-        """Loads a workflow from a JSON file and stores it locally."""
-        try:
-            with open(filepath, 'r', encoding='utf-8') as f:
-                self.workflow = json.load(f)
-        except FileNotFoundError:
-            raise ComfyAPIError(f"Workflow file not found: {filepath}")
-        except json.JSONDecodeError:
-            raise ComfyAPIError(f"Failed to decode JSON from workflow file: {filepath}")
-        except Exception as e:
-            raise ComfyAPIError(f"Error loading workflow file {filepath}: {e}")
+    def set_max_queued(self, max_queued):
+        """
+        Limits how many of this manager's prompts sit in the server queue at once (None for no
+        limit). Further prompts are held locally and sent as soon as one of them finishes.
+        """
+        self.max_queued = max_queued
+        if self._feeder is not None:
+            # Without a limit any prompts still held are sent right away
+            self._feeder.set_max_queued(max_queued or float("inf"))
 
-    def edit_workflow(self, path, value):
+    def set_tenant_weight(self, tenant, weight):
         """
-        Edits the stored workflow in place and updates self.workflow.
+        Gives tenant `weight` times the share of held prompts sent for a weight-1 tenant
+        within the same priority class (tenants default to weight 1).
         """
-        if self.workflow is None:
-            raise ValueError("No workflow loaded.")
-        wf_copy = copy.deepcopy(self.workflow)
+        with self._feeder_lock:
+            if self._feeder is not None:
+                self._feeder.set_tenant_weight(tenant, weight)
+            self.tenant_weights[tenant] = weight
+
+    def feeder_stats(self):
+        """
+        Returns {'held', 'queued', 'dispatched', 'completed', 'jobs_per_minute', 'wait'} for
+        prompts submitted with max_queued set, or None if none were. 'wait' maps each priority
+        class to {'held', 'count', 'mean', 'p95', 'max'}: prompts held and sent, and the seconds
+        they were held before being sent.
+        """
+        return self._feeder.stats() if self._feeder is not None else None
+
+    def _get_feeder(self):
+        with self._feeder_lock:
+            if self._feeder is None:
+                self._feeder = _PromptFeeder([self.client], self.max_queued, self.tenant_weights).start()
+            return self._feeder
+
+    def _stop_feeder(self):
+        with self._feeder_lock:
+            feeder, self._feeder = self._feeder, None
+        if feeder is not None:
+            feeder.stop()
+
+    def _submit_bytes(self, prompt_bytes, priority="normal", tenant=None):
+        """Queues an encoded prompt (or holds it for the feeder) and tracks it in the manager queue."""
+        _check_priority(priority)
+        prompt_id, reused = self._claim_result(prompt_bytes)
+        if reused:
+            return prompt_id
         try:
-            target = wf_copy
-            for key in path[:-1]:
-                if isinstance(target, list) and isinstance(key, str) and key.isdigit():
-                    key = int(key)
-                target = target[key]
-            final_key = path[-1]
-            if isinstance(target, list) and isinstance(final_key, str) and final_key.isdigit():
-                final_key = int(final_key)
-            target[final_key] = value
-            self.workflow = wf_copy
-        except (KeyError, IndexError, TypeError) as e:
-            raise ValueError(f"Invalid path {path} for workflow structure: {e}")
-
-    def submit_workflow(self):
+            if self.max_queued:
+                feeder = self._get_feeder()
+                prompt_id = prompt_id or str(uuid.uuid4())
+                self._jobs.add(prompt_id, status="held", prompt_bytes=prompt_bytes, priority=priority, tenant=tenant)
+                feeder.enqueue(prompt_id, prompt_bytes, on_dispatch=self._on_dispatch, priority=priority, tenant=tenant)
+                return prompt_id
+            prompt_id = self.client.queue_prompt_bytes(prompt_bytes, prompt_id=prompt_id, front=(priority == "interactive"))
+        except ComfyAPIError:
+            if prompt_id is not None and self.result_cache is not None:
+                self.result_cache.release(prompt_id)
+            raise
+        self._jobs.add(prompt_id, server=self.client.base_url, priority=priority, tenant=tenant)
+        if self.result_cache is not None:
+            self.result_cache.placed(prompt_id, self.client.base_url)
+        return prompt_id
+
+    def _client_for_server(self, server):
+        return self.client if server == self.client.base_url else None
+
+    def _resend(self, entries):
+        """Sends journaled prompts that never reached the server, under their original prompt_ids."""
+        prompts = self.journal.prompts([entry["prompt_id"] for entry in entries])
+        for entry in entries:
+            prompt_id = entry["prompt_id"]
+            self._reclaim_held(entry)
+            prompt_bytes = prompts.get(prompt_id)
+            if prompt_bytes is None:
+                self._jobs.mark_error(prompt_id, QueueError(f"The journal has no prompt for held prompt {prompt_id}."))
+            elif self.max_queued:
+                self._get_feeder().enqueue(prompt_id, prompt_bytes, on_dispatch=self._on_dispatch,
+                                           priority=entry["priority"], tenant=entry["tenant"])
+            else:
+                try:
+                    self.client.queue_prompt_bytes(prompt_bytes, prompt_id=prompt_id, front=(entry["priority"] == "interactive"))
+                except ComfyAPIError as e:
+                    self._jobs.mark_error(prompt_id, e)
+                else:
+                    self._jobs.mark_dispatched(prompt_id, self.client.base_url)
+
+    def resume(self):
+        """
+        Re-attaches to the prompts recorded in this manager's journal by an earlier process
+        (e.g. one that crashed mid-batch) and returns all their prompt_ids in submission order.
+
+        Prompts the server still has, queued, running or finished, are tracked again without
+        being re-submitted; wait on them as usual. Prompts that were still held locally are
+        sent now under their original prompt_ids. Prompts the server no longer knows (e.g.
+        after it restarted), or that were sent to a different server than this manager's, fail
+        with QueueError. Raises ConnectionError if the server cannot be reached, and
+        ComfyAPIError if the manager has no journal.
+        """
+        prompt_ids, sent, held = self._journaled()
+        entries = sent.pop(self.client.base_url, [])
+        for elsewhere in sent.values():
+            for entry in elsewhere:
+                self._restore_entry(entry, None)
+        known = _known_prompt_ids(self.client, [entry["prompt_id"] for entry in entries + held])
+        # Queued under the earlier process's client ID, so not reported on this one's WebSocket
+        self.client.note_foreign(known)
+        for entry in entries:
+            self._restore_entry(entry, entry["prompt_id"] in known)
+        for entry in held:
+            if entry["prompt_id"] in known:
+                self._reclaim_held(entry, self.client.base_url)
+        self._resend([entry for entry in held if entry["prompt_id"] not in known])
+        return prompt_ids
+
+    def configure_session(self, pool_size=None, retries=None, backoff_factor=None):
+        """
+        Sizes the pooled keep-alive HTTP session and sets its retry policy.
+        Retries apply to connection errors, idempotent requests and 502/503/504 responses;
+        prompt submissions are never re-sent once they reached the server.
+        """
+        self.client.configure_session(pool_size=pool_size, retries=retries, backoff_factor=backoff_factor)
+
+    def close(self):
+        """
+        Stops this manager's feeder and completion tracker and closes its HTTP session, and its
+        result cache once no other manager uses it, and the journal. Prompts still held stay held in the journal, if any, so resume() can send them later.
+        """
+        journal, self._jobs.journal = self._jobs.journal, None
+        self._stop_feeder()
+        self.client.close()
+        cache, self.result_cache = self.result_cache, None
+        if cache is not None:
+            cache._detach()
+        if journal is not None:
+            journal.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def submit_workflow(self, priority="normal", tenant=None):
         """
         Submits the stored workflow and tracks it in the manager queue.
+        priority is "interactive", "normal" or "batch": "interactive" prompts go to the front of
+        the server queue. With max_queued set, held prompts are sent in priority order and
+        fairly between tenants (any hashable key, e.g. a user name) within a priority.
         """
         if self.workflow is None:
             raise ValueError("No workflow loaded.")
-        prompt_id = _queue_prompt(self.workflow)
-        self.queue.append({"prompt_id": prompt_id, "status": "queued"})
+        with _span("serialize"):
+            prompt_bytes = _encode(self.workflow)
+        return self._submit_bytes(prompt_bytes, priority, tenant)
+
+    def submit_template(self, template, priority="normal", tenant=None, **values):
+        """
+        Renders a WorkflowTemplate with the given slot values, submits it and tracks it in the manager queue.
+        Only the slot values are serialized; the rest of the request body is pre-encoded.
+        """
+        prompt_id = self._submit_bytes(template.render_prompt(**values), priority, tenant)
+        if self.journal is not None:
+            self.journal.params(prompt_id, values)
         return prompt_id
 
-    def batch_submit(self, num_seeds=None, seeds=None, seed_node_path=["3", "inputs", "seed"], random_seeds=False):
+    def batch_submit(self, num_seeds=None, seeds=None, seed_node_path=["3", "inputs", "seed"], random_seeds=False, concurrency=4,
+                     priority="batch", tenant=None):
         """
         Submits multiple instances of the stored workflow, varying the seed for each instance.
         If random_seeds is True, generates random seeds for each workflow.
-        Tracks all prompt_ids in the manager queue.
+        Up to `concurrency` submissions run in parallel. Failed seeds are reported and skipped
+        (QueueError is raised only if all of them fail). Returns prompt_ids in seed order and
+        tracks them in the manager queue. With max_queued set, the prompts are held locally and
+        the returned prompt_ids can be waited on right away; they default to the "batch"
+        priority, so single submissions overtake them.
         """
         if self.workflow is None:
             raise ValueError("No workflow loaded.")
         if random_seeds:
             import random
             seeds = [random.randint(0, 2**32 - 1) for _ in range(num_seeds)]
-        prompt_ids = _batch_submit_internal(self.workflow, seed_node_path, seeds=seeds, num_seeds=(None if seeds else num_seeds))
-        for pid in prompt_ids:
-            self.queue.append({"prompt_id": pid, "status": "queued"})
-        return prompt_ids
+        submit_bytes = functools.partial(self._submit_bytes, priority=priority, tenant=tenant)
+        return _collect_batch(self._note_params(_submit_seeds(submit_bytes, self.workflow, seed_node_path, seeds=seeds,
+                                                              num_seeds=(None if seeds else num_seeds), concurrency=concurrency)))
 
-    def wait_for_finish(self, prompt_id, poll_interval=3, max_wait_time=600, status_callback=None):
+    def iter_batch_submit(self, num_seeds=None, seeds=None, seed_node_path=["3", "inputs", "seed"], random_seeds=False, concurrency=4,
+                          priority="batch", tenant=None):
+        """
+        Like batch_submit, but yields each outcome as soon as its prompt_id is assigned:
+        {'index', 'seed', 'uid', 'status': 'success'} or {'index', 'seed', 'error', 'status': 'error'}.
+        Successful prompts are tracked in the manager queue as they stream in.
+        """
+        if self.workflow is None:
+            raise ValueError("No workflow loaded.")
+        if random_seeds:
+            import random
+            seeds = [random.randint(0, 2**32 - 1) for _ in range(num_seeds)]
+        submit_bytes = functools.partial(self._submit_bytes, priority=priority, tenant=tenant)
+        yield from self._note_params(_submit_seeds(submit_bytes, self.workflow, seed_node_path, seeds=seeds,
+                                                   num_seeds=(None if seeds else num_seeds), concurrency=concurrency))
+
+    def sweep(self, params, mode="product", concurrency=4, wait=True, status_callback=None, max_wait_time=600,
+              priority="batch", tenant=None):
+        """
+        Submits a parameter sweep (grid) over several node inputs and collects the results.
+
+        :param params: Dict mapping a name to (node_path, values), e.g.
+                       {"seed": (["3", "inputs", "seed"], [1, 2]), "cfg": (["3", "inputs", "cfg"], [5.0, 7.5])}
+        :param mode: "product" for every combination, "zip" to pair values position by position
+        :param concurrency: Maximum number of submissions in flight
+        :param wait: If True, waits for every prompt and fills in its output
+        :param priority: Priority class of the prompts (see submit_workflow)
+        :param tenant: Tenant key the prompts are scheduled under (see submit_workflow)
+        :return: Dict mapping each parameter tuple (values in params order) to a row dict with
+                 'prompt_id', 'status' ('queued', 'finished', 'error' or 'cancelled'), 'filename', 'url' and 'error'.
+                 Values must be hashable and combinations unique; ValueError is raised before anything is submitted otherwise.
+        """
+        if self.workflow is None:
+            raise ValueError("No workflow loaded.")
+        slots, variants = _sweep_variants(params, mode)
+        # Variants are generated lazily and rendered from one compiled template
+        template = WorkflowTemplate(self.workflow, **slots)
+        rows = []
+        submit_bytes = functools.partial(self._submit_bytes, priority=priority, tenant=tenant)
+        for outcome in self._note_params(_submit_variants(submit_bytes, template, variants, concurrency)):
+            key = tuple(outcome['values'][name] for name in slots)
+            row = {"prompt_id": outcome.get('uid'), "status": "queued", "filename": None, "url": None,
+                   "error": outcome.get('error')}
+            if outcome['status'] != 'success':
+                row["status"] = "error"
+            rows.append((outcome['index'], key, row))
+        # Present the table in sweep order rather than completion order
+        table = {key: row for _, key, row in sorted(rows, key=lambda item: item[0])}
+        if wait:
+            prompt_ids = [row["prompt_id"] for row in table.values() if row["prompt_id"]]
+            outputs = self._wait_for_outputs(prompt_ids, status_callback, max_wait_time, on_output=self._record_outcome)
+            for row in table.values():
+                outcome = outputs.get(row["prompt_id"])
+                if isinstance(outcome, CancelledError):
+                    row.update(status="cancelled", error=outcome)
+                elif isinstance(outcome, Exception):
+                    row.update(status="error", error=outcome)
+                elif outcome is not None:
+                    row["filename"], row["url"] = outcome
+                    row["status"] = "finished"
+        return table
+
+    def wait_for_finish(self, prompt_id, poll_interval=None, max_wait_time=600, status_callback=None, all_outputs=False):
         """
         Waits for a single submitted job (prompt_id) to finish execution.
-        Updates the status in the manager queue.
+        Returns (filename, output_url), or with all_outputs=True the prompt's output index:
+        node_id -> list of {"kind", "filename", "subfolder", "type", "url"} records covering every
+        saved image, preview, gif or video, built from the history the wait already fetched.
+        Updates the status in the manager queue. Completion is reported over the WebSocket; while
+        it is down the prompt is polled by its queue position and the execution time of earlier
+        prompts of the same workflow, or every poll_interval seconds if given.
         """
-        result = _wait_for_finish_single(prompt_id, poll_interval, max_wait_time, status_callback)
+        known = self._known_outcome(prompt_id, all_outputs)
+        if isinstance(known, Exception):
+            raise known
+        if known is not None:
+            return known
+        try:
+            result = self.client.wait_for_finish(prompt_id, poll_interval, max_wait_time, status_callback, all_outputs)
+        except (ExecutionError, HistoryError) as e:
+            self._record_outcome(prompt_id, e)
+            raise
         # Update status to finished
-        for job in self.queue:
-            if job["prompt_id"] == prompt_id:
-                job["status"] = "finished"
+        self._record_outcome(prompt_id, result)
         return result
 
+    def cancel(self, prompt_id):
+        """Cancels a submitted prompt (see cancel_batch). Returns True if it was cancelled."""
+        return bool(self.cancel_batch([prompt_id]))
+
+    def cancel_batch(self, uids):
+        """
+        Cancels submitted prompts. Prompts still held (max_queued) are dropped locally, queued
+        ones are removed from the server queue and the one running is interrupted. Their
+        waiters (wait_for_finish, wait_and_get_all_outputs, ...) fail at once with
+        CancelledError, and their jobs get the status "cancelled". Prompts that already
+        finished are left alone. Returns the cancelled UIDs, in the order given.
+        """
+        uids = list(dict.fromkeys(uids))
+        feeder = self._feeder
+        cancelled = feeder.cancel(uids) if feeder is not None else set()
+        cancelled |= self.client.cancel(uid for uid in uids if uid not in cancelled)
+        self._mark_cancelled(cancelled)
+        return [uid for uid in uids if uid in cancelled]
+
     def check_queue(self, prompt_id):
         """
         Checks the status of a queued prompt_id (non-blocking, single check).
         Returns True if finished, False otherwise. Updates the queue status.
         """
-        # Find job in queue
-        for job in self.queue:
-            if job["prompt_id"] == prompt_id:
-                # Check if already finished
-                if job["status"] == "finished":
-                    return True
-                # Check current status (non-blocking)
-                history = None
-                try:
-                    history = _get_history(prompt_id)
-                except Exception:
-                    pass
-                filename = None
-                if history:
-                    filename = _find_output_in_history(history)
-                if filename:
-                    job["status"] = "finished"
-                    return True
-                else:
-                    job["status"] = "queued"
-                    return False
-        return False  # Not found
+        job = self._jobs.get(prompt_id)
+        if job is None:
+            return False  # Not found
+        # Check if already finished
+        if job.status == "finished":
+            return True
+        if job.status in ("held", "cancelled", "error"):
+            return False # Not sent to the server yet, or never will finish
+        # Check current status (non-blocking)
+        try:
+            history = self.client.get_history(prompt_id)
+        except Exception:
+            return False
+        return self._check_history(prompt_id, history, self.client._get_base_url())
 
-    def find_output(self, prompt_id, with_filename=False):
+    def find_output(self, prompt_id, with_filename=False, all_outputs=False):
         """
         Returns the output URL and, if requested, the filename for a completed job.
         If with_filename=True, returns (url, filename). Otherwise, returns url only.
+        If all_outputs=True, returns the prompt's output index instead ({} if it has not finished).
         """
-        url, filename = _find_output(prompt_id)
+        cached = self._cached_outcome(prompt_id, all_outputs)
+        if all_outputs:
+            return cached if cached is not None else self.client.find_all_outputs(prompt_id)
+        if isinstance(cached, tuple):
+            filename, url = cached
+        elif cached is not None:
+            url, filename = None, None
+        else:
+            url, filename = self.client.find_output(prompt_id)
         if with_filename:
             return url, filename
         return url
 
+    def _wait_for_outputs(self, uids, status_callback=None, max_wait_time=600, on_output=None):
+        """client.wait_for_outputs, answering jobs served from the result cache (or never queued) without the server."""
+        outcomes = {}
+        live = []
+        for uid in dict.fromkeys(uids):
+            known = self._known_outcome(uid)
+            if known is None:
+                live.append(uid)
+                continue
+            outcomes[uid] = known
+            if on_output: on_output(uid, known)
+        if live:
+            outcomes.update(self.client.wait_for_outputs(live, status_callback, max_wait_time, on_output))
+        return outcomes
+
     def wait_and_get_all_outputs(self, uids, status_callback=None):
         """
         Waits for multiple submitted jobs (UIDs) to finish concurrently and retrieves their output URLs.
         """
-        return _wait_and_get_all_outputs_internal(uids, status_callback)
+        return _split_outcomes(self._wait_for_outputs(uids, status_callback, on_output=self._record_outcome))
+
+    def download_output(self, output_url, save_path=".", filename=None, progress_callback=None):
+        """
+        Streams an output to save_path in chunks, resuming interrupted transfers with Range requests.
+        progress_callback, if given, is called as progress_callback(downloaded_bytes, total_bytes, bytes_per_second).
+        """
+        return self.client.download_output(output_url, save_path=save_path, filename=filename, progress_callback=progress_callback)
+
+    def download_outputs(self, results, save_path=".", concurrency=8):
+        """
+        Downloads a list of (filename, url) results in parallel, e.g. from wait_and_get_all_outputs.
+        Files already on disk with the server's size are skipped. Keep concurrency at or below the
+        session pool_size so every download reuses a kept-alive connection.
+        Returns (saved_paths, errors) where errors maps each failed url to its exception.
+        """
+        return self.client.download_outputs(results, save_path=save_path, concurrency=concurrency)
 
-    def download_output(self, output_url, save_path=".", filename=None):
-        return _download_output(output_url, save_path=save_path, filename=filename)
-    
-    def set_base64_image(self, node_id, image_path, temp_name=None, max_size_bytes=1000000, max_dimension=1024, jpeg_quality=85, min_quality=20):
+    def wait_and_download_outputs(self, uids, save_path=".", concurrency=8, status_callback=None, max_wait_time=600):
+        """
+        Waits for multiple jobs and downloads each output as soon as its job finishes,
+        overlapping downloads with the jobs still running.
+        Returns (saved_paths, errors) where errors maps each failed UID to its exception.
         """
-        Encodes a local image and injects it into a Base64ImageLoader node.
+        return _wait_and_download(self._wait_for_outputs, self.client.download_if_needed, uids, save_path, concurrency,
+                                  status_callback, max_wait_time, on_output=self._record_outcome)
 
-        This method will automatically resize and recompress large images so the base64 payload
-        remains reasonably small and quick to transmit. It requires Pillow (`pip install pillow`) to
-        perform image processing; if Pillow is not available, a helpful error is raised when resizing is needed.
+    def upload_image(self, image_path, subfolder=""):
+        """
+        Uploads a local image to ComfyUI's input folder via /upload/image (streamed, no base64).
+        The same image content is only ever uploaded once per server. Returns the server-side image name.
+        """
+        return self.client.upload_image(image_path, subfolder=subfolder)
 
-        :param node_id: The ID of the node (string or int)
+    def set_image(self, node_id, image_path, input_name="image", subfolder=""):
+        """
+        Uploads a local image and points a LoadImage node at it.
+
+        :param node_id: The ID of the LoadImage node (string or int)
         :param image_path: Path to the local image file
-        :param temp_name: Optional custom name for the file on the server
-        :param max_size_bytes: Maximum allowed size in bytes for the encoded image (default 1,000,000)
-        :param max_dimension: Maximum width/height for the image in pixels (default 1024)
-        :param jpeg_quality: Starting JPEG quality for recompression (default 85)
-        :param min_quality: Minimum JPEG quality to attempt before further resizing (default 20)
-        """
-        if not os.path.isfile(image_path):
-            raise FileNotFoundError(f"Local image not found at: {image_path}")
-
-        original_size = os.path.getsize(image_path)
-        processed_bytes = None
-        final_temp_name = temp_name or os.path.basename(image_path)
-
-        # If the file is already small enough, use it directly
-        if original_size <= max_size_bytes:
-            with open(image_path, "rb") as image_file:
-                processed_bytes = image_file.read()
-        else:
-            # Try to import Pillow for processing
-            try:
-                from PIL import Image
-            except Exception:
-                raise ComfyAPIError("Pillow is required to resize large images. Install with `pip install pillow`")
-
-            from io import BytesIO
-
-            try:
-                img = Image.open(image_path)
-            except Exception as e:
-                raise ComfyAPIError(f"Failed to open image for processing: {e}")
-
-            # Handle alpha channels by converting to RGB with white background
-            if img.mode in ("RGBA", "LA"):
-                background = Image.new("RGB", img.size, (255, 255, 255))
-                background.paste(img, mask=img.split()[-1])
-                img = background
-            else:
-                img = img.convert("RGB")
-
-            width, height = img.size
-            # Initial resize if either dimension exceeds max_dimension
-            if max(width, height) > max_dimension:
-                scale = max_dimension / float(max(width, height))
-                new_size = (max(1, int(width * scale)), max(1, int(height * scale)))
-                img = img.resize(new_size, Image.LANCZOS)
-                width, height = img.size
-
-            # Try compressing at decreasing quality until under max_size_bytes
-            quality = jpeg_quality
-            buffer = BytesIO()
-            img.save(buffer, format="JPEG", quality=quality, optimize=True)
-            data = buffer.getvalue()
-
-            # Iteratively reduce quality first
-            while len(data) > max_size_bytes and quality >= min_quality:
-                quality -= 5
-                buffer = BytesIO()
-                img.save(buffer, format="JPEG", quality=max(min_quality, quality), optimize=True)
-                data = buffer.getvalue()
-
-            # If still too large, progressively downscale dimensions and retry
-            while len(data) > max_size_bytes and max(img.size) > 128:
-                new_size = (max(1, int(img.size[0] * 0.8)), max(1, int(img.size[1] * 0.8)))
-                img = img.resize(new_size, Image.LANCZOS)
-                buffer = BytesIO()
-                img.save(buffer, format="JPEG", quality=max(min_quality, quality), optimize=True)
-                data = buffer.getvalue()
-
-            processed_bytes = data
-            # Ensure temp name reflects JPEG output
-            final_temp_name = os.path.splitext(final_temp_name)[0] + ".jpg"
-
-        # Fallback if something went wrong
-        if processed_bytes is None:
-            raise ComfyAPIError("Failed to prepare image bytes for base64 encoding.")
-
-        # Encode to base64
-        encoded_string = base64.b64encode(processed_bytes).decode('utf-8')
-
-        # 3. Use edit_workflow to update the node's input fields
-        node_id_str = str(node_id)
-
-        # Set the base64 string
-        self.edit_workflow([node_id_str, "inputs", "image_base64"], encoded_string)
-
-        # Set the metadata fields
-        self.edit_workflow([node_id_str, "inputs", "image_name"], final_temp_name)
-        # Note: image_path is set to the original path for traceability
-        self.edit_workflow([node_id_str, "inputs", "image_path"], image_path)
\ No newline at end of file
+        :param input_name: The node input holding the image name (default "image")
+        :param subfolder: Optional subfolder of the server's input directory
+        :return: The server-side image name
+        """
+        image_name = self.upload_image(image_path, subfolder=subfolder)
+        self.edit_workflow([str(node_id), "inputs", input_name], image_name)
+        return image_name
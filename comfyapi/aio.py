@@ -0,0 +1,836 @@
+"""
+Asyncio client for ComfyUI.
+
+AsyncComfyAPIManager mirrors ComfyAPIManager with awaitable network methods, so
+thousands of in-flight prompts can be tracked on a single event loop. Completion
+is reported over the ComfyUI WebSocket, with bulk history polling as a fallback
+while the socket is down. Requires aiohttp (`pip install comfyapi[async]`).
+"""
+import asyncio
+import logging
+import os
+import json
+import random
+import time
+
+from .client import (
+    ComfyAPIError,
+    ConnectionError,
+    QueueError,
+    HistoryError,
+    ExecutionError,
+    TimeoutError,
+    CancelledError,
+    _extract_urls,
+    _generate_client_id,
+    _resolve_seed_list,
+    _sweep_variants,
+    _index_outputs,
+    _first_output_image,
+    _finished_output,
+    _collect_batch,
+    _report_error,
+    _HistoryCache,
+    _queue_split,
+    _unqueued,
+    _known_from,
+    _prompt_request,
+    _queued_prompt_id,
+    _ws_completion,
+    _completions,
+    _PendingPrompts,
+    _SubmitTimes,
+    _upload_name,
+    _upload_reference,
+    _HISTORY_SLACK,
+    _resolve_download_path,
+    _resume_action,
+    _response_validator,
+    _partial_state,
+    _start_partial,
+    _discard_partial,
+    _finish_partial,
+    _DOWNLOAD_CHUNK_SIZE,
+    _PARTIAL_SUFFIX,
+    _file_digest,
+    _ExecutionStats,
+)
+from .template import WorkflowTemplate, _encode
+from .workflow import _WorkflowEditor
+from .jobs import _JobRegistry, _JobQueries
+from .instrumentation import _count, _endpoint, _enabled, _span
+
+_logger = logging.getLogger(__name__)
+
+
+def _import_aiohttp():
+    try:
+        import aiohttp
+    except ImportError:
+        raise _report_error(ComfyAPIError("aiohttp is required for AsyncComfyAPIManager. Install with `pip install comfyapi[async]`"))
+    return aiohttp
+
+
+def _trace_config(aiohttp):
+    """aiohttp TraceConfig counting every response by method, endpoint and status."""
+    async def on_request_end(session, context, params):
+        if _enabled():
+            _count("http_requests", method=params.method, endpoint=_endpoint(str(params.url)),
+                   status=str(params.response.status))
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_request_end.append(on_request_end)
+    return trace_config
+
+
+class AsyncComfyAPIManager(_WorkflowEditor, _JobQueries):
+    """
+    Async twin of ComfyAPIManager.
+
+    Workflow editing (`load_workflow`, `edit_workflow`, `set_base64_image`) is shared
+    with the blocking manager; every method that talks to the server is a coroutine.
+    Use it as an async context manager, or call `close()` when done.
+    """
+
+    _DOWNLOAD_RETRIES = 3 # Consecutive download attempts without progress before giving up
+
+    def __init__(self, pool_size=100, max_finished_jobs=10000, journal=None):
+        self.workflow = None
+        self.base_url = None
+        # Submitted jobs indexed by prompt_id; the oldest finished ones are evicted.
+        # With an opt-in JobJournal they are also recorded on disk for resume()
+        self._jobs = _JobRegistry(max_finished=max_finished_jobs, journal=journal)
+        self.pool_size = pool_size
+        self._http_url = None
+        self._ws_url = None
+        self._client_id = None
+        self._session = None
+        self._tasks = []
+        # Completion tracking state shared with the blocking tracker; futures are made on the running loop
+        self._tracking = _PendingPrompts(lambda: asyncio.get_running_loop().create_future())
+        self._execution_stats = _ExecutionStats()
+        self._submit_times = _SubmitTimes()
+        self._history_cache = _HistoryCache()
+        self._connected = False
+        self._generation = 0
+        self._wakeup = None
+        self._upload_cache = {} # (base_url, sha256 hex digest, subfolder) -> image reference
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    def set_base_url(self, url):
+        try:
+            self._http_url, self._ws_url = _extract_urls(url)
+        except ValueError as e:
+            raise _report_error(ConnectionError(f"Invalid server URL: {e}"))
+        self.base_url = url
+        self._client_id = _generate_client_id()
+        self._history_cache.clear()
+        # The listener is bound to the old client ID; restart it lazily
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+        self._connected = False
+        _logger.info("ComfyAPI: Base URL set to %s, WebSocket URL to %s, Client ID: %s", self._http_url, self._ws_url, self._client_id)
+
+    async def close(self):
+        """Stops the background listener and closes the HTTP session and the journal, if any."""
+        journal, self._jobs.journal = self._jobs.journal, None
+        for task in self._tasks:
+            task.cancel()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+        if journal is not None:
+            journal.close()
+
+    # --- HTTP helpers ---
+
+    def _get_base_url(self):
+        if not self._http_url:
+            raise _report_error(ComfyAPIError("Base URL not set. Call set_base_url() first."))
+        return self._http_url
+
+    def _get_session(self):
+        if self._session is None or self._session.closed:
+            aiohttp = _import_aiohttp()
+            connector = aiohttp.TCPConnector(limit=self.pool_size)
+            self._session = aiohttp.ClientSession(connector=connector, trace_configs=[_trace_config(aiohttp)])
+        return self._session
+
+    async def _get_json(self, url, what):
+        """GETs url and returns the decoded JSON, or None on any error (polling will retry)."""
+        aiohttp = _import_aiohttp()
+        try:
+            async with self._get_session().get(url, timeout=aiohttp.ClientTimeout(total=60)) as response:
+                response.raise_for_status()
+                return await response.json(content_type=None)
+        except asyncio.TimeoutError:
+            _logger.warning("Timeout fetching %s from %s", what, url)
+        except aiohttp.ClientError as e:
+            _logger.warning("Error fetching %s from %s: %s", what, url, e)
+        except json.JSONDecodeError:
+            _logger.warning("Failed to decode JSON %s response from %s", what, url)
+        return None
+
+    async def _queue_prompt(self, prompt):
+        with _span("serialize"):
+            prompt_bytes = _encode(prompt)
+        return await self._queue_prompt_bytes(prompt_bytes)
+
+    async def _queue_prompt_bytes(self, prompt_bytes, prompt_id=None, front=False):
+        aiohttp = _import_aiohttp()
+        url = f"{self._get_base_url()}/prompt"
+        data = _prompt_request(prompt_bytes, self._client_id, prompt_id, front)
+        generation = self._watch_generation()
+        try:
+            with _span("submit"):
+                async with self._get_session().post(url, data=data, headers={'Content-Type': 'application/json'},
+                                                    timeout=aiohttp.ClientTimeout(total=60)) as response:
+                    response.raise_for_status()
+                    result = await response.json(content_type=None)
+        except asyncio.TimeoutError:
+            raise _report_error(TimeoutError(f"Timeout queueing prompt at {url}"))
+        except aiohttp.ClientError as e:
+            raise _report_error(QueueError(f"HTTP error queueing prompt at {url}: {e}"))
+        except json.JSONDecodeError:
+            raise _report_error(QueueError(f"Failed to decode JSON response from {url}"))
+        prompt_id = _queued_prompt_id(result)
+        if self._tracking.submitted(prompt_id, generation, self._watch_generation()):
+            self._wakeup.set()
+        self._submit_times.add(prompt_id)
+        return prompt_id
+
+    async def _get_history(self, prompt_id):
+        cached = self._history_cache.get(prompt_id)
+        if cached is not None:
+            return cached
+        history = await self._get_json(f"{self._get_base_url()}/history/{prompt_id}", "history")
+        prompt_data = history.get(str(prompt_id)) if history else None
+        self._history_cache.put(prompt_id, prompt_data)
+        if prompt_data:
+            self._submit_times.finished(prompt_id, prompt_data)
+        return prompt_data
+
+    # --- Completion tracking ---
+
+    def _ensure_started(self):
+        """Starts the WebSocket listener and poller on the running loop."""
+        self._get_base_url()
+        if self._tasks and not any(task.done() for task in self._tasks):
+            return
+        for task in self._tasks:
+            task.cancel()
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.ensure_future(self._listen()), asyncio.ensure_future(self._poll())]
+
+    def _note_foreign(self, prompt_ids):
+        """Has the poller check prompt_ids on a schedule even while the socket is up (see ComfyClient.note_foreign)."""
+        self._tracking.foreign(prompt_ids)
+
+    def _track(self, prompt_id, poll_interval=None):
+        self._ensure_started()
+        future = self._tracking.track(prompt_id, poll_interval, self._watch_generation())
+        self._wakeup.set()
+        return future
+
+    def _untrack(self, prompt_id):
+        self._tracking.untrack(prompt_id)
+
+    def _on_finished(self, prompt_id, error):
+        if self._tracking.finished(prompt_id, error):
+            self._wakeup.set()
+
+    def _watch_generation(self):
+        return self._generation if self._connected else None
+
+    def _resolve(self, prompt_id, history=None, error=None):
+        future = self._tracking.resolving(prompt_id)
+        if history is not None:
+            self._history_cache.put(prompt_id, history)
+            self._submit_times.finished(prompt_id, history)
+        if future is None or future.done():
+            return
+        if error is not None:
+            future.set_exception(_report_error(error))
+        else:
+            future.set_result(history)
+
+    def _handle_message(self, message):
+        completion = _ws_completion(message)
+        if completion is not None:
+            self._on_finished(*completion)
+
+    async def _listen(self):
+        aiohttp = _import_aiohttp()
+        ws_url = f"{self._ws_url}?clientId={self._client_id}"
+        backoff = 1
+        while True:
+            try:
+                async with self._get_session().ws_connect(ws_url, heartbeat=30) as ws:
+                    _logger.debug("WebSocket connected to %s", ws_url)
+                    backoff = 1
+                    async for msg in ws:
+                        if not self._connected and msg.type in (aiohttp.WSMsgType.TEXT, aiohttp.WSMsgType.BINARY):
+                            # Counts from the first message: ComfyUI sends its status once the
+                            # socket is registered, so nothing after that is missed
+                            self._generation += 1
+                            self._connected = True
+                            self._wakeup.set()
+                        if msg.type == aiohttp.WSMsgType.TEXT:
+                            try:
+                                self._handle_message(json.loads(msg.data))
+                            except json.JSONDecodeError:
+                                continue
+                        elif msg.type in (aiohttp.WSMsgType.CLOSED, aiohttp.WSMsgType.ERROR):
+                            break
+                _logger.warning("WebSocket connection closed, reconnecting")
+            except (aiohttp.ClientError, asyncio.TimeoutError, OSError) as e:
+                _logger.warning("WebSocket unavailable, falling back to history polling: %s", e)
+            finally:
+                self._connected = False
+            self._wakeup.set()
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, 30)
+
+    async def _check(self, prompt_ids):
+        """
+        Checks prompt_ids against the server with as few requests as possible.
+        Returns the /queue response if one was fetched, else None.
+        """
+        queue_data = None
+        if len(prompt_ids) == 1:
+            prompt_history = await self._get_history(prompt_ids[0])
+            found = {prompt_ids[0]: prompt_history} if prompt_history else {}
+        else:
+            found = await self._get_json(
+                f"{self._get_base_url()}/history?max_items={len(prompt_ids) + _HISTORY_SLACK}", "history")
+            if found is None:
+                return None
+            missing = [pid for pid in prompt_ids if pid not in found]
+            if missing:
+                # Anything neither in the recent history window nor in the queue finished
+                # longer ago; look those up individually.
+                queue_data = await self._get_json(f"{self._get_base_url()}/queue", "queue")
+                lookups = _unqueued(missing, queue_data)
+                for pid, prompt_history in zip(lookups, await asyncio.gather(*(self._get_history(pid) for pid in lookups))):
+                    if prompt_history:
+                        found[pid] = prompt_history
+        for pid, prompt_history, error in _completions(prompt_ids, found, self._execution_stats):
+            self._resolve(pid, prompt_history, error)
+        return queue_data
+
+    async def _schedule(self, prompt_ids, generation, queue_data=None):
+        """Sets the next check of each of prompt_ids that is still pending and polled (see _poll_delay)."""
+        if queue_data is None and self._tracking.adaptive(prompt_ids, generation):
+            queue_data = await self._get_json(f"{self._get_base_url()}/queue", "queue")
+        etas = self._execution_stats.etas(queue_data) if queue_data is not None else {}
+        self._tracking.schedule(prompt_ids, generation, etas)
+
+    async def _poll(self):
+        aiohttp = _import_aiohttp()
+        tracking = self._tracking
+        while True:
+            generation = self._watch_generation()
+            if not tracking.futures:
+                await self._wakeup.wait()
+            elif not tracking.ready(generation):
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=tracking.wait_time(generation))
+                except asyncio.TimeoutError:
+                    pass
+            self._wakeup.clear()
+            if not tracking.futures:
+                continue
+            generation = self._watch_generation()
+            errors, confirm = tracking.take(generation)
+            for pid, error in errors.items():
+                self._resolve(pid, error=error)
+            if confirm:
+                queue_data = None
+                try:
+                    queue_data = await self._check(confirm)
+                except (ComfyAPIError, aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    _logger.warning("History check failed, will retry: %s", e)
+                await self._schedule(confirm, generation, queue_data)
+
+    # --- Public API ---
+
+    async def submit_workflow(self):
+        """
+        Submits the stored workflow and tracks it in the manager queue.
+        """
+        if self.workflow is None:
+            raise ValueError("No workflow loaded.")
+        prompt_id = await self._queue_prompt(self.workflow)
+        _logger.debug("Prompt queued successfully. Prompt ID: %s", prompt_id)
+        self._jobs.add(prompt_id, server=self._http_url)
+        return prompt_id
+
+    async def submit_template(self, template, **values):
+        """
+        Renders a WorkflowTemplate with the given slot values, submits it and tracks it in the manager queue.
+        """
+        prompt_id = await self._queue_prompt_bytes(template.render_prompt(**values))
+        self._jobs.add(prompt_id, server=self._http_url)
+        if self.journal is not None:
+            self.journal.params(prompt_id, values)
+        return prompt_id
+
+    async def batch_submit(self, num_seeds=None, seeds=None, seed_node_path=["3", "inputs", "seed"], random_seeds=False, concurrency=16):
+        """
+        Submits multiple instances of the stored workflow concurrently, varying the seed for each instance.
+        At most `concurrency` submissions are in flight at once. Failed seeds are reported and skipped
+        (QueueError is raised only if all of them fail). Returns prompt_ids in seed order.
+        """
+        return _collect_batch([outcome async for outcome in self.iter_batch_submit(num_seeds, seeds, seed_node_path,
+                                                                                   random_seeds, concurrency)])
+
+    async def iter_batch_submit(self, num_seeds=None, seeds=None, seed_node_path=["3", "inputs", "seed"], random_seeds=False, concurrency=16):
+        """
+        Async generator version of batch_submit that yields each outcome as soon as its prompt_id
+        is assigned: {'index', 'seed', 'uid', 'status': 'success'} or {'index', 'seed', 'error', 'status': 'error'}.
+        """
+        if self.workflow is None:
+            raise ValueError("No workflow loaded.")
+        if random_seeds:
+            seeds = [random.randint(0, 2**32 - 1) for _ in range(num_seeds)]
+        seed_list = _resolve_seed_list(seed_node_path, seeds=seeds, num_seeds=(None if seeds else num_seeds))
+        # Compiling validates the path up front, so a bad path fails before anything is queued
+        template = WorkflowTemplate(self.workflow, seed=seed_node_path)
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def submit(index, seed):
+            async with semaphore:
+                try:
+                    uid = await self._queue_prompt_bytes(template.render_prompt(seed=seed))
+                except ComfyAPIError as e:
+                    _logger.warning("Failed to queue prompt for seed %s: %s", seed, e)
+                    return {'index': index, 'seed': seed, 'error': e, 'status': 'error'}
+            self._jobs.add(uid, server=self._http_url)
+            if self.journal is not None:
+                self.journal.params(uid, {'seed': seed})
+            return {'index': index, 'seed': seed, 'uid': uid, 'status': 'success'}
+
+        tasks = [asyncio.ensure_future(submit(index, seed)) for index, seed in enumerate(seed_list)]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def sweep(self, params, mode="product", concurrency=16, wait=True, status_callback=None, max_wait_time=600):
+        """
+        Async version of ComfyAPIManager.sweep: submits a parameter grid with bounded concurrency and
+        returns a dict mapping each parameter tuple to a row with 'prompt_id', 'status', 'filename', 'url' and 'error'.
+        """
+        if self.workflow is None:
+            raise ValueError("No workflow loaded.")
+        slots, variants = _sweep_variants(params, mode)
+        template = WorkflowTemplate(self.workflow, **slots)
+        if not isinstance(concurrency, int) or concurrency <= 0:
+            raise ValueError("concurrency must be a positive integer.")
+        # Workers pull variants from the lazy generator, so only `concurrency` prompts are rendered at once
+        variant_iter = enumerate(variants)
+        rows = {} # Variant index -> (parameter tuple, row)
+        waits = []
+
+        async def collect(row):
+            try:
+                row["filename"], row["url"] = await self.wait_for_finish(row["prompt_id"], max_wait_time=max_wait_time,
+                                                                         status_callback=status_callback)
+                row["status"] = "finished"
+            except ComfyAPIError as e:
+                row.update(status="cancelled" if isinstance(e, CancelledError) else "error", error=e)
+
+        async def worker():
+            for index, values in variant_iter:
+                row = {"prompt_id": None, "status": "queued", "filename": None, "url": None, "error": None}
+                rows[index] = (tuple(values[name] for name in slots), row)
+                try:
+                    row["prompt_id"] = await self.submit_template(template, **values)
+                except ComfyAPIError as e:
+                    row.update(status="error", error=e)
+                    continue
+                if wait:
+                    waits.append(asyncio.ensure_future(collect(row)))
+
+        try:
+            await asyncio.gather(*(worker() for _ in range(concurrency)))
+            await asyncio.gather(*waits)
+        finally:
+            for task in waits:
+                task.cancel()
+        # Present the table in sweep order rather than completion order
+        return {key: row for _, (key, row) in sorted(rows.items())}
+
+    async def _known_prompt_ids(self, prompt_ids):
+        """Async _known_prompt_ids: the subset of prompt_ids the server still has queued, running or in its history."""
+        prompt_ids = set(prompt_ids)
+        if not prompt_ids:
+            return set()
+        base_url = self._get_base_url()
+        max_items = len(prompt_ids) + _HISTORY_SLACK
+        queue_data, history = await asyncio.gather(self._get_json(f"{base_url}/queue", "queue"),
+                                                   self._get_json(f"{base_url}/history?max_items={max_items}", "history"))
+        if queue_data is None or history is None:
+            raise _report_error(ConnectionError(f"Could not read the queue and history of {base_url}."))
+        known, unsure = _known_from(prompt_ids, queue_data, history, max_items)
+        unsure = list(unsure)
+        known.update(pid for pid, found in zip(unsure, await asyncio.gather(*(self._get_history(pid) for pid in unsure))) if found)
+        return known
+
+    async def resume(self):
+        """
+        Re-attaches to the prompts recorded in this manager's journal by an earlier process
+        and returns all their prompt_ids in submission order (see ComfyAPIManager.resume).
+        """
+        prompt_ids, sent, held = self._journaled()
+        entries = sent.pop(self._http_url, [])
+        for elsewhere in sent.values():
+            for entry in elsewhere:
+                self._restore_entry(entry, None)
+        known = await self._known_prompt_ids([entry["prompt_id"] for entry in entries + held])
+        self._note_foreign(known) # Queued under the earlier process's client ID
+        for entry in entries:
+            self._restore_entry(entry, entry["prompt_id"] in known)
+        resend = []
+        for entry in held:
+            self._reclaim_held(entry, self._http_url if entry["prompt_id"] in known else None)
+            if entry["prompt_id"] not in known:
+                resend.append(entry["prompt_id"])
+        prompts = self.journal.prompts(resend)
+        for prompt_id in resend:
+            # Held prompts come from a ComfyAPIManager with max_queued; they are sent right away here
+            try:
+                if prompt_id not in prompts:
+                    raise _report_error(QueueError(f"The journal has no prompt for held prompt {prompt_id}."))
+                await self._queue_prompt_bytes(prompts[prompt_id], prompt_id=prompt_id)
+            except ComfyAPIError as e:
+                self._jobs.mark_error(prompt_id, e)
+            else:
+                self._jobs.mark_dispatched(prompt_id, self._http_url)
+        return prompt_ids
+
+    async def wait_for_finish(self, prompt_id, poll_interval=None, max_wait_time=600, status_callback=None, all_outputs=False):
+        """
+        Waits for a single submitted job (prompt_id) to finish execution.
+        Returns a (filename, output_url) tuple, or the prompt's output index if all_outputs is True
+        (node_id -> list of {"kind", "filename", "subfolder", "type", "url"} records).
+        Updates the status in the manager queue.
+        """
+        known = self._known_outcome(prompt_id, all_outputs)
+        if isinstance(known, Exception):
+            raise known # Cancelled, or never reached the server
+        if known is not None:
+            return known
+        deadline = time.time() + max_wait_time
+        future = self._track(prompt_id, poll_interval)
+        try:
+            while not future.done():
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    if status_callback: status_callback(prompt_id, "timeout")
+                    raise _report_error(TimeoutError(f"Polling timed out after {max_wait_time} seconds for prompt_id: {prompt_id}"))
+                if status_callback: status_callback(prompt_id, "polling")
+                await asyncio.wait({future}, timeout=min(5, remaining)) # Update status every 5s
+            try:
+                prompt_history = future.result()
+            except CancelledError:
+                if status_callback: status_callback(prompt_id, "cancelled")
+                raise
+            except ExecutionError as e:
+                if status_callback: status_callback(prompt_id, "error")
+                self._jobs.mark_error(prompt_id, e)
+                raise
+        finally:
+            self._untrack(prompt_id)
+        try:
+            result = _finished_output(prompt_id, prompt_history, self._get_base_url(), status_callback, all_outputs)
+        except HistoryError as e:
+            self._jobs.mark_error(prompt_id, e)
+            raise
+        self._jobs.mark_finished(prompt_id, result)
+        return result
+
+    async def wait_and_get_all_outputs(self, uids, status_callback=None, max_wait_time=600):
+        """
+        Waits for multiple submitted jobs (UIDs) to finish and retrieves their output URLs.
+        Returns (results, errors): a list of (filename, url) tuples and a list of exceptions.
+        """
+        async def wait_one(uid):
+            if status_callback: status_callback(uid, "started")
+            return await self.wait_for_finish(uid, max_wait_time=max_wait_time, status_callback=status_callback)
+        outcomes = await asyncio.gather(*(wait_one(uid) for uid in dict.fromkeys(uids)), return_exceptions=True)
+        results_list = [outcome for outcome in outcomes if not isinstance(outcome, Exception)]
+        errors_list = [outcome for outcome in outcomes if isinstance(outcome, Exception)]
+        if errors_list:
+            _logger.warning("Errors occurred during batch processing: %s", [str(err) for err in errors_list])
+        return results_list, errors_list
+
+    async def _post_command(self, path, payload):
+        """POSTs a JSON command (e.g. a /queue delete or an /interrupt) to the server."""
+        aiohttp = _import_aiohttp()
+        url = f"{self._get_base_url()}{path}"
+        try:
+            async with self._get_session().post(url, json=payload, timeout=aiohttp.ClientTimeout(total=60)) as response:
+                response.raise_for_status()
+        except asyncio.TimeoutError:
+            raise _report_error(TimeoutError(f"Timeout posting to {url}"))
+        except aiohttp.ClientError as e:
+            raise _report_error(QueueError(f"HTTP error posting to {url}: {e}"))
+
+    async def cancel(self, prompt_id):
+        """Cancels a submitted prompt (see cancel_batch). Returns True if it was cancelled."""
+        return bool(await self.cancel_batch([prompt_id]))
+
+    async def cancel_batch(self, uids):
+        """
+        Removes the queued ones among uids from the server queue and interrupts the running one.
+        Their waiters fail at once with CancelledError and their jobs get the status "cancelled";
+        prompts that already finished are left alone. Returns the cancelled UIDs, in the order given.
+        """
+        uids = list(dict.fromkeys(uids))
+        if not uids:
+            return []
+        queue_url = f"{self._get_base_url()}/queue"
+        queue_data = await self._get_json(queue_url, "queue")
+        if queue_data is None:
+            raise _report_error(ConnectionError(f"Could not read the queue of {self._get_base_url()}."))
+        running, pending = _queue_split(queue_data, uids)
+        if pending:
+            await self._post_command("/queue", {"delete": sorted(pending)})
+            # One of them may have started meanwhile; deleting does not stop a running prompt
+            queue_data = await self._get_json(queue_url, "queue")
+            if queue_data is not None:
+                running |= _queue_split(queue_data, pending)[0]
+        cancelled = running | pending
+        # Waiters are failed before the interrupt, whose execution error the server reports right away
+        for prompt_id in cancelled:
+            self._on_finished(prompt_id, CancelledError(f"Prompt {prompt_id} was cancelled."))
+        self._mark_cancelled(cancelled)
+        for prompt_id in running:
+            await self._post_command("/interrupt", {"prompt_id": prompt_id})
+        return [uid for uid in uids if uid in cancelled]
+
+    async def check_queue(self, prompt_id):
+        """
+        Checks the status of a queued prompt_id (non-blocking, single check).
+        Returns True if finished, False otherwise.
+        """
+        job = self._jobs.get(prompt_id)
+        if job is None:
+            return False  # Not found
+        if job.status == "finished":
+            return True
+        if job.status in ("cancelled", "error"):
+            return False # Will never finish
+        return self._check_history(prompt_id, await self._get_history(prompt_id), self._get_base_url())
+
+    async def find_output(self, prompt_id, with_filename=False, all_outputs=False):
+        """
+        Returns the output URL and, if requested, the filename for a completed job.
+        If with_filename=True, returns (url, filename). Otherwise, returns url only.
+        If all_outputs=True, returns the prompt's output index instead ({} if it has not finished).
+        """
+        index = _index_outputs(await self._get_history(prompt_id), self._get_base_url())
+        if all_outputs:
+            return index
+        record = _first_output_image(index)
+        url, filename = (record["url"], record["filename"]) if record else (None, None)
+        if with_filename:
+            return url, filename
+        return url
+
+    async def download_output(self, output_url, save_path=".", filename=None, progress_callback=None, chunk_size=_DOWNLOAD_CHUNK_SIZE):
+        """
+        Downloads an output to save_path, streaming it to `<path>.part` in chunks and renaming
+        it into place when complete. Interrupted transfers resume with Range requests guarded by
+        If-Range (see ComfyClient.download_output).
+        progress_callback, if given, is called as progress_callback(downloaded_bytes, total_bytes, bytes_per_second).
+        Returns the saved path.
+        """
+        aiohttp = _import_aiohttp()
+        if not output_url:
+            raise ValueError("output_url cannot be None or empty.")
+        full_path = None
+        try:
+            full_path = _resolve_download_path(output_url, save_path, filename)
+            part_path = full_path + _PARTIAL_SUFFIX
+            with _span("download"):
+                failures = 0 # Consecutive attempts that made no progress
+                while True:
+                    before = os.path.getsize(part_path) if os.path.isfile(part_path) else 0
+                    try:
+                        await self._stream_to_file(output_url, part_path, progress_callback, chunk_size)
+                        break
+                    except (aiohttp.ClientPayloadError, aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                        after = os.path.getsize(part_path) if os.path.isfile(part_path) else 0
+                        failures = 0 if after > before else failures + 1
+                        if failures > self._DOWNLOAD_RETRIES:
+                            raise
+                        _logger.warning("Download of %s interrupted at %s bytes (%s), resuming...", output_url, after, e)
+                        await asyncio.sleep(0.5 * (2 ** max(failures - 1, 0)))
+            _finish_partial(part_path, full_path)
+            _logger.debug("Output saved to: %s", full_path)
+            return full_path
+        except asyncio.TimeoutError:
+            raise _report_error(TimeoutError(f"Timeout downloading output from {output_url}"))
+        except aiohttp.InvalidURL:
+            raise ValueError(f"Invalid URL format: {output_url}")
+        except aiohttp.ClientError as e:
+            raise _report_error(ComfyAPIError(f"HTTP error downloading output from {output_url}: {e}"))
+        except IOError as e:
+            path_str = full_path if full_path else save_path
+            raise _report_error(ComfyAPIError(f"File system error saving output to {path_str}: {e}"))
+
+    async def _stream_to_file(self, output_url, part_path, progress_callback, chunk_size):
+        aiohttp = _import_aiohttp()
+        offset, validator = _partial_state(part_path)
+        headers = {"Range": f"bytes={offset}-", "If-Range": validator} if offset else {}
+        timeout = aiohttp.ClientTimeout(total=None, sock_connect=10, sock_read=120)
+        async with self._get_session().get(output_url, headers=headers, timeout=timeout) as response:
+            action = _resume_action(response.status, response.headers.get("Content-Range"), offset)
+            if action == "complete":
+                return # The partial file is already complete
+            if action == "restart":
+                # The partial file is not a prefix of this output, or the server sent another range; start over
+                _discard_partial(part_path)
+                return await self._stream_to_file(output_url, part_path, progress_callback, chunk_size)
+            response.raise_for_status()
+            if action is None:
+                raise _report_error(ComfyAPIError(f"Unexpected {response.status} response downloading {output_url}"))
+            if action == "append":
+                mode = 'ab'
+            else:
+                offset = 0 # Server sent the whole file
+                mode = 'wb'
+                _start_partial(part_path, _response_validator(response.headers))
+            total = offset + response.content_length if response.content_length is not None else None
+
+            downloaded = offset
+            started = time.monotonic()
+            with open(part_path, mode) as f:
+                async for chunk in response.content.iter_chunked(chunk_size):
+                    f.write(chunk)
+                    downloaded += len(chunk)
+                    if progress_callback:
+                        elapsed = time.monotonic() - started
+                        rate = (downloaded - offset) / elapsed if elapsed > 0 else 0.0
+                        progress_callback(downloaded, total, rate)
+            _count("download_bytes", downloaded - offset)
+            if total is not None and downloaded < total:
+                raise aiohttp.ClientPayloadError(f"Connection closed after {downloaded} of {total} bytes")
+
+    async def _remote_size(self, output_url):
+        aiohttp = _import_aiohttp()
+        try:
+            async with self._get_session().head(output_url, timeout=aiohttp.ClientTimeout(total=10)) as response:
+                response.raise_for_status()
+                return response.content_length
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            return None
+
+    async def _download_if_needed(self, output_url, save_path, filename):
+        full_path = _resolve_download_path(output_url, save_path, filename)
+        if os.path.isfile(full_path) and await self._remote_size(output_url) == os.path.getsize(full_path):
+            _logger.debug("Skipping %s: already downloaded", full_path)
+            return full_path
+        return await self.download_output(output_url, save_path, filename)
+
+    async def download_outputs(self, results, save_path=".", concurrency=8):
+        """
+        Downloads a list of (filename, url) results with at most `concurrency` transfers at once.
+        Files already on disk with the server's size are skipped.
+        Returns (saved_paths, errors) where errors maps each failed url to its exception.
+        """
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+        unique = list(dict.fromkeys((filename, url) for filename, url in results))
+
+        async def download_one(filename, url):
+            async with semaphore:
+                return await self._download_if_needed(url, save_path, filename)
+        outcomes = await asyncio.gather(*(download_one(filename, url) for filename, url in unique), return_exceptions=True)
+        saved_paths, errors = [], {}
+        for (filename, url), outcome in zip(unique, outcomes):
+            if isinstance(outcome, Exception):
+                _logger.warning("Error downloading %s: %s", url, outcome)
+                errors[url] = outcome
+            else:
+                saved_paths.append(outcome)
+        return saved_paths, errors
+
+    async def wait_and_download_outputs(self, uids, save_path=".", concurrency=8, status_callback=None, max_wait_time=600):
+        """
+        Waits for multiple jobs and downloads each output as soon as its job finishes.
+        Returns (saved_paths, errors) where errors maps each failed UID to its exception.
+        """
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+        uids = list(dict.fromkeys(uids))
+
+        async def wait_and_download(uid):
+            if status_callback: status_callback(uid, "started")
+            filename, url = await self.wait_for_finish(uid, max_wait_time=max_wait_time, status_callback=status_callback)
+            async with semaphore:
+                path = await self._download_if_needed(url, save_path, filename)
+            if status_callback: status_callback(uid, "downloaded")
+            return path
+        outcomes = await asyncio.gather(*(wait_and_download(uid) for uid in uids), return_exceptions=True)
+        saved_paths, errors = [], {}
+        for uid, outcome in zip(uids, outcomes):
+            if isinstance(outcome, Exception):
+                _logger.warning("Error processing UID %s: %s", uid, outcome)
+                errors[uid] = outcome
+            else:
+                saved_paths.append(outcome)
+        return saved_paths, errors
+
+    async def upload_image(self, image_path, subfolder=""):
+        """
+        Uploads a local image to ComfyUI's input folder via /upload/image, streaming it from disk.
+        The same image content is only ever uploaded once per server. Returns the server-side image name.
+        """
+        aiohttp = _import_aiohttp()
+        if not os.path.isfile(image_path):
+            raise FileNotFoundError(f"Local image not found at: {image_path}")
+        base_url = self._get_base_url()
+        digest = await asyncio.get_running_loop().run_in_executor(None, _file_digest, image_path)
+        cache_key = (base_url, digest, subfolder)
+        if cache_key in self._upload_cache:
+            return self._upload_cache[cache_key]
+
+        url = f"{base_url}/upload/image"
+        form = aiohttp.FormData()
+        form.add_field("overwrite", "true")
+        form.add_field("type", "input")
+        form.add_field("subfolder", subfolder)
+        try:
+            with open(image_path, 'rb') as f:
+                form.add_field("image", f, filename=_upload_name(digest, image_path))
+                async with self._get_session().post(url, data=form, timeout=aiohttp.ClientTimeout(total=120)) as response:
+                    response.raise_for_status()
+                    result = await response.json(content_type=None)
+        except asyncio.TimeoutError:
+            raise _report_error(TimeoutError(f"Timeout uploading image to {url}"))
+        except aiohttp.ClientError as e:
+            raise _report_error(ComfyAPIError(f"HTTP error uploading image to {url}: {e}"))
+        except json.JSONDecodeError:
+            raise _report_error(ComfyAPIError(f"Failed to decode JSON response from {url}"))
+        reference = _upload_reference(result, url)
+        self._upload_cache[cache_key] = reference
+        return reference
+
+    async def set_image(self, node_id, image_path, input_name="image", subfolder=""):
+        """
+        Uploads a local image and points a LoadImage node at it. Returns the server-side image name.
+        """
+        image_name = await self.upload_image(image_path, subfolder=subfolder)
+        self.edit_workflow([str(node_id), "inputs", input_name], image_name)
+        return image_name
@@ -0,0 +1,184 @@
+"""
+Opt-in cache of finished prompts' outputs, keyed by the prompt itself.
+
+Resubmitting an identical prompt (same nodes, inputs, seed and model) normally costs a full
+GPU run. With a `ResultCache` passed to a manager, a prompt whose canonical JSON hashes to a
+finished prompt's key is answered with that prompt's outputs instead, and identical prompts
+submitted while one is still running share its prompt_id.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+def _result_key(prompt_bytes):
+    """
+    SHA-256 of an encoded prompt. The managers encode every prompt as canonical JSON (see
+    template._encode), so equal prompts have equal bytes and are hashed without re-parsing.
+    """
+    return hashlib.sha256(prompt_bytes).hexdigest()
+
+
+class ResultCache:
+    """
+    Outputs of finished prompts by prompt key, in memory and optionally on disk.
+
+    With `path`, every stored result is appended as one JSON line to that file, and the file
+    is indexed (key -> offset) when the cache is created, so results survive restarts while
+    only `max_entries` recently used entries are kept parsed in memory. Without a path the
+    cache is memory-only and holds at most `max_entries` results.
+
+    Output URLs point at the server that ran the original prompt, so cached results are only
+    as good as that server's output folder. A cache may be shared between managers; the file
+    is closed when the last of them is closed (or by `close()`).
+    """
+
+    def __init__(self, path=None, max_entries=1024):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict() # key -> entry dict, least recently used first
+        self._offsets = {} # key -> offset of its latest line in the file
+        self._inflight = OrderedDict() # key -> prompt_id of the identical prompt being run
+        self._inflight_keys = {} # prompt_id -> key
+        self._inflight_servers = {} # prompt_id -> base URL of the server it was queued on, once known
+        self._users = 0 # Managers using the cache
+        self._file = None
+        if path is not None:
+            self._load()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._offsets) if self.path is not None else len(self._entries)
+
+    def _load(self):
+        """Indexes the results already in the file and opens it for appending."""
+        if os.path.exists(self.path):
+            with open(self.path, "rb") as f:
+                offset = 0
+                line = b""
+                for line in f:
+                    try:
+                        self._offsets[json.loads(line)["key"]] = offset
+                    except (ValueError, KeyError, TypeError):
+                        pass # Torn or foreign line; skipped
+                    offset += len(line)
+            if line and not line.endswith(b"\n"):
+                with open(self.path, "ab") as f:
+                    f.write(b"\n") # Start after a line torn by a crash
+        self._file = open(self.path, "ab")
+
+    def _read(self, key):
+        """Returns the entry for key from the file, or None. Call with self._lock held."""
+        offset = self._offsets.get(key)
+        if offset is None:
+            return None
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            try:
+                return json.loads(f.readline())
+            except ValueError:
+                return None
+
+    def _remember(self, key, entry):
+        """Puts entry at the recent end of the in-memory LRU. Call with self._lock held."""
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get(self, key):
+        """Returns {'key', 'prompt_id', 'server', 'outputs', 'stored_at'} for key, or None."""
+        with self._lock:
+            return self._get(key)
+
+    def _get(self, key):
+        entry = self._entries.get(key)
+        if entry is None and self.path is not None:
+            entry = self._read(key)
+        if entry is not None:
+            self._remember(key, entry)
+        return entry
+
+    def claim(self, key, prompt_id):
+        """
+        Looks key up for a new submission. Returns (cached prompt_id, entry) if a result is
+        cached, (prompt_id of the identical prompt in flight, None) if one is running, and
+        otherwise (prompt_id, None) after recording prompt_id as running for key; the caller
+        must then submit it under that ID (and `release` it if that fails).
+        """
+        with self._lock:
+            entry = self._get(key)
+            if entry is not None:
+                return entry["prompt_id"], entry
+            running = self._inflight.get(key)
+            if running is not None:
+                return running, None
+            self._inflight[key] = prompt_id
+            self._inflight_keys[prompt_id] = key
+            while len(self._inflight) > self.max_entries:
+                _, evicted = self._inflight.popitem(last=False) # Only loses coalescing for it
+                self._inflight_keys.pop(evicted, None)
+                self._inflight_servers.pop(evicted, None)
+            return prompt_id, None
+
+    def key_for(self, prompt_id):
+        """Returns the key prompt_id was claimed under while it is running, or None."""
+        with self._lock:
+            return self._inflight_keys.get(prompt_id)
+
+    def placed(self, prompt_id, server):
+        """Records the server a claimed prompt was queued on, so managers sharing the cache can wait for it there."""
+        with self._lock:
+            if prompt_id in self._inflight_keys:
+                self._inflight_servers[prompt_id] = server
+
+    def server_of(self, prompt_id):
+        """Returns the server a running claimed prompt was queued on, or None (also while it is held)."""
+        with self._lock:
+            return self._inflight_servers.get(prompt_id)
+
+    def release(self, prompt_id):
+        """Forgets a running prompt (e.g. it failed), so the next identical one is submitted again."""
+        with self._lock:
+            self._inflight_servers.pop(prompt_id, None)
+            key = self._inflight_keys.pop(prompt_id, None)
+            if key is not None and self._inflight.get(key) == prompt_id:
+                del self._inflight[key]
+
+    def store(self, key, prompt_id, server, outputs):
+        """Records the output index of a finished prompt under key."""
+        entry = {"key": key, "prompt_id": prompt_id, "server": server, "outputs": outputs, "stored_at": time.time()}
+        with self._lock:
+            if self._file is not None:
+                line = (json.dumps(entry, separators=(",", ":")) + "\n").encode("utf-8")
+                self._offsets[key] = self._file.tell()
+                self._file.write(line)
+                self._file.flush()
+            self._remember(key, entry)
+            if self._inflight.get(key) == prompt_id:
+                del self._inflight[key]
+            self._inflight_keys.pop(prompt_id, None)
+            self._inflight_servers.pop(prompt_id, None)
+
+    def _attach(self):
+        """Counts a manager that uses the cache."""
+        with self._lock:
+            self._users += 1
+
+    def _detach(self):
+        """Called by a closing manager; the last one closes the file."""
+        with self._lock:
+            self._users -= 1
+            last = self._users <= 0
+        if last:
+            self.close()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
@@ -1,18 +1,26 @@
 import json
+import logging
 import random
 import websocket
 import urllib.parse
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import time
 import threading
-import copy
 import os
-from queue import Queue
+import concurrent.futures
+import hashlib
+import io
+import mimetypes
+import uuid
+import itertools
+from collections import OrderedDict
 
-# --- Module State ---
-_base_url = None
-_websocket_url = None
-_client_id = None
+from .template import WorkflowTemplate, _encode
+from .instrumentation import _count, _count_response, _endpoint, _enabled, _span, _timing
+
+_logger = logging.getLogger(__name__)
 
 # --- Exceptions ---
 class ComfyAPIError(Exception):
@@ -39,6 +47,20 @@ class TimeoutError(ComfyAPIError):
     """Operation timed out."""
     pass
 
+class CancelledError(ComfyAPIError):
+    """The prompt was cancelled before it finished."""
+    pass
+
+def _report_error(error):
+    """
+    Counts error in the "errors" metric where it is raised or reported, once however often it
+    is re-raised, and returns it. Cancellations were asked for, so they are not counted.
+    """
+    if not isinstance(error, CancelledError) and not getattr(error, "_reported", False):
+        error._reported = True
+        _count("errors", kind=type(error).__name__)
+    return error
+
 # --- Internal Helper Functions ---
 
 def _extract_urls(url):
@@ -57,189 +79,927 @@ def _generate_client_id():
     """Generates a unique client ID."""
     return str(random.randint(1000000000, 9999999999)) # Increased range
 
-def _find_output(prompt_id):
+def _output_url(filename, subfolder, folder_type, base_url):
+    """Builds the /view URL of a file in one of ComfyUI's output, temp or input folders on base_url."""
+    url = f"{base_url}/view?filename={urllib.parse.quote(filename)}"
+    if subfolder:
+        url += f"&subfolder={urllib.parse.quote(subfolder)}"
+    return url + f"&type={urllib.parse.quote(folder_type)}"
+
+def _index_outputs(prompt_history, base_url):
     """
-    Finds the output image URL and filename for a completed job by checking its history.
-    Returns (url, filename) or (None, None) if not found.
+    Indexes every file a prompt produced, from its history entry.
+
+    Returns a dict mapping node_id to a list of records, one per file, in the order ComfyUI
+    reported them: {"kind": "images" | "gifs" | ..., "filename", "subfolder", "type": "output" |
+    "temp", "url"}. Outputs that are not files (e.g. text) are skipped. Returns {} if the
+    history has no outputs.
     """
-    history = _get_history(prompt_id)
-    filename = _find_output_in_history(history)
-    if filename:
-        base_url = _get_base_url()
-        encoded_filename = urllib.parse.quote(filename)
-        url = f"{base_url}/view?filename={encoded_filename}&type=output"
-        return url, filename
-    return None, None
-
-def _find_output_url(prompt_id):
-    url, _ = _find_output(prompt_id)
-    return url
-
-def _find_output_in_history(prompt_history):
-    """Parses history to find output images/files."""
-    # print(f"[_find_output_in_history] Processing history: {prompt_history}") # DEBUG REMOVED
     if not prompt_history or 'outputs' not in prompt_history:
-        # print("[_find_output_in_history] History empty or missing 'outputs' key.") # DEBUG REMOVED
-        return None # Not finished or no outputs
-
-    outputs = prompt_history['outputs']
-    # Iterate through nodes to find the first image output
-    # Assumes the desired output is an image; might need adjustment for other types
-    for node_id, node_output in outputs.items():
-        # print(f"[_find_output_in_history] Checking node {node_id}: {node_output}") # DEBUG REMOVED
-        if 'images' in node_output:
-            # print(f"[_find_output_in_history] Found 'images' in node {node_id}: {node_output['images']}") # DEBUG REMOVED
-            for image_data in node_output['images']:
-                # print(f"[_find_output_in_history] Checking image data: {image_data}") # DEBUG REMOVED
-                # Check for standard output fields
-                if image_data.get('type') == 'output' and 'filename' in image_data:
-                    # print(f"[_find_output_in_history] Found output filename: {image_data['filename']}") # DEBUG REMOVED
-                    return image_data['filename'] # Returns filename if found
-    # print("[_find_output_in_history] No suitable output image found in history.") # DEBUG REMOVED
-    return None # No image output found
-
-# --- State Management ---
+        return {}
+    index = {}
+    for node_id, node_output in prompt_history['outputs'].items():
+        records = []
+        for kind, items in node_output.items():
+            if not isinstance(items, list):
+                continue
+            for item in items:
+                if not isinstance(item, dict) or 'filename' not in item:
+                    continue
+                subfolder = item.get('subfolder') or ""
+                folder_type = item.get('type') or "output"
+                records.append({
+                    "kind": kind,
+                    "filename": item['filename'],
+                    "subfolder": subfolder,
+                    "type": folder_type,
+                    "url": _output_url(item['filename'], subfolder, folder_type, base_url),
+                })
+        if records:
+            index[node_id] = records
+    return index
+
+def _first_output_image(index):
+    """Returns the first saved image record of an output index (what find_output reports), or None."""
+    for records in index.values():
+        for record in records:
+            if record["kind"] == "images" and record["type"] == "output":
+                return record
+    return None
+
+def _finished_output(prompt_id, prompt_history, base_url, status_callback=None, all_outputs=False):
+    """
+    Returns (filename, output_url) for a finished prompt's history entry on the server at
+    base_url, or its full output index (see _index_outputs) if all_outputs is True.
+    """
+    index = _index_outputs(prompt_history, base_url)
+    if all_outputs:
+        _logger.debug("Execution finished for %s. Outputs from %s node(s).", prompt_id, len(index))
+        if status_callback: status_callback(prompt_id, "finished")
+        return index
+    record = _first_output_image(index)
+    if not record:
+        if status_callback: status_callback(prompt_id, "error")
+        raise _report_error(HistoryError(f"Prompt {prompt_id} finished without an output image."))
+    _logger.debug("Execution finished for %s. Output filename: %s", prompt_id, record['filename'])
+    if status_callback: status_callback(prompt_id, "finished")
+    return record["filename"], record["url"] # Success! Return filename and URL tuple
+
+class _CountingRetry(Retry):
+    """Retry policy that reports each retry to the instrumentation hooks."""
+
+    def increment(self, method=None, url=None, *args, **kwargs):
+        _count("retries", method=method or "", endpoint=_endpoint(url or ""))
+        return super().increment(method, url, *args, **kwargs)
+
+def _create_session(pool_size, retries, backoff_factor):
+    """Creates a requests.Session with a sized keep-alive pool and retry policy."""
+    retry = _CountingRetry(
+        total=retries,
+        connect=retries,
+        read=retries,
+        status=retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=(502, 503, 504),
+        raise_on_status=False, # Let raise_for_status() report the final response
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.hooks["response"].append(_count_response)
+    return session
+
+class _HistoryCache:
+    """
+    Bounded LRU of finished prompts' history entries, each kept for at most `ttl` seconds.
+    ComfyUI only writes a prompt's history once it has finished, so a non-empty entry
+    never changes and can be served from here instead of fetching /history again.
+    """
 
-def set_base_url(url):
-    """Sets the base URL for the ComfyUI server and generates a client ID."""
-    global _base_url, _websocket_url, _client_id
-    try:
-        _base_url, _websocket_url = _extract_urls(url)
-        _client_id = _generate_client_id()
-        print(f"ComfyAPI: Base URL set to {_base_url}, WebSocket URL to {_websocket_url}, Client ID: {_client_id}")
-    except ValueError as e:
-        raise ConnectionError(f"Invalid server URL: {e}")
-
-def _get_base_url():
-    if not _base_url:
-        raise ComfyAPIError("Base URL not set. Call set_base_url() first.")
-    return _base_url
-
-def _get_websocket_url():
-    if not _websocket_url:
-        raise ComfyAPIError("WebSocket URL not set. Call set_base_url() first.")
-    return _websocket_url
-
-def _get_client_id():
-    if not _client_id:
-        raise ComfyAPIError("Client ID not generated. Call set_base_url() first.")
-    return _client_id
-
-# --- Core API Interaction ---
-
-def _open_websocket_connection():
-    """Opens a WebSocket connection."""
-    ws_url = _get_websocket_url()
-    ws = websocket.WebSocket()
-    try:
-        # Increased timeout for potentially slow connections
-        ws.connect(ws_url, timeout=90)
-        print(f"WebSocket connected to {ws_url}")
-        return ws
-    except (websocket.WebSocketException, ConnectionRefusedError, TimeoutError, OSError) as e:
-        raise ConnectionError(f"Failed to connect WebSocket to {ws_url}: {e}")
-
-def _queue_prompt(prompt):
-    """Queues a prompt using the configured base URL and client ID."""
-    base_url = _get_base_url()
-    client_id = _get_client_id()
-    p = {"prompt": prompt, "client_id": client_id}
-    data = json.dumps(p).encode('utf-8')
-    url = f"{base_url}/prompt" # Changed from /api/prompt based on common ComfyUI setups
-    print(f"Queueing prompt to {url} with client ID {client_id}")
+    def __init__(self, max_items=256, ttl=300):
+        self.max_items = max_items
+        self.ttl = ttl
+        self._entries = OrderedDict() # prompt_id -> (expires_at, history)
+        self._lock = threading.Lock()
+
+    def get(self, prompt_id):
+        with self._lock:
+            entry = self._entries.get(prompt_id)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._entries[prompt_id]
+                return None
+            self._entries.move_to_end(prompt_id)
+            return entry[1]
+
+    def put(self, prompt_id, history):
+        if not history:
+            return # Empty means not finished yet; that can still change
+        with self._lock:
+            self._entries[prompt_id] = (time.monotonic() + self.ttl, history)
+            self._entries.move_to_end(prompt_id)
+            while len(self._entries) > self.max_items:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+def _queued_prompt_ids(queue_data):
+    """Returns the set of prompt_ids that are running or pending in a /queue response."""
+    ids = set()
+    for key in ('queue_running', 'queue_pending'):
+        for item in queue_data.get(key, []):
+            # Queue items are [number, prompt_id, prompt, extra_data, outputs_to_execute]
+            if len(item) > 1:
+                ids.add(item[1])
+    return ids
+
+def _queue_split(queue_data, prompt_ids):
+    """Returns (running, pending): the sets of prompt_ids that a /queue response lists as running and as pending."""
+    prompt_ids = set(prompt_ids)
+    def listed(key):
+        return {item[1] for item in queue_data.get(key, []) if len(item) > 1} & prompt_ids
+    return listed('queue_running'), listed('queue_pending')
+
+def _unqueued(prompt_ids, queue_data):
+    """Those of prompt_ids that a /queue response lists neither as running nor as pending (none if it is None)."""
+    if queue_data is None:
+        return []
+    queued = _queued_prompt_ids(queue_data)
+    return [prompt_id for prompt_id in prompt_ids if prompt_id not in queued]
+
+_HISTORY_SLACK = 32 # Extra history entries fetched in bulk to cover other clients' prompts
+
+def _known_from(prompt_ids, queue_data, history, max_items):
+    """
+    Splits the set prompt_ids into (known, unsure) from a /queue response and a bulk history
+    response of at most max_items entries: known are those the server still has, queued, running
+    or in its history; unsure are the rest if the history was cut off at max_items, since they
+    may be older entries that have to be looked up one by one.
+    """
+    known = (_queued_prompt_ids(queue_data) | set(history)) & prompt_ids
+    return known, (prompt_ids - known if len(history) >= max_items else set())
 
-    try:
-        response = requests.post(url, data=data, headers={'Content-Type': 'application/json'}, timeout=60)
-        response.raise_for_status()
-        result = response.json()
-        if 'prompt_id' not in result:
-             raise QueueError(f"Failed to queue prompt: 'prompt_id' not in response: {result}")
-        if 'error' in result:
-             # Handle API-level errors if present
-             error_details = result.get('node_errors', result['error'])
-             raise QueueError(f"API error queueing prompt: {error_details}")
-        print(f"Prompt queued successfully. Prompt ID: {result['prompt_id']}")
-        return result['prompt_id']
-    except requests.exceptions.Timeout:
-        raise TimeoutError(f"Timeout queueing prompt at {url}")
-    except requests.exceptions.RequestException as e:
-        raise QueueError(f"HTTP error queueing prompt at {url}: {e}")
-    except json.JSONDecodeError:
-        raise QueueError(f"Failed to decode JSON response from {url}")
-
-def _get_history(prompt_id):
-    """Fetches execution history for a given prompt_id."""
-    base_url = _get_base_url()
-    url = f"{base_url}/history/{prompt_id}"
-    try:
-        response = requests.get(url, timeout=60)
-        response.raise_for_status()
-        history = response.json()
-        # The history is a dictionary where the key is the prompt_id
-        # print(f"[_get_history] Raw history response for {prompt_id}: {history}") # DEBUG REMOVED
-        prompt_data = history.get(str(prompt_id))
-        # print(f"[_get_history] Extracted history data for {prompt_id}: {prompt_data}") # DEBUG REMOVED
-        return prompt_data
-    except requests.exceptions.Timeout:
-        print(f"Timeout fetching history for {prompt_id} from {url}")
-        return None # Indicate timeout, polling might continue
-    except requests.exceptions.RequestException as e:
-        # Don't raise immediately, allow polling to retry
-        print(f"Error fetching history for {prompt_id} from {url}: {e}")
+def _known_prompt_ids(client, prompt_ids):
+    """
+    Returns the subset of prompt_ids the server behind client still has, queued, running or
+    in its history. Raises ConnectionError if the server cannot be asked.
+    """
+    prompt_ids = set(prompt_ids)
+    if not prompt_ids:
+        return set()
+    queue_data = client.get_queue()
+    if queue_data is None:
+        raise _report_error(ConnectionError(f"Could not read the queue of {client.base_url}."))
+    max_items = len(prompt_ids) + _HISTORY_SLACK
+    history = client.get_history_bulk(max_items)
+    if history is None:
+        raise _report_error(ConnectionError(f"Could not read the history of {client.base_url}."))
+    known, unsure = _known_from(prompt_ids, queue_data, history, max_items)
+    return known | {prompt_id for prompt_id in unsure if client.get_history(prompt_id)}
+
+def _prompt_request(prompt_bytes, client_id, prompt_id=None, front=False):
+    """Body of a /prompt request for an already JSON-encoded prompt."""
+    data = b'{"prompt":' + prompt_bytes + b',"client_id":' + json.dumps(client_id).encode('utf-8')
+    if prompt_id is not None:
+        data += b',"prompt_id":' + json.dumps(prompt_id).encode('utf-8')
+    if front:
+        data += b',"front":true'
+    return data + b'}'
+
+def _queued_prompt_id(result):
+    """Returns the prompt_id from a /prompt response, or raises QueueError if the prompt was not queued."""
+    if 'prompt_id' not in result:
+        raise _report_error(QueueError(f"Failed to queue prompt: 'prompt_id' not in response: {result}"))
+    if 'error' in result:
+        # Handle API-level errors if present
+        error_details = result.get('node_errors', result['error'])
+        raise _report_error(QueueError(f"API error queueing prompt: {error_details}"))
+    return result['prompt_id']
+
+def _history_error(prompt_id, prompt_history):
+    """Returns an ExecutionError if the history entry reports a failed execution, else None."""
+    # Note: ComfyUI history API might not always populate error details here reliably.
+    if prompt_history.get('status', {}).get('status_str') != 'error':
+        return None
+    # Attempt to get more details if available
+    error_info = prompt_history.get('status', {}).get('message', 'Unknown error from history status')
+    for msg_type, data in prompt_history.get('status', {}).get('messages', []):
+        if msg_type == 'execution_error':
+            error_info = data.get('exception_message', error_info)
+        elif msg_type == 'execution_interrupted':
+            error_info = "interrupted"
+    exception_info = prompt_history.get('status', {}).get('exception_message', '')
+    if exception_info: error_info += f" ({exception_info})"
+    return ExecutionError(f"Execution failed for prompt {prompt_id}: {error_info}")
+
+def _execution_seconds(prompt_history):
+    """Seconds from a history entry's execution_start status message to its last one, or None."""
+    started = ended = None
+    for message in (prompt_history.get('status') or {}).get('messages') or ():
+        try:
+            kind, data = message
+            timestamp = data['timestamp'] # Milliseconds, server clock
+        except (TypeError, ValueError, KeyError):
+            continue
+        if kind == 'execution_start':
+            started = timestamp
+        elif kind in ('execution_success', 'execution_error', 'execution_interrupted'):
+            ended = timestamp
+    if started is None or ended is None:
+        return None
+    return max(0.0, (ended - started) / 1000)
+
+class _SubmitTimes:
+    """When each unfinished prompt was queued, kept while instrumented to report its queue wait."""
+
+    _LIMIT = 10000 # Unfinished prompts whose submission time is kept
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._times = OrderedDict() # prompt_id -> time.time() it was queued
+
+    def add(self, prompt_id):
+        if _enabled():
+            with self._lock:
+                _bounded_put(self._times, prompt_id, time.time(), self._LIMIT)
+
+    def finished(self, prompt_id, prompt_history):
+        """Reports the queue wait and execution time of a finished prompt that was added."""
+        with self._lock:
+            submitted_at = self._times.pop(prompt_id, None)
+        if submitted_at is not None:
+            _report_phases(submitted_at, prompt_history)
+
+def _report_phases(submitted_at, prompt_history):
+    """Reports the execution and queue_wait timings of a prompt queued at submitted_at (time.time())."""
+    execution = _execution_seconds(prompt_history)
+    if execution is not None:
+        _timing("execution", execution)
+    _timing("queue_wait", max(0.0, time.time() - submitted_at - (execution or 0.0)))
+
+def _is_server_failure(error):
+    """
+    True if a submission failed because the server was unreachable or broken, so it may
+    succeed later or elsewhere; False for errors about the prompt itself (e.g. validation errors).
+    """
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    cause = error.__context__
+    if isinstance(cause, (requests.exceptions.ConnectionError, requests.exceptions.Timeout)):
+        return True
+    if isinstance(cause, requests.exceptions.HTTPError) and cause.response is not None:
+        return cause.response.status_code >= 500
+    return False
+
+# --- Image Upload ---
+
+def _file_digest(path, chunk_size=1024 * 1024):
+    """Returns the SHA-256 hex digest of a file, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _upload_name(digest, image_path):
+    """Server-side name of an uploaded image: its content hash and its original extension."""
+    return f"{digest[:32]}{os.path.splitext(image_path)[1].lower()}"
+
+def _upload_reference(result, url):
+    """The image reference for a LoadImage node (e.g. "subfolder/name.png") from an /upload/image response."""
+    if 'name' not in result:
+        raise _report_error(ComfyAPIError(f"Unexpected upload response from {url}: {result}"))
+    return f"{result['subfolder']}/{result['name']}" if result.get('subfolder') else result['name']
+
+class _MultipartFileStream:
+    """
+    multipart/form-data request body that streams one file from disk.
+    Has a known length, so requests sends it with Content-Length instead of buffering it.
+    """
+
+    def __init__(self, fields, file_field, filename, path):
+        boundary = uuid.uuid4().hex
+        self.content_type = f"multipart/form-data; boundary={boundary}"
+        head = b""
+        for name, value in fields.items():
+            head += (f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n').encode('utf-8')
+        mime = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        head += (f'--{boundary}\r\nContent-Disposition: form-data; name="{file_field}"; filename="{filename}"\r\n'
+                 f'Content-Type: {mime}\r\n\r\n').encode('utf-8')
+        tail = f'\r\n--{boundary}--\r\n'.encode('utf-8')
+        self._length = len(head) + os.path.getsize(path) + len(tail)
+        self._parts = [io.BytesIO(head), open(path, 'rb'), io.BytesIO(tail)]
+
+    def __len__(self):
+        return self._length
+
+    def read(self, size=-1):
+        chunks = []
+        while self._parts and (size < 0 or size > 0):
+            chunk = self._parts[0].read(size)
+            if not chunk:
+                self._parts.pop(0).close()
+                continue
+            chunks.append(chunk)
+            if size > 0:
+                size -= len(chunk)
+        return b"".join(chunks)
+
+    def close(self):
+        for part in self._parts:
+            part.close()
+        self._parts = []
+
+# --- Completion Tracking ---
+
+def _ws_completion(message):
+    """
+    Returns (prompt_id, error) if a WebSocket message reports that a prompt finished (error is
+    None on success, else an ExecutionError), or None for any other message.
+    """
+    msg_type = message.get('type')
+    data = message.get('data') or {}
+    prompt_id = data.get('prompt_id')
+    if not prompt_id:
         return None
-    except json.JSONDecodeError:
-        print(f"Failed to decode JSON history response from {url}")
-        return None # Allow polling to retry
+    if msg_type == 'executing' and data.get('node') is None:
+        # Sent after ComfyUI has written the prompt's history
+        return prompt_id, None
+    if msg_type == 'execution_error':
+        error_info = data.get('exception_message', 'Unknown error')
+        node_info = f" in node {data['node_id']} ({data.get('node_type')})" if data.get('node_id') else ""
+        return prompt_id, ExecutionError(f"Execution failed for prompt {prompt_id}{node_info}: {error_info}")
+    if msg_type == 'execution_interrupted':
+        return prompt_id, ExecutionError(f"Execution interrupted for prompt {prompt_id}")
+    return None
+
+class _PromptWatcher:
+    """
+    Background WebSocket listener for a client's ID.
+
+    Reads ComfyUI's `executing`/`execution_error`/`execution_interrupted` messages and
+    reports finished prompts to `on_finished(prompt_id, error)` the moment they complete.
+    The socket is reconnected with backoff when it drops; `connected` is False meanwhile.
+    A connection counts from its first message (ComfyUI sends its status once the socket is
+    registered, so nothing after that is missed); then `generation` is incremented and
+    `on_connected()` is called, since prompts may have finished while no socket was listening.
+    """
 
-def _wait_for_finish_single(prompt_id, poll_interval=3, max_wait_time=600, status_callback=None):
+    def __init__(self, client, on_finished, on_connected=None):
+        self._client = client
+        self._on_finished = on_finished
+        self._on_connected = on_connected
+        self._connected = threading.Event()
+        self._stop = threading.Event()
+        self.generation = 0
+        self._thread = threading.Thread(target=self._run, name="comfyapi-ws", daemon=True)
+
+    @property
+    def connected(self):
+        return self._connected.is_set()
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _handle_message(self, message):
+        completion = _ws_completion(message)
+        if completion is not None:
+            self._on_finished(*completion)
+
+    def _run(self):
+        backoff = 1
+        while not self._stop.is_set():
+            try:
+                ws = self._client.open_websocket_connection(timeout=10)
+            except ComfyAPIError as e:
+                _logger.warning("WebSocket unavailable, falling back to history polling: %s", e)
+                self._stop.wait(backoff)
+                backoff = min(backoff * 2, 30)
+                continue
+            backoff = 1
+            ws.settimeout(1)
+            try:
+                while not self._stop.is_set():
+                    try:
+                        raw = ws.recv()
+                    except websocket.WebSocketTimeoutException:
+                        continue
+                    if not self._connected.is_set():
+                        self.generation += 1
+                        self._connected.set()
+                        if self._on_connected: self._on_connected()
+                    if not isinstance(raw, str):
+                        continue # Binary preview frames
+                    try:
+                        self._handle_message(json.loads(raw))
+                    except json.JSONDecodeError:
+                        continue
+            except (websocket.WebSocketException, OSError) as e:
+                if not self._stop.is_set():
+                    _logger.warning("WebSocket connection lost, reconnecting: %s", e)
+            finally:
+                self._connected.clear()
+                try:
+                    ws.close()
+                except Exception:
+                    pass
+
+# Adaptive polling while the WebSocket is down (see _poll_delay)
+_MIN_POLL_INTERVAL = 0.25
+_MAX_POLL_INTERVAL = 30 # Longest gap between checks of a prompt deep in the queue
+_BACKOFF_POLL_INTERVAL = 5 # Cap of the backoff for prompts without (or past) an estimate
+
+def _faster_interval(interval, other):
+    """The shorter of two waiters' poll intervals; None (adaptive) only if both are None."""
+    if interval is None or other is None:
+        return other if interval is None else interval
+    return min(interval, other)
+
+def _poll_delay(eta, misses):
     """
-    Waits for a single prompt to finish by polling history.
-    Returns a tuple containing (filename, output_url) upon success.
+    Returns (seconds until a pending prompt is checked again, new miss count). While its
+    expected finish is known the next check is at that time (at most _MAX_POLL_INTERVAL away,
+    so estimates are refreshed while it is deep in the queue); once it is due, or if nothing
+    is known yet, the gap backs off exponentially from _MIN_POLL_INTERVAL.
     """
-    base_url = _get_base_url()
-    start_time = time.time()
-    last_status_update = 0
+    if eta is not None and eta > _MIN_POLL_INTERVAL:
+        return min(_MAX_POLL_INTERVAL, eta), 0
+    return min(_BACKOFF_POLL_INTERVAL, _MIN_POLL_INTERVAL * 2 ** misses), misses + 1
 
-    while time.time() - start_time < max_wait_time:
-        if status_callback and time.time() - last_status_update > 5: # Update status every 5s
-             status_callback(prompt_id, "polling")
-             last_status_update = time.time()
+def _structure_key(prompt):
+    """
+    Hash of a prompt's nodes, their class types and the links between them. Scalar inputs
+    (seed, prompt text, sizes) are ignored, so every variant of one workflow shares a key.
+    """
+    if not isinstance(prompt, dict):
+        return None
+    parts = []
+    for node_id, node in prompt.items():
+        if isinstance(node, dict):
+            links = sorted((name, str(value[0]), str(value[1])) for name, value in (node.get('inputs') or {}).items()
+                           if isinstance(value, list) and len(value) == 2)
+            parts.append((str(node_id), str(node.get('class_type')), links))
+    parts.sort()
+    return hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()
+
+def _bounded_put(mapping, key, value, limit):
+    mapping[key] = value
+    while len(mapping) > limit:
+        mapping.popitem(last=False)
+
+class _ExecutionStats:
+    """
+    Moving average of execution time per workflow structure (`_structure_key`), learned from
+    finished prompts' history entries, used to estimate when queued prompts will finish.
+    The prompt itself is read from the history and /queue entries, so nothing has to be
+    recorded at submission.
+    """
 
-        print(f"Polling history for prompt_id: {prompt_id}...")
-        prompt_history = _get_history(prompt_id)
+    _ALPHA = 0.3 # Weight of the newest sample in the moving averages
+    _MAX_KEYS = 256
+    _MAX_PROMPTS = 8192 # Prompt_ids whose key, running start or recording is remembered
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._means = OrderedDict() # structure key -> seconds
+        self._overall = None # Seconds, across all structures
+        self._keys = OrderedDict() # prompt_id -> structure key
+        self._running_since = OrderedDict() # prompt_id -> time.monotonic() it was first seen running
+        self._recorded = OrderedDict() # prompt_ids already counted, used as an ordered set
+
+    def _key(self, prompt_id, item):
+        """Structure key of a history or /queue item's prompt ([number, prompt_id, prompt, ...])."""
+        key = self._keys.get(prompt_id)
+        if key is None and isinstance(item, (list, tuple)) and len(item) > 2:
+            key = _structure_key(item[2])
+            if key is not None:
+                _bounded_put(self._keys, prompt_id, key, self._MAX_PROMPTS)
+        return key
+
+    def expected(self, key):
+        """Expected execution seconds of a prompt with structure key, or None if nothing is known."""
+        with self._lock:
+            return self._means.get(key, self._overall)
+
+    def record(self, prompt_id, prompt_history):
+        """Adds a finished prompt's execution time (once per prompt_id)."""
+        seconds = _execution_seconds(prompt_history)
+        if seconds is None:
+            return
+        with self._lock:
+            if prompt_id in self._recorded:
+                return
+            _bounded_put(self._recorded, prompt_id, True, self._MAX_PROMPTS)
+            self._running_since.pop(prompt_id, None)
+            key = self._key(prompt_id, prompt_history.get('prompt'))
+            self._keys.pop(prompt_id, None)
+            if key is not None:
+                mean = self._means.get(key)
+                self._means[key] = seconds if mean is None else mean + self._ALPHA * (seconds - mean)
+                self._means.move_to_end(key)
+                while len(self._means) > self._MAX_KEYS:
+                    self._means.popitem(last=False)
+            overall = self._overall
+            self._overall = seconds if overall is None else overall + self._ALPHA * (seconds - overall)
+
+    def etas(self, queue_data, now=None):
+        """
+        Returns {prompt_id: seconds until it is expected to finish} for the prompts in a /queue
+        response, from the time the running ones have been running and the expected time of
+        every prompt ahead. Empty until some prompt has finished on this server.
+        """
+        now = time.monotonic() if now is None else now
+        etas = {}
+        with self._lock:
+            if self._overall is None or not isinstance(queue_data, dict):
+                return etas
+            ahead = 0.0
+            for item in queue_data.get('queue_running') or []:
+                try:
+                    prompt_id = item[1]
+                except (TypeError, IndexError):
+                    continue
+                if prompt_id not in self._running_since:
+                    _bounded_put(self._running_since, prompt_id, now, self._MAX_PROMPTS)
+                expected = self._means.get(self._key(prompt_id, item), self._overall)
+                etas[prompt_id] = max(0.0, expected - (now - self._running_since[prompt_id]))
+                ahead += etas[prompt_id]
+            pending = [item for item in queue_data.get('queue_pending') or []
+                       if isinstance(item, (list, tuple)) and len(item) > 1]
+            pending.sort(key=lambda item: item[0] if isinstance(item[0], (int, float)) else 0)
+            for item in pending:
+                ahead += self._means.get(self._key(item[1], item), self._overall)
+                etas[item[1]] = ahead
+        return etas
+
+class _PendingPrompts:
+    """
+    What a completion tracker knows about the prompts it waits for, without any I/O or locking.
+
+    Shared by _PromptTracker, which guards it with a condition and checks prompts from a thread,
+    and AsyncComfyAPIManager, which uses it from the event loop; each supplies the transport (the
+    WebSocket listener, the history and /queue requests and the wake-ups). `generation` arguments
+    are the WebSocket generation while the socket is up, else None. new_future() makes the futures
+    handed to waiters; is_held(prompt_id) is True for prompts the server can't know yet (held by a
+    feeder), which are not checked.
+    """
 
-        if prompt_history:
-            filename = _find_output_in_history(prompt_history)
-            if filename:
-                print(f"Execution finished for {prompt_id}. Output filename: {filename}")
-                # Construct the URL here
-                output_url, _ = _find_output(prompt_id)
-                print(f"Constructed output URL: {output_url}")
-                if status_callback: status_callback(prompt_id, "finished")
-                return filename, output_url # Success! Return filename and URL tuple
-
-            # Check for errors in history (less common than WebSocket errors)
-            # Note: ComfyUI history API might not always populate error details here reliably.
-            # WebSocket monitoring (if implemented) is often better for catching errors early.
-            if prompt_history.get('status', {}).get('status_str') == 'error':
-                 # Attempt to get more details if available
-                 error_info = prompt_history.get('status', {}).get('message', 'Unknown error from history status')
-                 exception_info = prompt_history.get('status', {}).get('exception_message', '')
-                 if exception_info: error_info += f" ({exception_info})"
-                 print(f"Execution error found in history for {prompt_id}: {error_info}")
-                 if status_callback: status_callback(prompt_id, "error")
-                 # Raise an exception to signal failure
-                 raise ExecutionError(f"Execution failed for prompt {prompt_id}: {error_info}")
-
-            print(f"History found for {prompt_id}, but execution not complete yet.")
+    RECENT_LIMIT = 1024 # Finished prompt_ids remembered for late track() calls
+    RECONCILE_INTERVAL = 30 # Seconds between bulk polls while the WebSocket is up
+
+    def __init__(self, new_future, is_held=None):
+        self._new_future = new_future
+        self._is_held = is_held or (lambda prompt_id: False)
+        self.futures = {} # prompt_id -> Future
+        self._waiters = {} # prompt_id -> (refcount, poll_interval or None for adaptive)
+        self._signalled = {} # prompt_id -> error or None, reported over WebSocket
+        self._fresh = set() # Tracked but not yet checked against history
+        self._due = {} # prompt_id -> time.monotonic() of its next check while the socket is down
+        self._misses = {} # prompt_id -> checks since its expected finish was last known
+        self._recent = OrderedDict()
+        self._submitted = OrderedDict() # prompt_id -> WebSocket generation it was submitted under
+        self._foreign = OrderedDict() # prompt_ids queued under another client ID (keys only)
+        self._seen_generation = None # Generation at the last bulk check
+        self._last_bulk = 0 # time.time() of the last bulk check
+
+    def track(self, prompt_id, poll_interval, generation):
+        """Returns the future of prompt_id, creating it on the first of its waiters (see _PromptTracker.track)."""
+        future = self.futures.get(prompt_id)
+        if future is None:
+            future = self.futures[prompt_id] = self._new_future()
+            if prompt_id in self._recent:
+                self._signalled[prompt_id] = self._recent[prompt_id]
+            else:
+                # Unless the same socket has been up since submission (so its completion
+                # can't have been missed), check whether the prompt already finished.
+                submitted = self._submitted.pop(prompt_id, None)
+                if submitted is None or submitted != generation:
+                    self._fresh.add(prompt_id)
+        count, interval = self._waiters.get(prompt_id, (0, poll_interval))
+        self._waiters[prompt_id] = (count + 1, _faster_interval(interval, poll_interval))
+        return future
+
+    def untrack(self, prompt_id):
+        count, interval = self._waiters.get(prompt_id, (1, None))
+        if count > 1:
+            self._waiters[prompt_id] = (count - 1, interval)
+            return
+        self._waiters.pop(prompt_id, None)
+        self.futures.pop(prompt_id, None)
+        self._signalled.pop(prompt_id, None)
+        self._fresh.discard(prompt_id)
+        self._due.pop(prompt_id, None)
+        self._misses.pop(prompt_id, None)
+
+    def submitted(self, prompt_id, submit_generation, generation):
+        """
+        Records that prompt_id was queued under the WebSocket generation submit_generation. A prompt
+        that is already tracked (e.g. one that was held by a feeder) is checked against history
+        unless that same socket is still up; returns True if it now needs a check.
+        """
+        if prompt_id in self.futures:
+            if submit_generation is None or submit_generation != generation:
+                self._fresh.add(prompt_id)
+                return True
+            return False
+        if submit_generation is not None:
+            _bounded_put(self._submitted, prompt_id, submit_generation, self.RECENT_LIMIT)
+        return False
+
+    def foreign(self, prompt_ids):
+        """Records prompts queued under another client ID, which are polled even while the socket is up."""
+        for prompt_id in prompt_ids:
+            _bounded_put(self._foreign, prompt_id, None, self.RECENT_LIMIT)
+
+    def finished(self, prompt_id, error):
+        """
+        Records that prompt_id finished (error is None on success). Returns None if the report is
+        ignored, else True if a tracked prompt was signalled and False if nobody waits for it.
+        """
+        if isinstance(self._recent.get(prompt_id), CancelledError):
+            return None # The interrupt of a cancelled prompt is reported too; late waiters see the cancel
+        _bounded_put(self._recent, prompt_id, error, self.RECENT_LIMIT)
+        if prompt_id not in self.futures:
+            return False
+        self._signalled[prompt_id] = error
+        return True
+
+    def resolving(self, prompt_id):
+        """Returns the future of prompt_id (None if untracked), whose outcome is about to be set."""
+        self._fresh.discard(prompt_id)
+        return self.futures.get(prompt_id)
+
+    def _unfinished(self, prompt_id):
+        future = self.futures.get(prompt_id)
+        return future is not None and not future.done()
+
+    def _checkable(self, prompt_id):
+        return self._unfinished(prompt_id) and not self._is_held(prompt_id)
+
+    def _polled(self, prompt_id, generation):
+        """True if prompt_id is checked on a schedule: while the socket is down, or always if it is foreign."""
+        return generation is None or prompt_id in self._foreign
+
+    def ready(self, generation):
+        """True if the next tick has work without waiting: reported or new prompts, or a socket that went up or down."""
+        return bool(self._signalled or self._fresh) or generation != self._seen_generation
+
+    def wait_time(self, generation):
+        """Seconds until the earliest scheduled check or, while the socket is up, the next reconcile."""
+        now = time.monotonic()
+        due = [self._due.get(pid, 0) for pid in self.futures if self._checkable(pid) and self._polled(pid, generation)]
+        timeout = (min(due) if due else now + _MAX_POLL_INTERVAL) - now
+        if generation is not None:
+            timeout = min(timeout, self._last_bulk + self.RECONCILE_INTERVAL - time.time())
+        return max(0, timeout)
+
+    def take(self, generation):
+        """
+        Starts a tick. Returns (errors, confirm): {prompt_id: error} for failures the socket
+        reported, to resolve right away, and the prompts to check against history: those it
+        reported finished, newly tracked ones, every pending one after the socket went up or down
+        (messages may have been missed) or on the reconcile timer, and polled ones that are due.
+        """
+        signalled, self._signalled = self._signalled, {}
+        confirm, self._fresh = set(self._fresh), set()
+        errors = {}
+        for pid, error in signalled.items():
+            if error is not None:
+                errors[pid] = error
+            else:
+                confirm.add(pid)
+        pending = [pid for pid in self.futures if self._checkable(pid)]
+        if generation != self._seen_generation or (generation is not None and time.time() - self._last_bulk >= self.RECONCILE_INTERVAL):
+            self._seen_generation = generation
+            self._last_bulk = time.time()
+            confirm.update(pending)
         else:
-            print(f"History not yet available for {prompt_id}. Continuing poll.")
-
-        time.sleep(poll_interval)
+            horizon = time.monotonic() + _MIN_POLL_INTERVAL # Checks due shortly are made now, together
+            confirm.update(pid for pid in pending if self._due.get(pid, 0) <= horizon and self._polled(pid, generation))
+        return errors, [pid for pid in confirm if pid not in errors and self._checkable(pid)]
+
+    def adaptive(self, prompt_ids, generation):
+        """True if any of prompt_ids is still polled on the adaptive schedule, which needs the /queue."""
+        return any(self._unfinished(pid) and self._polled(pid, generation) and self._waiters.get(pid, (0, None))[1] is None
+                   for pid in prompt_ids)
+
+    def schedule(self, prompt_ids, generation, etas):
+        """Sets the next check of each of prompt_ids that is still pending and polled (see _poll_delay)."""
+        now = time.monotonic()
+        for pid in prompt_ids:
+            if not self._unfinished(pid) or not self._polled(pid, generation):
+                continue
+            interval = self._waiters.get(pid, (0, None))[1]
+            if interval is None:
+                interval, self._misses[pid] = _poll_delay(etas.get(pid), self._misses.get(pid, 0))
+            self._due[pid] = now + interval
+
+def _completions(prompt_ids, found, execution_stats):
+    """
+    Returns (prompt_id, history, error) for each of prompt_ids that has a history entry in found,
+    i.e. has finished (ComfyUI only writes history then), and records its execution time.
+    """
+    finished = []
+    for pid in prompt_ids:
+        prompt_history = found.get(pid)
+        if prompt_history:
+            execution_stats.record(pid, prompt_history)
+            finished.append((pid, prompt_history, _history_error(pid, prompt_history)))
+    return finished
 
-    if status_callback: status_callback(prompt_id, "timeout")
-    raise TimeoutError(f"Polling timed out after {max_wait_time} seconds for prompt_id: {prompt_id}")
+class _PromptTracker:
+    """
+    Single scheduler that tracks every pending prompt of one client.
+
+    `track(prompt_id)` returns a Future that resolves to the prompt's history entry or
+    raises ExecutionError. Completions reported by the WebSocket watcher are confirmed
+    with one history fetch per tick for all of them; on a slow reconcile timer while the
+    socket is up, one thread checks all pending prompts with a single
+    `/history?max_items=N` request plus one `/queue` request, so the request rate stays
+    flat no matter how many prompts are pending.
+
+    While the socket is down each prompt is checked on its own schedule: from its position
+    in `/queue` and the execution times of earlier prompts with the same workflow structure
+    (`_ExecutionStats`), checks are rare while it is deep in the queue and tighten as its
+    expected finish nears (`_poll_delay`). Prompts due around the same time share a check.
+    A waiter's explicit poll_interval replaces the schedule with a fixed one.
+    The bookkeeping lives in `_PendingPrompts`, guarded by `_cond`.
+    """
 
+    def __init__(self, client):
+        self._client = client
+        self._cond = threading.Condition()
+        self._pending = _PendingPrompts(concurrent.futures.Future, self._is_held)
+        self._listeners = []
+        self._stop = False
+        self._watcher = _PromptWatcher(client, self._on_finished, self._on_connected)
+        self._thread = threading.Thread(target=self._run, name="comfyapi-tracker", daemon=True)
+
+    def start(self):
+        self._watcher.start()
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._watcher.stop()
+        with self._cond:
+            self._stop = True
+            self._cond.notify_all()
+
+    def watch_generation(self):
+        """Returns the WebSocket generation if the watcher is connected, else None."""
+        return self._watcher.generation if self._watcher.connected else None
+
+    def note_submitted(self, prompt_id, generation):
+        """
+        Records that prompt_id was queued while the WebSocket connection `generation` was up
+        (None if it was down). A prompt that is already tracked (e.g. one that was held by a
+        feeder) is checked against history unless that same socket is still up.
+        """
+        with self._cond:
+            if self._pending.submitted(prompt_id, generation, self.watch_generation()):
+                self._cond.notify_all()
+
+    def note_foreign(self, prompt_ids):
+        """
+        Records prompts queued under another client ID (e.g. by a process that restarted). Their
+        completion is not reported on this socket, so they are polled even while it is up.
+        """
+        with self._cond:
+            self._pending.foreign(prompt_ids)
+            self._cond.notify_all()
+
+    def add_listener(self, listener):
+        """Calls listener(prompt_id) whenever a prompt is seen to finish, tracked or not."""
+        with self._cond:
+            self._listeners.append(listener)
+
+    def remove_listener(self, listener):
+        with self._cond:
+            if listener in self._listeners:
+                self._listeners.remove(listener)
+
+    def _notify_listeners(self, prompt_id):
+        with self._cond:
+            listeners = list(self._listeners)
+        for listener in listeners:
+            listener(prompt_id)
+
+    def _is_held(self, prompt_id):
+        """True if prompt_id is still held by the client's feeder, so the server can't know it yet."""
+        feeder = self._client.feeder
+        return feeder is not None and feeder.is_held(prompt_id)
+
+    def track(self, prompt_id, poll_interval=None):
+        """
+        Returns a Future for prompt_id. Pair every call with untrack(). Without a WebSocket the
+        prompt is checked every poll_interval seconds, or adaptively if it is None.
+        """
+        with self._cond:
+            future = self._pending.track(prompt_id, poll_interval, self.watch_generation())
+            self._cond.notify_all()
+            return future
+
+    def untrack(self, prompt_id):
+        with self._cond:
+            self._pending.untrack(prompt_id)
+
+    def _on_connected(self):
+        # Wakes the scheduler so it re-checks pending prompts against the new socket generation
+        with self._cond:
+            self._cond.notify_all()
+
+    def _on_finished(self, prompt_id, error):
+        with self._cond:
+            signalled = self._pending.finished(prompt_id, error)
+            if signalled is None:
+                return
+            if signalled:
+                self._cond.notify_all()
+        self._notify_listeners(prompt_id)
+
+    def _resolve(self, prompt_id, history=None, error=None):
+        with self._cond:
+            future = self._pending.resolving(prompt_id)
+        if history is not None:
+            self._client.history_cache.put(prompt_id, history)
+            self._client.submit_times.finished(prompt_id, history)
+        self._notify_listeners(prompt_id)
+        if future is None or future.done():
+            return
+        if error is not None:
+            future.set_exception(_report_error(error))
+        else:
+            future.set_result(history)
+
+    def _check(self, prompt_ids):
+        """
+        Checks prompt_ids against the server with as few requests as possible.
+        Returns the /queue response if one was fetched, else None.
+        """
+        client = self._client
+        queue_data = None
+        if len(prompt_ids) == 1:
+            prompt_history = client.get_history(prompt_ids[0])
+            found = {prompt_ids[0]: prompt_history} if prompt_history else {}
+        else:
+            found = client.get_history_bulk(len(prompt_ids) + _HISTORY_SLACK)
+            if found is None:
+                return None
+            missing = [pid for pid in prompt_ids if pid not in found]
+            if missing:
+                # Anything neither in the recent history window nor in the queue finished
+                # longer ago; look those up individually.
+                queue_data = client.get_queue()
+                for pid in _unqueued(missing, queue_data):
+                    prompt_history = client.get_history(pid)
+                    if prompt_history:
+                        found[pid] = prompt_history
+        for pid, prompt_history, error in _completions(prompt_ids, found, client.execution_stats):
+            self._resolve(pid, prompt_history, error)
+        return queue_data
+
+    def _schedule(self, prompt_ids, generation, queue_data=None):
+        """Sets the next check of each of prompt_ids that is still pending and polled (see _poll_delay)."""
+        with self._cond:
+            adaptive = self._pending.adaptive(prompt_ids, generation)
+        if adaptive and queue_data is None:
+            queue_data = self._client.get_queue()
+        etas = self._client.execution_stats.etas(queue_data) if queue_data is not None else {}
+        with self._cond:
+            self._pending.schedule(prompt_ids, generation, etas)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._stop and not self._pending.futures:
+                    self._cond.wait()
+                if self._stop:
+                    return
+                generation = self.watch_generation()
+                if not self._pending.ready(generation): # Woken early by new work or _on_connected
+                    self._cond.wait(timeout=self._pending.wait_time(generation))
+                if self._stop:
+                    return
+                generation = self.watch_generation()
+                errors, confirm = self._pending.take(generation)
+            for pid, error in errors.items():
+                self._resolve(pid, error=error)
+            if confirm:
+                queue_data = None
+                try:
+                    queue_data = self._check(confirm)
+                except ComfyAPIError as e:
+                    _logger.warning("History check failed, will retry: %s", e)
+                self._schedule(confirm, generation, queue_data)
 
 # --- Batch Processing ---
 
@@ -253,11 +1013,8 @@ def _generate_random_seeds(num_seeds):
         raise ValueError("num_seeds must be a positive integer.")
     return [random.randint(_MIN_SEED, _MAX_SEED) for _ in range(num_seeds)]
 
-def _batch_submit_internal(workflow, seed_node_path, seeds=None, num_seeds=None):
-    """
-    Internal function to submit multiple prompts with varying seeds.
-    Accepts either an explicit list of seeds or a number of seeds to generate.
-    """
+def _resolve_seed_list(seed_node_path, seeds=None, num_seeds=None):
+    """Validates batch arguments and returns the list of seeds to submit."""
     if seeds is not None and num_seeds is not None:
         raise ValueError("Provide either 'seeds' list or 'num_seeds', not both.")
 
@@ -267,179 +1024,973 @@ def _batch_submit_internal(workflow, seed_node_path, seeds=None, num_seeds=None)
         seed_list = seeds
     elif num_seeds is not None:
         seed_list = _generate_random_seeds(num_seeds)
-        print(f"Generated {num_seeds} random seeds: {seed_list}")
+        _logger.debug("Generated %s random seeds: %s", num_seeds, seed_list)
     else:
         raise ValueError("Must provide either 'seeds' list or 'num_seeds'.")
 
     if not isinstance(seed_node_path, list) or len(seed_node_path) < 2:
          # Example: ["3", "inputs", "seed"]
         raise ValueError("seed_node_path must be a list specifying the path to the seed input.")
+    return seed_list
 
-    uids = []
-    for seed in seed_list:
-        # Create a deep copy to avoid modifying the original workflow
-        wf_copy = copy.deepcopy(workflow)
-
-        # Navigate the path and set the seed
-        try:
-            target = wf_copy
-            for key in seed_node_path[:-1]:
-                target = target[key]
-            target[seed_node_path[-1]] = seed
-        except (KeyError, TypeError) as e:
-            raise ValueError(f"Invalid seed_node_path {seed_node_path} for workflow structure: {e}")
-
-        # Queue the modified workflow
-        try:
-            uid = _queue_prompt(wf_copy)
-            uids.append(uid)
-            print(f"Queued prompt with seed {seed}, UID: {uid}")
-            time.sleep(0.1) # Small delay between submissions
-        except ComfyAPIError as e:
-            print(f"Failed to queue prompt for seed {seed}: {e}. Stopping batch.")
-            # Optionally: Decide whether to continue or stop the whole batch on error
-            raise QueueError(f"Failed during batch submission for seed {seed}: {e}")
-    return uids
-
-def _wait_and_get_all_outputs_internal(uids, status_callback=None):
-    """
-    Waits for multiple UIDs and fetches their outputs concurrently.
-    Returns results as a list of (filename, url) tuples and errors as a list of error objects/strings.
-    """
-    results_list = []
-    errors_list = [] # Changed from dict to list for errors
-    threads = []
-    result_queue = Queue() # Thread-safe queue for results/errors
-
-    def worker(uid):
+def _submit_variants(submit_bytes, template, variants, concurrency=4):
+    """
+    Submits one prompt per dict of slot values in `variants` through a bounded worker pool,
+    calling submit_bytes(prompt_bytes) for each. `variants` may be any iterable (e.g. a
+    generator); it is consumed lazily, so only a few rendered prompts exist at any time.
+    Yields one dict per variant as soon as its UID is assigned (in completion order):
+    {'index': i, 'values': values, 'uid': uid, 'status': 'success'} or
+    {'index': i, 'values': values, 'error': exc, 'status': 'error'}, where i is the variant's position.
+    A failed submission is reported and does not stop the rest of the batch.
+    """
+    if not isinstance(concurrency, int) or concurrency <= 0:
+        raise ValueError("concurrency must be a positive integer.")
+
+    def submit(values):
+        return submit_bytes(template.render_prompt(**values))
+
+    variant_iter = enumerate(variants)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="comfyapi-submit") as pool:
+        # Keep a bounded number of submissions in flight so huge batches stay cheap
+        pending = {}
+        for index, values in variant_iter:
+            pending[pool.submit(submit, values)] = (index, values)
+            if len(pending) >= concurrency * 2:
+                break
+        while pending:
+            done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                index, values = pending.pop(future)
+                try:
+                    uid = future.result()
+                    _logger.debug("Queued prompt with %s, UID: %s", values, uid)
+                    yield {'index': index, 'values': values, 'uid': uid, 'status': 'success'}
+                except ComfyAPIError as e:
+                    _logger.warning("Failed to queue prompt with %s: %s", values, e)
+                    yield {'index': index, 'values': values, 'error': e, 'status': 'error'}
+                for index, values in itertools.islice(variant_iter, 1):
+                    pending[pool.submit(submit, values)] = (index, values)
+
+def _submit_seeds(submit_bytes, workflow, seed_node_path, seeds=None, num_seeds=None, concurrency=4):
+    """
+    Submits multiple prompts with varying seeds through submit_bytes and a bounded worker pool.
+    Yields one dict per seed as soon as its UID is assigned (in completion order):
+    {'index': i, 'seed': seed, 'uid': uid, 'status': 'success'} or
+    {'index': i, 'seed': seed, 'error': exc, 'status': 'error'}, where i is the seed's position.
+    A failed submission is reported and does not stop the rest of the batch.
+    """
+    seed_list = _resolve_seed_list(seed_node_path, seeds, num_seeds)
+    # Compiling validates the path up front, so a bad path fails before anything is queued
+    template = WorkflowTemplate(workflow, seed=seed_node_path)
+    for outcome in _submit_variants(submit_bytes, template, ({'seed': seed} for seed in seed_list), concurrency):
+        outcome['seed'] = outcome.pop('values')['seed']
+        yield outcome
+
+def _collect_batch(outcomes):
+    """
+    Returns the UIDs of the successful submissions among iter-batch outcomes, in seed order.
+    Failed seeds are reported but skipped; QueueError is raised only if every submission failed.
+    """
+    outcomes = sorted(outcomes, key=lambda outcome: outcome['index'])
+    errors = [outcome for outcome in outcomes if outcome['status'] == 'error']
+    if errors:
+        _logger.warning("%s of %s batch submissions failed: %s", len(errors), len(outcomes), [str(o['error']) for o in errors])
+        if len(errors) == len(outcomes):
+            raise _report_error(QueueError(f"Failed during batch submission for seed {errors[0]['seed']}: {errors[0]['error']}"))
+    return [outcome['uid'] for outcome in outcomes if outcome['status'] == 'success']
+
+def _sweep_variants(params, mode="product"):
+    """
+    Expands sweep parameters into slot-value dicts.
+    `params` maps a name to (node_path, values). mode="product" yields the cartesian product
+    of all value lists, mode="zip" pairs them up position by position (lists must be equal length).
+    Values must be hashable and every combination unique, since sweep results are keyed by them.
+    Returns (slots, variants) where slots maps names to paths and variants is a lazy generator.
+    """
+    if not params:
+        raise ValueError("params must map at least one name to (node_path, values).")
+    names = list(params)
+    slots = {}
+    value_lists = []
+    for name in names:
         try:
-            if status_callback: status_callback(uid, "started")
-            # _wait_for_finish_single now returns (filename, url)
-            filename, output_url = _wait_for_finish_single(uid, status_callback=status_callback)
-            result_queue.put({'uid': uid, 'filename': filename, 'url': output_url, 'status': 'success'})
-        except Exception as e:
-            print(f"Error processing UID {uid}: {e}")
-            result_queue.put({'uid': uid, 'error': e, 'status': 'error'})
-
-    for uid in uids:
-        thread = threading.Thread(target=worker, args=(uid,))
-        threads.append(thread)
-        thread.start()
-
-    # Wait for all threads to complete
-    for thread in threads:
-        thread.join()
-
-    # Collect results from the queue
-    while not result_queue.empty():
-        item = result_queue.get()
-        if item['status'] == 'success':
-            # Append (filename, url) tuple to the list
-            results_list.append((item['filename'], item['url']))
-        else:
-            # Append the error object/string to the errors list
-            errors_list.append(item['error'])
+            path, values = params[name]
+        except (TypeError, ValueError):
+            raise ValueError(f"Sweep parameter '{name}' must be a (node_path, values) pair.")
+        values = list(values)
+        if not values:
+            raise ValueError(f"Sweep parameter '{name}' has no values.")
+        # Results are keyed by the value tuples, so check them before anything is submitted
+        for value in values:
+            try:
+                hash(value)
+            except TypeError:
+                raise ValueError(f"Sweep parameter '{name}' has an unhashable value {value!r}; "
+                                 "use a tuple instead of a list (e.g. for a node link).")
+        if mode == "product" and len(set(values)) != len(values):
+            raise ValueError(f"Sweep parameter '{name}' has duplicate values.")
+        slots[name] = path
+        value_lists.append(values)
+    if mode == "product":
+        combos = itertools.product(*value_lists)
+    elif mode == "zip":
+        if len({len(values) for values in value_lists}) != 1:
+            raise ValueError("All value lists must have the same length for mode='zip'.")
+        if len(set(zip(*value_lists))) != len(value_lists[0]):
+            raise ValueError("mode='zip' pairs up the same values more than once.")
+        combos = zip(*value_lists)
+    else:
+        raise ValueError(f"Unknown sweep mode '{mode}'; use 'product' or 'zip'.")
+    return slots, (dict(zip(names, combo)) for combo in combos)
+
+def _split_outcomes(outcomes):
+    """
+    Splits a UID -> outcome dict into a list of (filename, url) results and a list of errors,
+    logging a summary of the errors.
+    """
+    results_list = [outcome for outcome in outcomes.values() if not isinstance(outcome, Exception)]
+    errors_list = [outcome for outcome in outcomes.values() if isinstance(outcome, Exception)]
 
     if errors_list:
         # Log the errors that occurred
         error_summary = [str(err) for err in errors_list]
-        print(f"Errors occurred during batch processing: {error_summary}")
+        _logger.warning("Errors occurred during batch processing: %s", error_summary)
         # Returning both successful results and the list of errors
 
     return results_list, errors_list # Return list for results and list for errors
 
+# --- Downloads ---
 
-# --- Public Function Wrappers (To be called from __init__.py) ---
-# These might call the internal functions directly or add extra logic
+def _resolve_download_path(output_url, save_path=".", filename=None):
+    """
+    Determines where an output should be saved, creating save_path if needed.
+    Uses the given filename, else the `filename` query parameter of output_url,
+    else a generated fallback name. Only the basename is ever used.
+    """
+    # Only create the directory if a specific path (not "" or ".") is provided
+    if save_path and save_path != ".":
+        os.makedirs(save_path, exist_ok=True)
 
-def get_output_url(prompt_id):
-     """Gets the output URL for a completed prompt ID."""
-     # This might involve checking history again if the URL wasn't stored
-     # For simplicity now, assume wait_for_finish returns the filename
-     try:
-         filename = _wait_for_finish_single(prompt_id) # Re-poll if needed, or retrieve stored result
-         url, _ = _find_output(prompt_id)
-         return url
-     except ComfyAPIError as e:
-         raise HistoryError(f"Could not get output URL for {prompt_id}: {e}")
+    # Determine the target filename (user-provided or extracted)
+    target_filename = None
+    if filename:
+        target_filename = filename # Use user-provided name first
+    else:
+        # Attempt to extract filename from URL query parameters
+        try:
+            parsed_url = urllib.parse.urlparse(output_url)
+            query_params = urllib.parse.parse_qs(parsed_url.query)
+            extracted_filenames = query_params.get('filename', [])
+            if extracted_filenames:
+                target_filename = extracted_filenames[0] # Get raw filename first
+        except Exception:
+            pass # Ignore parsing errors, will use fallback
+
+    # If no filename extracted or provided, generate a fallback
+    if not target_filename:
+        target_filename = f"output_{_generate_client_id()}.unknown"
+
+    # ***Crucially, sanitize the filename AFTER determining it***
+    # This ensures only the final component is used as the filename.
+    final_basename = os.path.basename(target_filename)
+
+    # Construct the full path: use only the basename if save_path is "" or "."
+    if not save_path or save_path == ".":
+        return final_basename
+    return os.path.join(save_path, final_basename)
+
+_DOWNLOAD_CHUNK_SIZE = 256 * 1024
+_PARTIAL_SUFFIX = ".part"
+
+def _parse_content_range_start(value):
+    """Returns the first byte position of a 'bytes start-end/total' header, or None."""
+    try:
+        return int(value.split()[1].split("-")[0])
+    except (AttributeError, IndexError, ValueError):
+        return None
 
-def _download_output(output_url, save_path=".", filename=None):
+def _parse_content_range_total(value):
+    """Returns the total size of a 'bytes start-end/total' or 'bytes */total' header, or None."""
+    try:
+        return int(value.rsplit("/", 1)[1])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+# A partial download is resumed only with the validator of the response it was started from,
+# since ComfyUI reuses output filenames across runs
+def _resume_action(status, content_range, offset):
+    """
+    How to use the response to a download request for a `.part` file of `offset` bytes (sent with
+    Range and If-Range if offset is not 0): "complete" for a 416 whose total is offset (the .part
+    is already whole), "append" for a 206 that continues at offset, "write" for the whole file
+    (a 200, or a 206 from byte 0 of a fresh download), "restart" for a 416 or 206 that does not
+    fit the .part (discard it and ask again without Range), and None for a response that can't be used.
+    """
+    if status == 200:
+        return "write"
+    if not offset:
+        return "write" if status == 206 and _parse_content_range_start(content_range) == 0 else None
+    if status == 416:
+        return "complete" if _parse_content_range_total(content_range) == offset else "restart"
+    if status == 206:
+        return "append" if _parse_content_range_start(content_range) == offset else "restart"
+    return None
+
+_VALIDATOR_SUFFIX = ".validator"
+
+def _response_validator(headers):
+    """Returns what If-Range can use to resume this response later: a strong ETag, else Last-Modified, else None."""
+    etag = headers.get("ETag")
+    if etag and not etag.startswith("W/"):
+        return etag
+    return headers.get("Last-Modified")
+
+def _partial_state(part_path):
     """
-    Downloads the content from a ComfyUI output URL and saves it to a file.
+    Returns (size, validator) of a partial download to resume, or (0, None). A `.part` file
+    without a recorded validator may belong to an older output of the same name, so it is deleted.
+    """
+    size = os.path.getsize(part_path) if os.path.isfile(part_path) else 0
+    if not size:
+        return 0, None
+    try:
+        with open(part_path + _VALIDATOR_SUFFIX, encoding="utf-8") as f:
+            validator = f.read().strip()
+    except OSError:
+        validator = ""
+    if not validator:
+        _logger.debug("Discarding %s: no validator to resume it with", part_path)
+        _discard_partial(part_path)
+        return 0, None
+    return size, validator
+
+def _start_partial(part_path, validator):
+    """Records the validator of the response a `.part` file is being written from."""
+    if validator:
+        with open(part_path + _VALIDATOR_SUFFIX, "w", encoding="utf-8") as f:
+            f.write(validator)
+    elif os.path.exists(part_path + _VALIDATOR_SUFFIX):
+        os.remove(part_path + _VALIDATOR_SUFFIX)
+
+def _discard_partial(part_path):
+    for path in (part_path, part_path + _VALIDATOR_SUFFIX):
+        if os.path.exists(path):
+            os.remove(path)
+
+def _finish_partial(part_path, full_path):
+    """Moves a completed `.part` file into place and drops its validator."""
+    os.replace(part_path, full_path)
+    if os.path.exists(part_path + _VALIDATOR_SUFFIX):
+        os.remove(part_path + _VALIDATOR_SUFFIX)
+
+def _download_many(download_if_needed, results, save_path=".", concurrency=8):
+    """
+    Downloads (filename, url) results in parallel with download_if_needed(url, save_path, filename).
+    Returns (saved_paths, errors): saved paths in input order and a dict mapping each failed url to its exception.
+    """
+    unique = list(dict.fromkeys((filename, url) for filename, url in results))
+    saved_paths, errors = [], {}
+    if not unique:
+        return saved_paths, errors
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        futures = [(url, executor.submit(download_if_needed, url, save_path, filename)) for filename, url in unique]
+        for url, future in futures:
+            try:
+                saved_paths.append(future.result())
+            except Exception as e:
+                _logger.warning("Error downloading %s: %s", url, e)
+                errors[url] = e
+    return saved_paths, errors
+
+def _wait_and_download(wait_for_outputs, download_if_needed, uids, save_path=".", concurrency=8,
+                       status_callback=None, max_wait_time=600, on_output=None):
+    """
+    Waits for multiple UIDs with wait_for_outputs and downloads each output with
+    download_if_needed as soon as its prompt finishes, so downloads overlap with prompts
+    that are still running.
+    Returns (saved_paths, errors): saved paths in UID order and a dict mapping each failed UID
+    to the exception from its execution or its download.
+    """
+    uids = list(dict.fromkeys(uids))
+    downloads = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        def start_download(uid, outcome):
+            if on_output: on_output(uid, outcome)
+            if not isinstance(outcome, Exception):
+                filename, url = outcome
+                downloads[uid] = executor.submit(download_if_needed, url, save_path, filename)
+
+        outcomes = wait_for_outputs(uids, status_callback, max_wait_time, on_output=start_download)
+        saved_paths, errors = [], {}
+        for uid in uids:
+            if uid not in downloads:
+                errors[uid] = outcomes.get(uid)
+                continue
+            try:
+                saved_paths.append(downloads[uid].result())
+                if status_callback: status_callback(uid, "downloaded")
+            except Exception as e:
+                _logger.warning("Error downloading output of %s: %s", uid, e)
+                errors[uid] = e
+    return saved_paths, errors
 
-    Args:
-        output_url (str): The full URL to the output file (e.g., from find_output_url or wait_for_finish).
-        save_path (str): The directory where the file should be saved. Defaults to current dir.
-        filename (str, optional): The desired filename. If None, it attempts to extract
-                                  from the URL or generates a unique name.
+# --- Client ---
 
-    Returns:
-        str: The full path to the saved file.
+class ComfyClient:
+    """
+    Connection to one ComfyUI server.
 
-    Raises:
-        TimeoutError: If the download times out.
-        ComfyAPIError: For HTTP errors or file system errors.
-        ValueError: If output_url is invalid.
+    Holds everything that used to be module state: the base and WebSocket URLs, the client
+    ID, the pooled HTTP session, the completion tracker and the history and upload caches.
+    Create one ComfyClient per server to talk to several servers from the same process.
     """
-    if not output_url:
-        raise ValueError("output_url cannot be None or empty.")
 
-    full_path = None # Initialize full_path to ensure it's defined in case of early error
-    try:
-        # Only create the directory if a specific path (not "" or ".") is provided
-        if save_path and save_path != ".":
-            os.makedirs(save_path, exist_ok=True)
-
-        # Determine the target filename (user-provided or extracted)
-        target_filename = None
-        if filename:
-            target_filename = filename # Use user-provided name first
-        else:
-            # Attempt to extract filename from URL query parameters
-            try:
-                parsed_url = urllib.parse.urlparse(output_url)
-                query_params = urllib.parse.parse_qs(parsed_url.query)
-                extracted_filenames = query_params.get('filename', [])
-                if extracted_filenames:
-                    target_filename = extracted_filenames[0] # Get raw filename first
-            except Exception:
-                pass # Ignore parsing errors, will use fallback
-
-        # If no filename extracted or provided, generate a fallback
-        if not target_filename:
-            target_filename = f"output_{_generate_client_id()}.unknown"
-
-        # ***Crucially, sanitize the filename AFTER determining it***
-        # This ensures only the final component is used as the filename.
-        final_basename = os.path.basename(target_filename)
-
-        # Construct the full path: use only the basename if save_path is "" or "."
-        if not save_path or save_path == ".":
-            full_path = final_basename
-        else:
-            full_path = os.path.join(save_path, final_basename)
-        print(f"Saving to final path: {full_path}")
-
-        # Download the content
-        print(f"Downloading from {output_url} to {full_path}...")
-        response = requests.get(output_url, timeout=120) # Longer timeout for download
-        response.raise_for_status() # Raise HTTPError for bad responses (4xx or 5xx)
-
-        # Save the file
-        with open(full_path, 'wb') as f:
-            f.write(response.content)
-        print(f"Output saved to: {full_path}")
-        return full_path
-
-    except requests.exceptions.Timeout:
-        raise TimeoutError(f"Timeout downloading output from {output_url}")
-    except requests.exceptions.MissingSchema:
-         raise ValueError(f"Invalid URL format (Missing Schema): {output_url}")
-    except requests.exceptions.RequestException as e:
-        raise ComfyAPIError(f"HTTP error downloading output from {output_url}: {e}")
-    except IOError as e:
-        # Ensure full_path is sensible before including in error message
-        path_str = full_path if full_path else save_path
-        raise ComfyAPIError(f"File system error saving output to {path_str}: {e}")
-    except Exception as e: # Catch any other unexpected errors
-        raise ComfyAPIError(f"An unexpected error occurred during download: {e}")
\ No newline at end of file
+    def __init__(self, url=None, pool_size=10, retries=3, backoff_factor=0.5):
+        self._base_url = None
+        self._websocket_url = None
+        self._client_id = None
+        self._tracker = None
+        self._tracker_lock = threading.Lock()
+        self._session = None
+        self._session_lock = threading.Lock()
+        self._session_options = {"pool_size": pool_size, "retries": retries, "backoff_factor": backoff_factor}
+        self._upload_cache = {} # (base_url, sha256 hex digest, subfolder) -> image reference on the server
+        self._upload_lock = threading.Lock()
+        self.history_cache = _HistoryCache()
+        self.execution_stats = _ExecutionStats() # Execution time per workflow structure, for polling
+        self.feeder = None # _PromptFeeder that holds prompts for this client, if any
+        self.submit_times = _SubmitTimes()
+        if url:
+            self.set_base_url(url)
+
+    def __repr__(self):
+        return f"ComfyClient({self._base_url!r})"
+
+    # --- State Management ---
+
+    @property
+    def base_url(self):
+        """The server's base URL, or None if set_base_url() has not been called."""
+        return self._base_url
+
+    def set_base_url(self, url):
+        """Sets the base URL for the ComfyUI server and generates a client ID."""
+        try:
+            base_url, websocket_url = _extract_urls(url)
+        except ValueError as e:
+            raise _report_error(ConnectionError(f"Invalid server URL: {e}"))
+        self._base_url, self._websocket_url = base_url, websocket_url
+        self._client_id = _generate_client_id()
+        self._stop_tracker()
+        self.history_cache.clear()
+        _logger.info("ComfyAPI: Base URL set to %s, WebSocket URL to %s, Client ID: %s", self._base_url, self._websocket_url, self._client_id)
+
+    def configure_session(self, pool_size=None, retries=None, backoff_factor=None):
+        """
+        Configures the pooled HTTP session used for all requests to this server.
+
+        :param pool_size: Maximum number of keep-alive connections kept per host (default 10)
+        :param retries: Retries for connection errors, idempotent reads and 502/503/504 responses (default 3)
+        :param backoff_factor: Exponential backoff factor between retries in seconds (default 0.5)
+        """
+        with self._session_lock:
+            if pool_size is not None:
+                self._session_options["pool_size"] = pool_size
+            if retries is not None:
+                self._session_options["retries"] = retries
+            if backoff_factor is not None:
+                self._session_options["backoff_factor"] = backoff_factor
+            old_session, self._session = self._session, None
+        if old_session is not None:
+            old_session.close()
+
+    def close(self):
+        """Stops the completion tracker and closes the HTTP session."""
+        self._stop_tracker()
+        with self._session_lock:
+            old_session, self._session = self._session, None
+        if old_session is not None:
+            old_session.close()
+
+    def _get_session(self):
+        """Returns the client's HTTP session, creating it on first use."""
+        with self._session_lock:
+            if self._session is None:
+                self._session = _create_session(**self._session_options)
+            return self._session
+
+    def _get_base_url(self):
+        if not self._base_url:
+            raise _report_error(ComfyAPIError("Base URL not set. Call set_base_url() first."))
+        return self._base_url
+
+    def _get_websocket_url(self):
+        if not self._websocket_url:
+            raise _report_error(ComfyAPIError("WebSocket URL not set. Call set_base_url() first."))
+        return self._websocket_url
+
+    def _get_client_id(self):
+        if not self._client_id:
+            raise _report_error(ComfyAPIError("Client ID not generated. Call set_base_url() first."))
+        return self._client_id
+
+    # --- Core API Interaction ---
+
+    def open_websocket_connection(self, timeout=90):
+        """Opens a WebSocket connection registered under this client's ID."""
+        ws_url = f"{self._get_websocket_url()}?clientId={self._get_client_id()}"
+        ws = websocket.WebSocket()
+        try:
+            # Increased timeout for potentially slow connections
+            ws.connect(ws_url, timeout=timeout)
+            _logger.debug("WebSocket connected to %s", ws_url)
+            return ws
+        except (websocket.WebSocketException, ConnectionRefusedError, TimeoutError, OSError) as e:
+            raise _report_error(ConnectionError(f"Failed to connect WebSocket to {ws_url}: {e}"))
+
+    def queue_prompt(self, prompt):
+        """Queues a prompt using the configured base URL and client ID."""
+        with _span("serialize"):
+            prompt_bytes = _encode(prompt)
+        return self.queue_prompt_bytes(prompt_bytes)
+
+    def queue_prompt_bytes(self, prompt_bytes, prompt_id=None, front=False):
+        """
+        Queues an already JSON-encoded prompt (e.g. rendered from a WorkflowTemplate).
+        If prompt_id is given the server queues the prompt under that ID instead of picking one.
+        With front=True the server runs it before everything already pending.
+        """
+        base_url = self._get_base_url()
+        client_id = self._get_client_id()
+        data = _prompt_request(prompt_bytes, client_id, prompt_id, front)
+        url = f"{base_url}/prompt" # Changed from /api/prompt based on common ComfyUI setups
+        _logger.debug("Queueing prompt to %s with client ID %s", url, client_id)
+        tracker = self._tracker
+        generation = tracker.watch_generation() if tracker is not None else None
+
+        try:
+            with _span("submit"):
+                response = self._get_session().post(url, data=data, headers={'Content-Type': 'application/json'}, timeout=60)
+            response.raise_for_status()
+            queued_id = _queued_prompt_id(response.json())
+            _logger.debug("Prompt queued successfully. Prompt ID: %s", queued_id)
+            if tracker is not None:
+                tracker.note_submitted(queued_id, generation)
+            self.submit_times.add(queued_id)
+            return queued_id
+        except requests.exceptions.Timeout:
+            raise _report_error(TimeoutError(f"Timeout queueing prompt at {url}"))
+        except requests.exceptions.RequestException as e:
+            raise _report_error(QueueError(f"HTTP error queueing prompt at {url}: {e}"))
+        except json.JSONDecodeError:
+            raise _report_error(QueueError(f"Failed to decode JSON response from {url}"))
+
+    def get_history(self, prompt_id):
+        """
+        Fetches execution history for a given prompt_id.
+        Finished prompts are answered from the history cache without a request.
+        """
+        cached = self.history_cache.get(prompt_id)
+        if cached is not None:
+            return cached
+        base_url = self._get_base_url()
+        url = f"{base_url}/history/{prompt_id}"
+        try:
+            response = self._get_session().get(url, timeout=60)
+            response.raise_for_status()
+            history = response.json()
+            # The history is a dictionary where the key is the prompt_id
+            prompt_data = history.get(str(prompt_id))
+            self.history_cache.put(prompt_id, prompt_data)
+            if prompt_data:
+                self.submit_times.finished(prompt_id, prompt_data)
+            return prompt_data
+        except requests.exceptions.Timeout:
+            _logger.warning("Timeout fetching history for %s from %s", prompt_id, url)
+            return None # Indicate timeout, polling might continue
+        except requests.exceptions.RequestException as e:
+            # Don't raise immediately, allow polling to retry
+            _logger.warning("Error fetching history for %s from %s: %s", prompt_id, url, e)
+            return None
+        except json.JSONDecodeError:
+            _logger.warning("Failed to decode JSON history response from %s", url)
+            return None # Allow polling to retry
+
+    def get_history_bulk(self, max_items):
+        """
+        Fetches the most recent `max_items` history entries in one request.
+        Returns a dict keyed by prompt_id, or None if the request failed.
+        """
+        base_url = self._get_base_url()
+        url = f"{base_url}/history?max_items={int(max_items)}"
+        try:
+            response = self._get_session().get(url, timeout=60)
+            response.raise_for_status()
+            return response.json()
+        except requests.exceptions.RequestException as e:
+            _logger.warning("Error fetching history from %s: %s", url, e)
+            return None
+        except json.JSONDecodeError:
+            _logger.warning("Failed to decode JSON history response from %s", url)
+            return None
+
+    def get_queue(self, timeout=60):
+        """
+        Fetches the server queue.
+        Returns a dict with 'queue_running' and 'queue_pending' lists, or None if the request failed.
+        """
+        base_url = self._get_base_url()
+        url = f"{base_url}/queue"
+        try:
+            response = self._get_session().get(url, timeout=timeout)
+            response.raise_for_status()
+            return response.json()
+        except requests.exceptions.RequestException as e:
+            _logger.warning("Error fetching queue from %s: %s", url, e)
+            return None
+        except json.JSONDecodeError:
+            _logger.warning("Failed to decode JSON queue response from %s", url)
+            return None
+
+    # --- Outputs ---
+
+    def output_url(self, filename, subfolder="", folder_type="output"):
+        """Builds the /view URL of a file on this server."""
+        return _output_url(filename, subfolder, folder_type, self._get_base_url())
+
+    def find_output(self, prompt_id):
+        """
+        Finds the output image URL and filename for a completed job by checking its history.
+        Returns (url, filename) or (None, None) if not found.
+        """
+        history = self.get_history(prompt_id)
+        record = _first_output_image(_index_outputs(history, self._get_base_url()))
+        if record:
+            return record["url"], record["filename"]
+        return None, None
+
+    def find_all_outputs(self, prompt_id):
+        """Returns the output index (see _index_outputs) of a prompt from a single history fetch."""
+        return _index_outputs(self.get_history(prompt_id), self._get_base_url())
+
+    def finished_output(self, prompt_id, prompt_history, status_callback=None, all_outputs=False):
+        """
+        Returns (filename, output_url) for a finished prompt's history entry,
+        or its full output index (see _index_outputs) if all_outputs is True.
+        """
+        return _finished_output(prompt_id, prompt_history, self._get_base_url(), status_callback, all_outputs)
+
+    # --- Image Upload ---
+
+    def upload_image(self, image_path, subfolder=""):
+        """
+        Uploads a local image to the server's input folder via /upload/image, streaming it from disk.
+        Uploads are content-addressed: the server file is named after the image's SHA-256, and the
+        same content is never sent twice to the same server.
+        Returns the image reference to put in a LoadImage node (e.g. "subfolder/name.png").
+        """
+        if not os.path.isfile(image_path):
+            raise FileNotFoundError(f"Local image not found at: {image_path}")
+        base_url = self._get_base_url()
+        digest = _file_digest(image_path)
+        cache_key = (base_url, digest, subfolder)
+        with self._upload_lock:
+            cached = self._upload_cache.get(cache_key)
+        if cached:
+            _logger.debug("Image %s already uploaded as %s", image_path, cached)
+            return cached
+
+        filename = _upload_name(digest, image_path)
+        url = f"{base_url}/upload/image"
+        body = _MultipartFileStream({"overwrite": "true", "type": "input", "subfolder": subfolder}, "image", filename, image_path)
+        try:
+            _logger.debug("Uploading %s to %s as %s", image_path, url, filename)
+            response = self._get_session().post(url, data=body, headers={'Content-Type': body.content_type}, timeout=120)
+            response.raise_for_status()
+            result = response.json()
+        except requests.exceptions.Timeout:
+            raise _report_error(TimeoutError(f"Timeout uploading image to {url}"))
+        except requests.exceptions.RequestException as e:
+            raise _report_error(ComfyAPIError(f"HTTP error uploading image to {url}: {e}"))
+        except json.JSONDecodeError:
+            raise _report_error(ComfyAPIError(f"Failed to decode JSON response from {url}"))
+        finally:
+            body.close()
+        reference = _upload_reference(result, url)
+        with self._upload_lock:
+            self._upload_cache[cache_key] = reference
+        return reference
+
+    # --- Completion Tracking ---
+
+    def note_foreign(self, prompt_ids):
+        """Has the tracker poll prompt_ids, which were queued under another client ID (see resume())."""
+        prompt_ids = list(prompt_ids)
+        if prompt_ids:
+            self._get_tracker().note_foreign(prompt_ids)
+
+    def _get_tracker(self):
+        """Returns the completion tracker for this client's ID, starting it if needed."""
+        with self._tracker_lock:
+            if self._tracker is None:
+                self._get_client_id()
+                self._tracker = _PromptTracker(self).start()
+            return self._tracker
+
+    def _stop_tracker(self):
+        with self._tracker_lock:
+            if self._tracker is not None:
+                self._tracker.stop()
+                self._tracker = None
+
+    def track(self, prompt_id, poll_interval=None):
+        """
+        Returns a Future that resolves to prompt_id's history entry once it finishes
+        (or raises ExecutionError). Pair every call with untrack().
+        """
+        return self._get_tracker().track(prompt_id, poll_interval)
+
+    def untrack(self, prompt_id):
+        tracker = self._tracker
+        if tracker is not None:
+            tracker.untrack(prompt_id)
+
+    def _post_command(self, path, payload):
+        """POSTs a JSON command (e.g. a /queue delete or an /interrupt) to the server."""
+        url = f"{self._get_base_url()}{path}"
+        try:
+            response = self._get_session().post(url, json=payload, timeout=60)
+            response.raise_for_status()
+        except requests.exceptions.Timeout:
+            raise _report_error(TimeoutError(f"Timeout posting to {url}"))
+        except requests.exceptions.RequestException as e:
+            raise _report_error(QueueError(f"HTTP error posting to {url}: {e}"))
+
+    def cancel(self, prompt_ids):
+        """
+        Removes those of prompt_ids that are pending from the server queue and interrupts the
+        one that is running, then fails their waiters with CancelledError. Prompts that are not
+        in the queue (already finished, or never sent) are left alone.
+        Returns the set of prompt_ids that were cancelled.
+        """
+        prompt_ids = set(prompt_ids)
+        if not prompt_ids:
+            return set()
+        queue_data = self.get_queue()
+        if queue_data is None:
+            raise _report_error(ConnectionError(f"Could not read the queue of {self._get_base_url()}."))
+        running, pending = _queue_split(queue_data, prompt_ids)
+        if pending:
+            self._post_command("/queue", {"delete": sorted(pending)})
+            # One of them may have started meanwhile; deleting does not stop a running prompt
+            queue_data = self.get_queue()
+            if queue_data is not None:
+                running |= _queue_split(queue_data, pending)[0]
+        cancelled = running | pending
+        # Waiters are failed before the interrupt, whose execution error the server reports right away
+        for prompt_id in cancelled:
+            self.report_failed(prompt_id, CancelledError(f"Prompt {prompt_id} was cancelled."))
+        for prompt_id in running:
+            # Servers that predate targeted interrupts ignore prompt_id and stop whatever runs, which is this prompt
+            self._post_command("/interrupt", {"prompt_id": prompt_id})
+        if cancelled:
+            _logger.debug("Cancelled %s queued and %s running prompts", len(pending - running), len(running))
+        return cancelled
+
+    def report_failed(self, prompt_id, error):
+        """Fails every waiter of prompt_id with error, e.g. when a held prompt could not be queued."""
+        self._get_tracker()._on_finished(prompt_id, error)
+
+    def wait_for_finish(self, prompt_id, poll_interval=None, max_wait_time=600, status_callback=None, all_outputs=False):
+        """
+        Waits for a single prompt to finish using the client's completion tracker.
+        Returns a tuple containing (filename, output_url) upon success,
+        or the prompt's output index if all_outputs is True.
+        """
+        self._get_base_url()
+        start_time = time.time()
+        tracker = self._get_tracker()
+        future = tracker.track(prompt_id, poll_interval)
+
+        try:
+            while True:
+                remaining = max_wait_time - (time.time() - start_time)
+                if remaining <= 0:
+                    break
+                if status_callback:
+                     status_callback(prompt_id, "polling")
+                try:
+                    prompt_history = future.result(timeout=min(5, remaining)) # Update status every 5s
+                except concurrent.futures.TimeoutError:
+                    continue
+                except CancelledError:
+                    if status_callback: status_callback(prompt_id, "cancelled")
+                    raise
+                except ExecutionError as e:
+                    _logger.warning("Execution error for %s: %s", prompt_id, e)
+                    if status_callback: status_callback(prompt_id, "error")
+                    raise
+                return self.finished_output(prompt_id, prompt_history, status_callback, all_outputs)
+        finally:
+            tracker.untrack(prompt_id)
+
+        if status_callback: status_callback(prompt_id, "timeout")
+        raise _report_error(TimeoutError(f"Polling timed out after {max_wait_time} seconds for prompt_id: {prompt_id}"))
+
+    # --- Batch Processing ---
+
+    def iter_submit_variants(self, template, variants, concurrency=4):
+        """Submits one prompt per dict of slot values in `variants` to this server (see _submit_variants)."""
+        return _submit_variants(self.queue_prompt_bytes, template, variants, concurrency)
+
+    def iter_batch_submit(self, workflow, seed_node_path, seeds=None, num_seeds=None, concurrency=4):
+        """Submits one prompt per seed to this server, yielding each outcome as its UID is assigned (see _submit_seeds)."""
+        return _submit_seeds(self.queue_prompt_bytes, workflow, seed_node_path, seeds, num_seeds, concurrency)
+
+    def batch_submit(self, workflow, seed_node_path, seeds=None, num_seeds=None, concurrency=4):
+        """
+        Submits multiple prompts with varying seeds.
+        Accepts either an explicit list of seeds or a number of seeds to generate.
+        Returns the UIDs of the successful submissions in seed order. Failed seeds are
+        reported but skipped; QueueError is raised only if every submission failed.
+        """
+        return _collect_batch(self.iter_batch_submit(workflow, seed_node_path, seeds, num_seeds, concurrency))
+
+    def wait_for_outputs(self, uids, status_callback=None, max_wait_time=600, on_output=None):
+        """
+        Waits for multiple UIDs using the client's completion tracker (no thread per UID).
+        Returns a dict mapping each UID to its (filename, url) tuple or to the exception it failed with.
+        If given, on_output(uid, outcome) is called as soon as each prompt finishes, with its
+        (filename, url) tuple or the exception it failed with (timeouts are not reported).
+        """
+        outcomes = {}
+        tracker = self._get_tracker()
+        futures = {}
+        for uid in dict.fromkeys(uids):
+            if status_callback: status_callback(uid, "started")
+            futures[tracker.track(uid)] = uid
+
+        try:
+            not_done = set(futures)
+            deadline = time.time() + max_wait_time
+            while not_done:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                done, not_done = concurrent.futures.wait(not_done, timeout=remaining,
+                                                         return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    uid = futures[future]
+                    try:
+                        if future.exception() is not None:
+                            raise future.exception()
+                        outcomes[uid] = self.finished_output(uid, future.result(), status_callback)
+                    except CancelledError as e:
+                        if status_callback: status_callback(uid, "cancelled")
+                        outcomes[uid] = e
+                    except Exception as e:
+                        _logger.warning("Error processing UID %s: %s", uid, e)
+                        if status_callback and isinstance(e, ExecutionError): status_callback(uid, "error")
+                        outcomes[uid] = e
+                    if on_output: on_output(uid, outcomes[uid])
+            for future in not_done:
+                uid = futures[future]
+                if status_callback: status_callback(uid, "timeout")
+                outcomes[uid] = TimeoutError(f"Polling timed out after {max_wait_time} seconds for prompt_id: {uid}")
+        finally:
+            for uid in futures.values():
+                tracker.untrack(uid)
+        return outcomes
+
+    def wait_and_get_all_outputs(self, uids, status_callback=None, max_wait_time=600, on_output=None):
+        """
+        Waits for multiple UIDs and fetches their outputs.
+        All prompts are tracked by the client's completion tracker, so no thread is started per UID.
+        Returns results as a list of (filename, url) tuples and errors as a list of error objects/strings.
+        """
+        return _split_outcomes(self.wait_for_outputs(uids, status_callback, max_wait_time, on_output))
+
+    # --- Downloads ---
+
+    def download_output(self, output_url, save_path=".", filename=None, progress_callback=None, chunk_size=_DOWNLOAD_CHUNK_SIZE):
+        """
+        Downloads the content from a ComfyUI output URL and saves it to a file.
+
+        The response is streamed to `<path>.part` in chunks and renamed into place once complete,
+        so memory use is bounded by chunk_size and a partially written file never appears under
+        the final name. If a `.part` file is left from an interrupted download, or the connection
+        drops mid-transfer, the download resumes with a Range request, guarded by If-Range with the
+        ETag or Last-Modified of the first response (kept in `<path>.part.validator`), so a newer
+        output reusing the filename is downloaded from zero rather than spliced onto the old one.
+
+        Args:
+            output_url (str): The full URL to the output file (e.g., from find_output_url or wait_for_finish).
+            save_path (str): The directory where the file should be saved. Defaults to current dir.
+            filename (str, optional): The desired filename. If None, it attempts to extract
+                                      from the URL or generates a unique name.
+            progress_callback (callable, optional): Called as progress_callback(downloaded_bytes, total_bytes,
+                                      bytes_per_second) after each chunk; total_bytes is None if unknown.
+            chunk_size (int): Bytes read and written per chunk (default 256 KiB).
+
+        Returns:
+            str: The full path to the saved file.
+
+        Raises:
+            TimeoutError: If the download times out.
+            ComfyAPIError: For HTTP errors or file system errors.
+            ValueError: If output_url is invalid.
+        """
+        if not output_url:
+            raise ValueError("output_url cannot be None or empty.")
+
+        full_path = None # Initialize full_path to ensure it's defined in case of early error
+        try:
+            full_path = _resolve_download_path(output_url, save_path, filename)
+            part_path = full_path + _PARTIAL_SUFFIX
+            _logger.debug("Downloading from %s to %s...", output_url, full_path)
+
+            with _span("download"):
+                failures = 0 # Consecutive attempts that made no progress
+                while True:
+                    before = os.path.getsize(part_path) if os.path.isfile(part_path) else 0
+                    try:
+                        self._stream_to_file(output_url, part_path, progress_callback, chunk_size)
+                        break
+                    except (requests.exceptions.ConnectionError, requests.exceptions.ChunkedEncodingError, requests.exceptions.ReadTimeout) as e:
+                        after = os.path.getsize(part_path) if os.path.isfile(part_path) else 0
+                        failures = 0 if after > before else failures + 1
+                        if failures > self._session_options["retries"]:
+                            raise
+                        _logger.warning("Download of %s interrupted at %s bytes (%s), resuming...", output_url, after, e)
+                        time.sleep(self._session_options["backoff_factor"] * (2 ** max(failures - 1, 0)))
+
+            _finish_partial(part_path, full_path)
+            _logger.debug("Output saved to: %s", full_path)
+            return full_path
+
+        except requests.exceptions.Timeout:
+            raise _report_error(TimeoutError(f"Timeout downloading output from {output_url}"))
+        except requests.exceptions.MissingSchema:
+             raise ValueError(f"Invalid URL format (Missing Schema): {output_url}")
+        except requests.exceptions.RequestException as e:
+            raise _report_error(ComfyAPIError(f"HTTP error downloading output from {output_url}: {e}"))
+        except IOError as e:
+            # Ensure full_path is sensible before including in error message
+            path_str = full_path if full_path else save_path
+            raise _report_error(ComfyAPIError(f"File system error saving output to {path_str}: {e}"))
+        except ComfyAPIError:
+            raise
+        except Exception as e: # Catch any other unexpected errors
+            raise _report_error(ComfyAPIError(f"An unexpected error occurred during download: {e}"))
+
+    def _stream_to_file(self, output_url, part_path, progress_callback=None, chunk_size=_DOWNLOAD_CHUNK_SIZE):
+        """
+        Streams output_url into part_path, continuing from its current size when the server
+        honours a Range request. A body that ends short of Content-Length raises
+        ChunkedEncodingError so the caller resumes it like any other dropped connection.
+        """
+        offset, validator = _partial_state(part_path)
+        # If-Range makes the server send the whole file instead if it changed since the .part was started
+        headers = {"Range": f"bytes={offset}-", "If-Range": validator} if offset else {}
+        with self._get_session().get(output_url, headers=headers, stream=True, timeout=(10, 120)) as response:
+            action = _resume_action(response.status_code, response.headers.get("Content-Range"), offset)
+            if action == "complete":
+                return # The partial file is already complete
+            if action == "restart":
+                # The partial file is not a prefix of this output, or the server sent another range; start over
+                _discard_partial(part_path)
+                return self._stream_to_file(output_url, part_path, progress_callback, chunk_size)
+            response.raise_for_status() # Raise HTTPError for bad responses (4xx or 5xx)
+            if action is None:
+                raise _report_error(ComfyAPIError(f"Unexpected {response.status_code} response downloading {output_url}"))
+
+            if action == "append":
+                mode = 'ab'
+            else:
+                offset = 0 # Server sent the whole file
+                mode = 'wb'
+                _start_partial(part_path, _response_validator(response.headers))
+            length = response.headers.get("Content-Length")
+            total = offset + int(length) if length and length.isdigit() else None
+
+            downloaded = offset
+            started = time.monotonic()
+            with open(part_path, mode) as f:
+                for chunk in response.iter_content(chunk_size=chunk_size):
+                    f.write(chunk)
+                    downloaded += len(chunk)
+                    if progress_callback:
+                        elapsed = time.monotonic() - started
+                        rate = (downloaded - offset) / elapsed if elapsed > 0 else 0.0
+                        progress_callback(downloaded, total, rate)
+            _count("download_bytes", downloaded - offset)
+            if total is not None and downloaded < total:
+                raise requests.exceptions.ChunkedEncodingError(f"Connection closed after {downloaded} of {total} bytes")
+
+    def _remote_size(self, output_url):
+        """Returns the Content-Length reported by a HEAD request for output_url, or None if unknown."""
+        try:
+            response = self._get_session().head(output_url, timeout=10)
+            response.raise_for_status()
+        except requests.exceptions.RequestException:
+            return None
+        length = response.headers.get("Content-Length")
+        return int(length) if length and length.isdigit() else None
+
+    def download_if_needed(self, output_url, save_path=".", filename=None):
+        """Downloads output_url unless the target file already exists with the server's size."""
+        full_path = _resolve_download_path(output_url, save_path, filename)
+        if os.path.isfile(full_path) and self._remote_size(output_url) == os.path.getsize(full_path):
+            _logger.debug("Skipping %s: already downloaded", full_path)
+            return full_path
+        return self.download_output(output_url, save_path, filename)
+
+    def download_outputs(self, results, save_path=".", concurrency=8):
+        """
+        Downloads (filename, url) results in parallel over the pooled session.
+        Files that already exist with a matching size are skipped.
+        Returns (saved_paths, errors): saved paths in input order and a dict mapping each failed url to its exception.
+        """
+        return _download_many(self.download_if_needed, results, save_path, concurrency)
+
+    def wait_and_download_outputs(self, uids, save_path=".", concurrency=8, status_callback=None, max_wait_time=600, on_output=None):
+        """
+        Waits for multiple UIDs and downloads each output as soon as its prompt finishes,
+        so downloads overlap with prompts that are still running.
+        Returns (saved_paths, errors): saved paths in UID order and a dict mapping each failed UID
+        to the exception from its execution or its download.
+        """
+        return _wait_and_download(self.wait_for_outputs, self.download_if_needed, uids, save_path, concurrency,
+                                  status_callback, max_wait_time, on_output)
+
+
+# --- Default Client ---
+# The module-level functions below act on one shared ComfyClient. Managers own their own
+# client and never touch it.
+
+_default_client = ComfyClient()
+
+def set_base_url(url):
+    """Sets the base URL for the ComfyUI server and generates a client ID."""
+    _default_client.set_base_url(url)
+
+def configure_session(pool_size=None, retries=None, backoff_factor=None):
+    """
+    Configures the pooled HTTP session used for all ComfyUI requests.
+
+    :param pool_size: Maximum number of keep-alive connections kept per host (default 10)
+    :param retries: Retries for connection errors, idempotent reads and 502/503/504 responses (default 3)
+    :param backoff_factor: Exponential backoff factor between retries in seconds (default 0.5)
+    """
+    _default_client.configure_session(pool_size=pool_size, retries=retries, backoff_factor=backoff_factor)
+
+def get_output_url(prompt_id):
+     """Gets the output URL for a completed prompt ID."""
+     # This might involve checking history again if the URL wasn't stored
+     # For simplicity now, assume wait_for_finish returns the filename
+     try:
+         _default_client.wait_for_finish(prompt_id) # Re-poll if needed, or retrieve stored result
+         url, _ = _default_client.find_output(prompt_id)
+         return url
+     except ComfyAPIError as e:
+         raise _report_error(HistoryError(f"Could not get output URL for {prompt_id}: {e}"))
@@ -0,0 +1,721 @@
+"""
+Routing of prompts across several ComfyUI servers.
+
+`ComfyClusterManager` has the same workflow editing, submission, waiting and download
+methods as ComfyAPIManager, but spreads prompts over a list of servers. Each server is a
+separate ComfyClient with its own session, client ID and completion tracker.
+"""
+import concurrent.futures
+import functools
+import logging
+import threading
+import time
+import urllib.parse
+import uuid
+from collections import OrderedDict
+
+from .client import (
+    ComfyClient,
+    ComfyAPIError,
+    ConnectionError,
+    QueueError,
+    HistoryError,
+    ExecutionError,
+    TimeoutError,
+    CancelledError,
+    _submit_seeds,
+    _collect_batch,
+    _split_outcomes,
+    _download_many,
+    _wait_and_download,
+    _queued_prompt_ids,
+    _known_prompt_ids,
+    _is_server_failure,
+    _report_error,
+)
+from .template import _encode
+from .workflow import _WorkflowEditor
+from .jobs import _JobRegistry, _JobQueries
+from .feeder import _PromptFeeder, _check_priority
+from .instrumentation import _span
+
+_logger = logging.getLogger(__name__)
+
+
+class _Backend:
+    """Routing state of one server of a cluster."""
+    __slots__ = ("client", "healthy", "depth", "inflight", "checked_at", "down_since")
+
+    def __init__(self, client):
+        self.client = client
+        self.healthy = True
+        self.depth = 0 # Running + pending prompts at the last /queue check
+        self.inflight = 0 # Prompts this manager submitted since that check
+        self.checked_at = 0.0 # time.monotonic() of the last /queue check
+        self.down_since = None
+
+    @property
+    def load(self):
+        return self.depth + self.inflight
+
+
+class ComfyClusterManager(_WorkflowEditor, _JobQueries):
+    """
+    Runs workflows on several ComfyUI servers as one pool.
+
+    Every submission goes to the healthy server with the fewest running and pending prompts:
+    its /queue depth, re-read at most every `refresh_interval` seconds, plus what this manager
+    submitted to it since. The server that accepted a prompt is recorded in the job record
+    (`get_job(prompt_id).server`), and waiting, output lookups and downloads go back to it.
+
+    A server that stops answering is marked down and skipped until a /queue check succeeds
+    again. Submissions that fail because of the server are retried on another one, and
+    prompts still pending on a server that has been down for `failover_after` seconds are
+    re-submitted elsewhere while they are being waited for (they keep their original
+    prompt_id in this manager). A server that comes back may still run its copy.
+
+    With `max_queued` set, prompts are instead held locally and at most that many are queued
+    on each server at a time; each held prompt goes to the server with the fewest of them
+    in flight as soon as one has a free slot, by priority and fairly between tenants
+    (see ComfyAPIManager.submit_workflow).
+    """
+
+    _DOWN_RECHECK = 5 # Seconds between /queue checks of a server that is down
+    _QUEUE_TIMEOUT = 5 # Seconds a /queue check may take before the server counts as down
+    _WAIT_TICK = 1 # Seconds between health checks while waiting
+
+    def __init__(self, urls, pool_size=10, refresh_interval=1.0, failover_after=15, max_finished_jobs=10000,
+                 max_queued=None, tenant_weights=None, result_cache=None, journal=None):
+        if not urls:
+            raise ValueError("urls must list at least one ComfyUI server.")
+        self.workflow = None
+        self.refresh_interval = refresh_interval
+        self.failover_after = failover_after
+        self._backends = OrderedDict() # base_url -> _Backend
+        for url in urls:
+            client = ComfyClient(url, pool_size=pool_size)
+            self._backends[client.base_url] = _Backend(client)
+        self._lock = threading.Lock()
+        # (encoded prompt, priority) of pending jobs, kept so they can be re-submitted on failover
+        self._payloads = OrderedDict()
+        self._max_payloads = max_finished_jobs
+        self._reroutes = {} # prompt_id -> (server, prompt_id on that server) after a failover; server None while held
+        # Submitted jobs indexed by prompt_id; the oldest finished ones are evicted.
+        # With an opt-in JobJournal they are also recorded on disk for resume()
+        self._jobs = _JobRegistry(max_finished=max_finished_jobs, journal=journal)
+        self.max_queued = max_queued
+        self.tenant_weights = dict(tenant_weights or {})
+        self._feeder = None
+        self.result_cache = result_cache # See ComfyAPIManager
+        if result_cache is not None:
+            result_cache._attach()
+
+    @property
+    def clients(self):
+        """The ComfyClient of every server, in the order they were given."""
+        return [backend.client for backend in self._backends.values()]
+
+    def servers(self):
+        """Returns the routing state of every server: {'url', 'healthy', 'depth', 'inflight'}."""
+        with self._lock:
+            return [{"url": url, "healthy": b.healthy, "depth": b.depth, "inflight": b.inflight}
+                    for url, b in self._backends.items()]
+
+    def configure_session(self, pool_size=None, retries=None, backoff_factor=None):
+        """Sizes the pooled HTTP session of every server and sets its retry policy."""
+        for client in self.clients:
+            client.configure_session(pool_size=pool_size, retries=retries, backoff_factor=backoff_factor)
+
+    def set_max_queued(self, max_queued):
+        """Limits how many prompts sit in each server's queue at once (None for no limit)."""
+        self.max_queued = max_queued
+        if self._feeder is not None:
+            # Without a limit any prompts still held are sent right away
+            self._feeder.set_max_queued(max_queued or float("inf"))
+
+    def set_tenant_weight(self, tenant, weight):
+        """Gives tenant `weight` times the share of a weight-1 tenant within each priority class."""
+        with self._lock:
+            if self._feeder is not None:
+                self._feeder.set_tenant_weight(tenant, weight)
+            self.tenant_weights[tenant] = weight
+
+    def feeder_stats(self):
+        """
+        Returns {'held', 'queued', 'dispatched', 'completed', 'jobs_per_minute', 'wait'} for
+        prompts submitted with max_queued set, or None if none were (see ComfyAPIManager.feeder_stats).
+        """
+        return self._feeder.stats() if self._feeder is not None else None
+
+    def _get_feeder(self):
+        with self._lock:
+            if self._feeder is None:
+                self._feeder = _PromptFeeder(self.clients, self.max_queued, self.tenant_weights).start()
+            return self._feeder
+
+    def close(self):
+        """
+        Stops the feeder and every server's completion tracker and closes the HTTP sessions, and
+        the result cache once no other manager uses it, and the journal. Prompts still held stay held in the journal, if any, so resume() can send them later.
+        """
+        journal, self._jobs.journal = self._jobs.journal, None
+        with self._lock:
+            feeder, self._feeder = self._feeder, None
+        if feeder is not None:
+            feeder.stop()
+        for client in self.clients:
+            client.close()
+        cache, self.result_cache = self.result_cache, None
+        if cache is not None:
+            cache._detach()
+        if journal is not None:
+            journal.close()
+
+    # --- Routing ---
+
+    def _mark_down(self, backend):
+        """Takes a server out of rotation. Call with self._lock held."""
+        if backend.healthy:
+            _logger.warning("ComfyUI server %s is down, routing around it", backend.client.base_url)
+        backend.healthy = False
+        backend.checked_at = time.monotonic()
+        if backend.down_since is None:
+            backend.down_since = backend.checked_at
+
+    def _refresh(self, force=False):
+        """Re-reads the /queue depth of every server whose last check is due, in parallel."""
+        now = time.monotonic()
+        with self._lock:
+            stale = [b for b in self._backends.values()
+                     if force or now - b.checked_at >= (self.refresh_interval if b.healthy else self._DOWN_RECHECK)]
+            for backend in stale:
+                backend.checked_at = now # Claimed; concurrent callers keep using the last values
+        if not stale:
+            return
+        if len(stale) == 1:
+            results = [stale[0].client.get_queue(timeout=self._QUEUE_TIMEOUT)]
+        else:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=len(stale)) as pool:
+                results = list(pool.map(lambda b: b.client.get_queue(timeout=self._QUEUE_TIMEOUT), stale))
+        with self._lock:
+            for backend, queue_data in zip(stale, results):
+                if queue_data is None:
+                    self._mark_down(backend)
+                    continue
+                if not backend.healthy:
+                    _logger.info("ComfyUI server %s is back up", backend.client.base_url)
+                backend.healthy = True
+                backend.down_since = None
+                backend.depth = len(queue_data.get('queue_running', [])) + len(queue_data.get('queue_pending', []))
+                backend.inflight = 0
+
+    def _pick(self, exclude=()):
+        """Reserves a slot on the least-loaded healthy server not in exclude, or returns None."""
+        self._refresh()
+        with self._lock:
+            candidates = [b for url, b in self._backends.items() if b.healthy and url not in exclude]
+            if not candidates:
+                return None
+            backend = min(candidates, key=lambda b: b.load)
+            backend.inflight += 1
+            return backend
+
+    def _place(self, prompt_bytes, exclude=(), front=False, prompt_id=None):
+        """
+        Queues an encoded prompt (under prompt_id, if given) on the least-loaded healthy server,
+        moving on to the next one when a server fails. Returns (server, prompt_id).
+        """
+        tried = set(exclude)
+        last_error = None
+        while True:
+            backend = self._pick(exclude=tried)
+            if backend is None:
+                break
+            server = backend.client.base_url
+            try:
+                return server, backend.client.queue_prompt_bytes(prompt_bytes, prompt_id=prompt_id, front=front)
+            except ComfyAPIError as e:
+                with self._lock:
+                    backend.inflight = max(0, backend.inflight - 1)
+                    if _is_server_failure(e):
+                        self._mark_down(backend)
+                if not _is_server_failure(e):
+                    raise
+                _logger.warning("Server %s did not accept the prompt, trying another: %s", server, e)
+                tried.add(server)
+                last_error = e
+        if last_error is not None:
+            raise _report_error(QueueError(f"No ComfyUI server accepted the prompt: {last_error}"))
+        raise _report_error(ConnectionError("No healthy ComfyUI server available."))
+
+    def _submit_bytes(self, prompt_bytes, priority="normal", tenant=None):
+        """Queues an encoded prompt on the cluster (or holds it for the feeder) and tracks it in the manager queue."""
+        _check_priority(priority)
+        prompt_id, reused = self._claim_result(prompt_bytes)
+        if reused:
+            return prompt_id
+        if self.max_queued:
+            feeder = self._get_feeder()
+            prompt_id = prompt_id or str(uuid.uuid4())
+            server = None
+        else:
+            try:
+                server, prompt_id = self._place(prompt_bytes, front=(priority == "interactive"), prompt_id=prompt_id)
+            except ComfyAPIError:
+                if prompt_id is not None:
+                    self.result_cache.release(prompt_id)
+                raise
+        self._keep_payload(prompt_id, prompt_bytes, priority)
+        if server is None:
+            self._jobs.add(prompt_id, status="held", prompt_bytes=prompt_bytes, priority=priority, tenant=tenant)
+            feeder.enqueue(prompt_id, prompt_bytes, on_dispatch=self._on_dispatch, priority=priority, tenant=tenant)
+        else:
+            self._jobs.add(prompt_id, server=server, priority=priority, tenant=tenant)
+            if self.result_cache is not None:
+                self.result_cache.placed(prompt_id, server)
+        return prompt_id
+
+    def _keep_payload(self, prompt_id, prompt_bytes, priority):
+        with self._lock:
+            self._payloads[prompt_id] = (prompt_bytes, priority)
+            while len(self._payloads) > self._max_payloads:
+                self._payloads.popitem(last=False) # Oldest unfinished jobs can no longer fail over
+
+    def _resend(self, entries):
+        """Sends journaled prompts that never reached a server, under their original prompt_ids."""
+        prompts = self.journal.prompts([entry["prompt_id"] for entry in entries])
+        for entry in entries:
+            prompt_id = entry["prompt_id"]
+            self._reclaim_held(entry)
+            prompt_bytes = prompts.get(prompt_id)
+            if prompt_bytes is None:
+                self._jobs.mark_error(prompt_id, QueueError(f"The journal has no prompt for held prompt {prompt_id}."))
+                continue
+            self._keep_payload(prompt_id, prompt_bytes, entry["priority"])
+            if self.max_queued:
+                self._get_feeder().enqueue(prompt_id, prompt_bytes, on_dispatch=self._on_dispatch,
+                                           priority=entry["priority"], tenant=entry["tenant"])
+                continue
+            try:
+                server, _ = self._place(prompt_bytes, front=(entry["priority"] == "interactive"), prompt_id=prompt_id)
+            except ComfyAPIError as e:
+                self._jobs.mark_error(prompt_id, e)
+            else:
+                self._jobs.mark_dispatched(prompt_id, server)
+
+    def resume(self):
+        """
+        Re-attaches to the prompts recorded in this manager's journal by an earlier process and
+        returns all their prompt_ids in submission order (see ComfyAPIManager.resume). Prompts
+        on a server that is down are tracked there as if still queued; prompts whose server
+        is no longer part of the cluster fail with QueueError.
+        """
+        prompt_ids, sent, held = self._journaled()
+        self._refresh(force=True)
+        for server, entries in sent.items():
+            backend = self._backends.get(server)
+            on_server = [entry["server_prompt_id"] or entry["prompt_id"] for entry in entries]
+            if backend is None:
+                for entry in entries:
+                    self._restore_entry(entry, None)
+                continue
+            try:
+                known = _known_prompt_ids(backend.client, on_server)
+            except ConnectionError as e:
+                _logger.warning("Could not check the journaled prompts on %s: %s", server, e)
+                known = set(on_server)
+            backend.client.note_foreign(known)
+            for entry, server_prompt_id in zip(entries, on_server):
+                if entry["server_prompt_id"] is not None and server_prompt_id in known:
+                    with self._lock:
+                        self._reroutes[entry["prompt_id"]] = (server, server_prompt_id)
+                self._restore_entry(entry, server_prompt_id in known)
+        unsent = {entry["prompt_id"]: entry for entry in held}
+        for url, backend in self._backends.items():
+            if not unsent or not backend.healthy:
+                continue
+            try:
+                found = _known_prompt_ids(backend.client, unsent)
+            except ConnectionError:
+                continue
+            backend.client.note_foreign(found)
+            for prompt_id in found:
+                self._reclaim_held(unsent.pop(prompt_id), url)
+        self._resend(list(unsent.values()))
+        return prompt_ids
+
+    def _route(self, prompt_id):
+        """Returns (client, prompt_id on that server) for a job submitted here, or (None, prompt_id)."""
+        with self._lock:
+            rerouted = self._reroutes.get(prompt_id)
+        if rerouted is not None:
+            server, server_prompt_id = rerouted
+            return (self._backends[server].client if server is not None else None), server_prompt_id
+        job = self._jobs.get(prompt_id)
+        if job is not None and job.server in self._backends:
+            return self._backends[job.server].client, prompt_id
+        if job is not None and job.status == "held":
+            return None, prompt_id # Not on any server yet
+        return self._locate(prompt_id), prompt_id
+
+    def _locate(self, prompt_id):
+        """Finds the server that has prompt_id in its history or queue (for jobs no longer in the registry)."""
+        for backend in list(self._backends.values()):
+            if not backend.healthy:
+                continue
+            client = backend.client
+            if client.get_history(prompt_id):
+                return client
+            queue_data = client.get_queue(timeout=self._QUEUE_TIMEOUT)
+            if queue_data is not None and prompt_id in _queued_prompt_ids(queue_data):
+                return client
+        return None
+
+    def _held_as(self, prompt_id):
+        """Returns the feeder's prompt_id for a job held again after a failover, or None."""
+        with self._lock:
+            rerouted = self._reroutes.get(prompt_id)
+        return rerouted[1] if rerouted is not None and rerouted[0] is None else None
+
+    def _failover(self, prompt_id, server):
+        """
+        Re-submits a job pending on a dead server to another one, with its priority. With the
+        feeder running it is held again, ahead of the other held prompts of its class, so the
+        per-server limit still holds. Returns (client, new prompt_id), (None, new prompt_id) if
+        it is held, or None if it cannot be moved.
+        """
+        with self._lock:
+            payload = self._payloads.get(prompt_id)
+            feeder = self._feeder
+        if payload is None:
+            return None
+        prompt_bytes, priority = payload
+        if feeder is not None:
+            new_id = str(uuid.uuid4())
+            with self._lock:
+                self._reroutes[prompt_id] = (None, new_id)
+            try:
+                feeder.enqueue(new_id, prompt_bytes, on_dispatch=functools.partial(self._on_moved, prompt_id),
+                               priority=priority or "normal", first=True)
+            except ComfyAPIError as e:
+                with self._lock:
+                    self._reroutes.pop(prompt_id, None)
+                _logger.warning("Could not move prompt %s off %s: %s", prompt_id, server, e)
+                return None
+            _logger.info("Moved prompt %s off %s, holding it for another server (as %s)", prompt_id, server, new_id)
+            return None, new_id
+        try:
+            new_server, new_id = self._place(prompt_bytes, exclude={server}, front=(priority == "interactive"))
+        except ComfyAPIError as e:
+            _logger.warning("Could not move prompt %s off %s: %s", prompt_id, server, e)
+            return None
+        _logger.info("Moved prompt %s from %s to %s (now %s)", prompt_id, server, new_server, new_id)
+        with self._lock:
+            self._reroutes[prompt_id] = (new_server, new_id)
+        self._jobs.reassign(prompt_id, new_server, new_id)
+        return self._backends[new_server].client, new_id
+
+    def _on_moved(self, prompt_id, new_id, client, error):
+        """Feeder callback: a job moved off a dead server was queued on client as new_id, or rejected with error."""
+        if error is not None:
+            with self._lock:
+                self._reroutes.pop(prompt_id, None)
+            self._jobs.reassign(prompt_id, None)
+            self._record_outcome(prompt_id, error)
+            return
+        with self._lock:
+            self._reroutes[prompt_id] = (client.base_url, new_id)
+        self._jobs.reassign(prompt_id, client.base_url, new_id)
+
+    def _client_for_server(self, server):
+        with self._lock:
+            backend = self._backends.get(server)
+        return backend.client if backend is not None else None
+
+    def _down_too_long(self, client):
+        with self._lock:
+            backend = self._backends.get(client.base_url)
+            return (backend is not None and backend.down_since is not None
+                    and time.monotonic() - backend.down_since >= self.failover_after)
+
+    def _client_for_url(self, output_url):
+        """Returns the client of the server an output URL points to (any client for other URLs)."""
+        parsed = urllib.parse.urlparse(output_url)
+        backend = self._backends.get(f"{parsed.scheme}://{parsed.netloc}")
+        return backend.client if backend is not None else next(iter(self._backends.values())).client
+
+    # --- Submission ---
+
+    def submit_workflow(self, priority="normal", tenant=None):
+        """
+        Submits the stored workflow to the least-loaded server and tracks it in the manager queue.
+        See ComfyAPIManager.submit_workflow for priority and tenant.
+        """
+        if self.workflow is None:
+            raise ValueError("No workflow loaded.")
+        with _span("serialize"):
+            prompt_bytes = _encode(self.workflow)
+        return self._submit_bytes(prompt_bytes, priority, tenant)
+
+    def submit_template(self, template, priority="normal", tenant=None, **values):
+        """Renders a WorkflowTemplate with the given slot values and submits it to the least-loaded server."""
+        prompt_id = self._submit_bytes(template.render_prompt(**values), priority, tenant)
+        if self.journal is not None:
+            self.journal.params(prompt_id, values)
+        return prompt_id
+
+    def iter_batch_submit(self, num_seeds=None, seeds=None, seed_node_path=["3", "inputs", "seed"], random_seeds=False, concurrency=4,
+                          priority="batch", tenant=None):
+        """
+        Submits one prompt per seed, each to the least-loaded server at that moment, and yields
+        each outcome as soon as its prompt_id is assigned (see ComfyAPIManager.iter_batch_submit).
+        """
+        if self.workflow is None:
+            raise ValueError("No workflow loaded.")
+        if random_seeds:
+            import random
+            seeds = [random.randint(0, 2**32 - 1) for _ in range(num_seeds)]
+        submit_bytes = functools.partial(self._submit_bytes, priority=priority, tenant=tenant)
+        return self._note_params(_submit_seeds(submit_bytes, self.workflow, seed_node_path, seeds=seeds,
+                                               num_seeds=(None if seeds else num_seeds), concurrency=concurrency))
+
+    def batch_submit(self, num_seeds=None, seeds=None, seed_node_path=["3", "inputs", "seed"], random_seeds=False, concurrency=4,
+                     priority="batch", tenant=None):
+        """
+        Like ComfyAPIManager.batch_submit, spreading the prompts over the servers.
+        Returns prompt_ids in seed order.
+        """
+        return _collect_batch(self.iter_batch_submit(num_seeds, seeds, seed_node_path, random_seeds, concurrency,
+                                                     priority, tenant))
+
+    # --- Waiting ---
+
+    def _wait_for_outputs(self, uids, status_callback=None, max_wait_time=600, on_output=None, all_outputs=False, poll_interval=None):
+        """
+        Waits for jobs on any server with each server's completion tracker, moving jobs off
+        servers that stay down. Returns a dict mapping each UID to its (filename, url) tuple
+        (or output index with all_outputs=True) or to the exception it failed with, and calls
+        on_output(uid, outcome) as each one finishes (timeouts are not reported).
+        """
+        outcomes = {}
+        tracked = {} # Future -> (uid, client, prompt_id on that server)
+        held = [] # UIDs the feeder has not sent to a server yet
+
+        def finish(uid, outcome):
+            outcomes[uid] = outcome
+            with self._lock:
+                self._payloads.pop(uid, None)
+            if on_output: on_output(uid, outcome)
+
+        def start(uid):
+            """Tracks uid on its server; returns False if it is still held."""
+            known = self._known_outcome(uid, all_outputs)
+            if known is not None:
+                finish(uid, known) # Cached, or never queued
+                return True
+            job = self._jobs.get(uid)
+            if (job is not None and job.status == "held") or self._held_as(uid) is not None:
+                return False
+            client, prompt_id = self._route(uid)
+            if client is None:
+                finish(uid, HistoryError(f"Prompt {uid} is not known to any server of this cluster."))
+                return True
+            tracked[client.track(prompt_id, poll_interval)] = (uid, client, prompt_id)
+            return True
+
+        for uid in dict.fromkeys(uids):
+            if status_callback: status_callback(uid, "started")
+            if not start(uid):
+                held.append(uid)
+
+        try:
+            deadline = time.time() + max_wait_time
+            while tracked or held:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                done, _ = concurrent.futures.wait(list(tracked), timeout=min(remaining, self._WAIT_TICK),
+                                                  return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    uid, client, prompt_id = tracked.pop(future)
+                    client.untrack(prompt_id)
+                    try:
+                        if future.exception() is not None:
+                            raise future.exception()
+                        finish(uid, client.finished_output(uid, future.result(), status_callback, all_outputs))
+                    except CancelledError as e:
+                        if status_callback: status_callback(uid, "cancelled")
+                        finish(uid, e)
+                    except Exception as e:
+                        _logger.warning("Error processing UID %s: %s", uid, e)
+                        if status_callback and isinstance(e, ExecutionError): status_callback(uid, "error")
+                        finish(uid, e)
+                if held:
+                    held = [uid for uid in held if not start(uid)]
+                    if not tracked:
+                        if held: time.sleep(min(self._WAIT_TICK, max(0, deadline - time.time())))
+                        continue
+                self._refresh()
+                for future, (uid, client, prompt_id) in list(tracked.items()):
+                    if not self._down_too_long(client):
+                        continue
+                    moved = self._failover(uid, client.base_url)
+                    if moved is None:
+                        continue
+                    del tracked[future]
+                    client.untrack(prompt_id)
+                    new_client, new_id = moved
+                    if new_client is None:
+                        held.append(uid) # Until the feeder sends it to another server
+                    else:
+                        tracked[new_client.track(new_id, poll_interval)] = (uid, new_client, new_id)
+            for uid in [uid for uid, _, _ in tracked.values()] + held:
+                if status_callback: status_callback(uid, "timeout")
+                outcomes[uid] = TimeoutError(f"Polling timed out after {max_wait_time} seconds for prompt_id: {uid}")
+        finally:
+            for uid, client, prompt_id in tracked.values():
+                client.untrack(prompt_id)
+        return outcomes
+
+    def wait_for_finish(self, prompt_id, poll_interval=None, max_wait_time=600, status_callback=None, all_outputs=False):
+        """
+        Waits for a single job on whichever server runs it.
+        Returns (filename, output_url), or the output index with all_outputs=True.
+        Updates the status in the manager queue.
+        """
+        outcome = self._wait_for_outputs([prompt_id], status_callback, max_wait_time, on_output=self._record_outcome,
+                                         all_outputs=all_outputs, poll_interval=poll_interval)[prompt_id]
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    def wait_and_get_all_outputs(self, uids, status_callback=None, max_wait_time=600):
+        """
+        Waits for multiple jobs across the servers and retrieves their outputs.
+        Returns (results, errors): a list of (filename, url) tuples and a list of exceptions.
+        """
+        return _split_outcomes(self._wait_for_outputs(uids, status_callback, max_wait_time, on_output=self._record_outcome))
+
+    def cancel(self, prompt_id):
+        """Cancels a submitted prompt on whichever server has it (see cancel_batch). Returns True if it was cancelled."""
+        return bool(self.cancel_batch([prompt_id]))
+
+    def cancel_batch(self, uids):
+        """
+        Cancels submitted prompts on the servers that have them: held prompts are dropped
+        locally, queued ones are removed from their server's queue and running ones are
+        interrupted. Their waiters fail with CancelledError (see ComfyAPIManager.cancel_batch).
+        Returns the cancelled UIDs, in the order given.
+        """
+        uids = list(dict.fromkeys(uids))
+        with self._lock:
+            feeder = self._feeder
+        cancelled = set()
+        if feeder is not None:
+            moved = {}
+            for uid in uids:
+                held_as = self._held_as(uid)
+                if held_as is not None:
+                    moved[held_as] = uid
+            cancelled = feeder.cancel(uids) | {moved[held_as] for held_as in feeder.cancel(moved)}
+        by_client = {} # client -> {prompt_id on that server: uid}
+        for uid in uids:
+            job = self._jobs.get(uid)
+            if uid in cancelled or (job is not None and job.status in ("finished", "error", "cancelled")):
+                continue
+            client, server_id = self._route(uid)
+            if client is not None:
+                by_client.setdefault(client, {})[server_id] = uid
+        for client, server_ids in by_client.items():
+            try:
+                cancelled.update(server_ids[server_id] for server_id in client.cancel(server_ids))
+            except ComfyAPIError as e:
+                _logger.warning("Could not cancel prompts on %s: %s", client.base_url, e)
+        self._mark_cancelled(cancelled)
+        with self._lock:
+            for uid in cancelled:
+                self._payloads.pop(uid, None)
+        return [uid for uid in uids if uid in cancelled]
+
+    def check_queue(self, prompt_id):
+        """
+        Checks the status of a submitted prompt_id on its server (non-blocking, single check).
+        Returns True if finished, False otherwise. Updates the queue status.
+        """
+        job = self._jobs.get(prompt_id)
+        if job is None:
+            return False  # Not found
+        if job.status == "finished":
+            return True
+        if job.status in ("held", "cancelled", "error"):
+            return False # Not sent to a server yet, or never will finish
+        client, server_id = self._route(prompt_id)
+        if client is None or not self._check_history(prompt_id, client.get_history(server_id), client._get_base_url()):
+            return False # Still running, or failed (its payload is kept for resubmission)
+        with self._lock:
+            self._payloads.pop(prompt_id, None)
+        return True
+
+    def find_output(self, prompt_id, with_filename=False, all_outputs=False):
+        """
+        Returns the output URL (and filename if with_filename=True) of a completed job from the
+        server that ran it, or its output index with all_outputs=True.
+        """
+        cached = self._cached_outcome(prompt_id, all_outputs)
+        if cached is not None:
+            if all_outputs:
+                return cached
+            filename, url = cached if isinstance(cached, tuple) else (None, None)
+            return (url, filename) if with_filename else url
+        client, server_id = self._route(prompt_id)
+        if all_outputs:
+            return client.find_all_outputs(server_id) if client is not None else {}
+        url, filename = client.find_output(server_id) if client is not None else (None, None)
+        if with_filename:
+            return url, filename
+        return url
+
+    # --- Files ---
+
+    def upload_image(self, image_path, subfolder=""):
+        """
+        Uploads a local image to every healthy server, since any of them may run the prompt.
+        The server-side name depends only on the content, so it is the same everywhere.
+        Returns the server-side image name.
+        """
+        with self._lock:
+            clients = [b.client for b in self._backends.values() if b.healthy]
+        if not clients:
+            raise _report_error(ConnectionError("No healthy ComfyUI server available."))
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(clients)) as pool:
+            names = list(pool.map(lambda client: client.upload_image(image_path, subfolder=subfolder), clients))
+        return names[0]
+
+    def set_image(self, node_id, image_path, input_name="image", subfolder=""):
+        """Uploads a local image to every server and points a LoadImage node at it."""
+        image_name = self.upload_image(image_path, subfolder=subfolder)
+        self.edit_workflow([str(node_id), "inputs", input_name], image_name)
+        return image_name
+
+    def _download_if_needed(self, output_url, save_path=".", filename=None):
+        return self._client_for_url(output_url).download_if_needed(output_url, save_path, filename)
+
+    def download_output(self, output_url, save_path=".", filename=None, progress_callback=None):
+        """Streams an output to save_path over the session of the server it came from (see ComfyAPIManager.download_output)."""
+        return self._client_for_url(output_url).download_output(output_url, save_path=save_path, filename=filename,
+                                                                progress_callback=progress_callback)
+
+    def download_outputs(self, results, save_path=".", concurrency=8):
+        """
+        Downloads a list of (filename, url) results in parallel, each over its server's session.
+        Returns (saved_paths, errors) where errors maps each failed url to its exception.
+        """
+        return _download_many(self._download_if_needed, results, save_path, concurrency)
+
+    def wait_and_download_outputs(self, uids, save_path=".", concurrency=8, status_callback=None, max_wait_time=600):
+        """
+        Waits for multiple jobs and downloads each output as soon as its job finishes.
+        Returns (saved_paths, errors) where errors maps each failed UID to its exception.
+        """
+        return _wait_and_download(self._wait_for_outputs, self._download_if_needed, uids, save_path, concurrency,
+                                  status_callback, max_wait_time, on_output=self._record_outcome)
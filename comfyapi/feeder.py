@@ -0,0 +1,399 @@
+"""
+Client-side submission queue with backpressure and priorities.
+
+ComfyUI accepts any number of prompts into its queue. Sending a large batch at once bloats
+the server's memory and its /queue and /history responses, and leaves nothing for the
+client to reorder. `_PromptFeeder` holds prompts locally instead and keeps only a few of
+them queued on each server, topping up as soon as one finishes. Held prompts are sent by
+priority class, and fairly between the tenants within a class (`_FairQueue`).
+"""
+import collections
+import heapq
+import itertools
+import logging
+import threading
+import time
+
+from .client import ComfyAPIError, CancelledError, _queued_prompt_ids, _is_server_failure, _report_error
+
+_logger = logging.getLogger(__name__)
+
+
+# Priority classes, most urgent first. Each class is sent strictly before the next one.
+_PRIORITIES = ("interactive", "normal", "batch")
+
+
+def _check_priority(priority):
+    if priority not in _PRIORITIES:
+        raise ValueError(f"priority must be one of {', '.join(_PRIORITIES)}, not {priority!r}.")
+
+
+class _HeldPrompt:
+    """A prompt waiting in the feeder."""
+    __slots__ = ("prompt_id", "prompt_bytes", "on_dispatch", "priority", "tenant", "enqueued_at", "tag")
+
+    def __init__(self, prompt_id, prompt_bytes, on_dispatch, priority, tenant):
+        self.prompt_id = prompt_id
+        self.prompt_bytes = prompt_bytes
+        self.on_dispatch = on_dispatch
+        self.priority = priority
+        self.tenant = tenant
+        self.enqueued_at = time.monotonic()
+        self.tag = 0.0 # Virtual finish time within its class
+
+
+class _FairQueue:
+    """
+    Held prompts ordered by priority class, then by weighted fair queuing between tenants.
+
+    Within a class each prompt gets the virtual finish time max(class clock, its tenant's
+    last finish time) + 1/weight, and the smallest is sent first. Tenants with weights 2 and
+    1 therefore share the sends 2:1 however many prompts each has queued, and a tenant that
+    was idle gets no backlog of credit. Not thread-safe; the feeder locks around it.
+    """
+
+    def __init__(self, weights=None):
+        self._heaps = {priority: [] for priority in _PRIORITIES}
+        self._clock = {priority: 0.0 for priority in _PRIORITIES}
+        self._last = {} # (priority, tenant) -> finish time of its last queued prompt
+        self._weights = dict(weights or {})
+        self._seq = itertools.count() # Keeps equal tags in arrival order
+        self._len = 0
+
+    def __len__(self):
+        return self._len
+
+    def set_weight(self, tenant, weight):
+        if weight <= 0:
+            raise ValueError("Tenant weight must be positive.")
+        self._weights[tenant] = weight
+
+    def count(self, priority):
+        return len(self._heaps[priority])
+
+    def push(self, entry):
+        key = (entry.priority, entry.tenant)
+        start = max(self._clock[entry.priority], self._last.get(key, 0.0))
+        entry.tag = start + 1.0 / self._weights.get(entry.tenant, 1)
+        self._last[key] = entry.tag
+        self.requeue(entry)
+
+    def push_front(self, entry):
+        """Queues a prompt ahead of every other prompt of its class (without charging its tenant)."""
+        entry.tag = self._clock[entry.priority]
+        self.requeue(entry)
+
+    def requeue(self, entry):
+        """Puts a popped prompt back in its old place."""
+        heapq.heappush(self._heaps[entry.priority], (entry.tag, next(self._seq), entry))
+        self._len += 1
+
+    def peek(self):
+        for priority in _PRIORITIES:
+            if self._heaps[priority]:
+                return self._heaps[priority][0][2]
+        return None
+
+    def pop(self):
+        entry = self.peek()
+        heapq.heappop(self._heaps[entry.priority])
+        self._len -= 1
+        self._clock[entry.priority] = max(self._clock[entry.priority], entry.tag)
+        key = (entry.priority, entry.tenant)
+        if self._last.get(key, 0.0) <= self._clock[entry.priority]:
+            self._last.pop(key, None) # Nothing of this tenant left in the class (a requeued prompt may be its last)
+        return entry
+
+    def remove(self, prompt_ids):
+        """Removes and returns the prompts whose IDs are in prompt_ids."""
+        removed = []
+        for priority, heap in self._heaps.items():
+            kept = [item for item in heap if item[2].prompt_id not in prompt_ids]
+            if len(kept) == len(heap):
+                continue
+            removed.extend(item[2] for item in heap if item[2].prompt_id in prompt_ids)
+            heapq.heapify(kept)
+            self._heaps[priority] = kept
+        self._len -= len(removed)
+        return removed
+
+    def drain(self):
+        """Removes and returns every prompt, in send order."""
+        entries = []
+        while self._len:
+            entries.append(self.pop())
+        return entries
+
+
+class _PromptFeeder:
+    """
+    Keeps at most `max_queued` of its prompts queued on each of `clients` and holds the rest.
+
+    Prompts get their prompt_id when they are enqueued (ComfyUI accepts a client-chosen ID),
+    so callers can wait on them straight away; the clients' trackers skip held prompts until
+    they are sent. A single thread sends the next held prompt to the client with the fewest
+    prompts in flight as soon as one has a free slot.
+
+    Prompts are sent by priority class (`_PRIORITIES`) and, within a class, fairly between
+    tenants (see `_FairQueue`). "interactive" prompts are queued at the front of the server
+    queue and may use `_INTERACTIVE_SLOTS` slots beyond max_queued, so they only wait for
+    the prompt that is running. The time each prompt was held is reported per class.
+
+    Slots are freed by the completions
+    the trackers already see over the WebSocket, and re-counted from /queue when a server
+    with prompts in flight has been quiet for a while (e.g. while its socket is down).
+    A server that fails to accept a prompt is skipped for a few seconds and the prompt is
+    sent elsewhere (or to it again later); prompts the server rejects fail their waiters.
+    """
+
+    _RECONCILE_INTERVAL = 5 # Seconds without a completion before a server's queue is re-read
+    _RETRY_DELAY = 2 # Seconds a server is skipped after it failed to accept a prompt
+    _THROUGHPUT_WINDOW = 60 # Seconds of completions that jobs_per_minute is measured over
+    _REPORT_INTERVAL = 60 # Seconds between throughput reports while busy
+    _INTERACTIVE_SLOTS = 1 # Slots per server only interactive prompts may use
+    _WAIT_SAMPLES = 1000 # Recent hold times kept per class for the wait statistics
+
+    def __init__(self, clients, max_queued, tenant_weights=None):
+        if not isinstance(max_queued, int) or max_queued <= 0:
+            raise ValueError("max_queued must be a positive integer.")
+        self.max_queued = max_queued
+        self._clients = list(clients)
+        self._cond = threading.Condition()
+        self._held = _FairQueue(tenant_weights)
+        self._held_ids = set()
+        self._cancelled = set() # Prompts cancelled while being sent
+        self._inflight = {client: set() for client in self._clients}
+        self._owners = {} # prompt_id -> client, while in flight
+        self._heard = {client: time.monotonic() for client in self._clients} # Last completion or /queue check
+        self._paused_until = {client: 0.0 for client in self._clients}
+        self._completions = collections.deque() # time.monotonic() of recent completions
+        self._completed = 0
+        self._dispatched = 0
+        self._waits = {priority: collections.deque(maxlen=self._WAIT_SAMPLES) for priority in _PRIORITIES}
+        self._wait_counts = dict.fromkeys(_PRIORITIES, 0)
+        self._started = None
+        self._stop = False
+        self._thread = threading.Thread(target=self._run, name="comfyapi-feeder", daemon=True)
+
+    def start(self):
+        for client in self._clients:
+            client.feeder = self
+            client._get_tracker().add_listener(self._on_finished)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stops sending. Prompts still held are failed with ComfyAPIError."""
+        with self._cond:
+            self._stop = True
+            held = self._held.drain()
+            self._held_ids.clear()
+            self._cond.notify_all()
+        for client in self._clients:
+            tracker = client._tracker
+            if tracker is not None:
+                tracker.remove_listener(self._on_finished)
+            if client.feeder is self:
+                client.feeder = None
+        for entry in held:
+            error = ComfyAPIError(f"Prompt {entry.prompt_id} was never queued: the feeder was stopped.")
+            self._clients[0].report_failed(entry.prompt_id, error)
+            if entry.on_dispatch: entry.on_dispatch(entry.prompt_id, None, error)
+
+    def set_max_queued(self, max_queued):
+        with self._cond:
+            self.max_queued = max_queued
+            self._cond.notify_all()
+
+    def set_tenant_weight(self, tenant, weight):
+        """Gives tenant `weight` times the share of a weight-1 tenant within each priority class."""
+        with self._cond:
+            self._held.set_weight(tenant, weight)
+
+    def cancel(self, prompt_ids):
+        """
+        Drops those of prompt_ids that are still held and fails their waiters with CancelledError.
+        Prompts being sent right now are cancelled on their server once it has accepted them.
+        Returns the set of prompt_ids cancelled either way.
+        """
+        prompt_ids = set(prompt_ids)
+        with self._cond:
+            held = prompt_ids & self._held_ids
+            dropped = {entry.prompt_id for entry in self._held.remove(held)}
+            self._held_ids -= dropped
+            self._cancelled |= held - dropped
+        for prompt_id in dropped:
+            self._clients[0].report_failed(prompt_id, CancelledError(f"Prompt {prompt_id} was cancelled before it was queued."))
+        return held
+
+    def is_held(self, prompt_id):
+        return prompt_id in self._held_ids
+
+    def enqueue(self, prompt_id, prompt_bytes, on_dispatch=None, priority="normal", tenant=None, first=False):
+        """
+        Holds an encoded prompt until a server has a free slot; it is then queued as prompt_id.
+        on_dispatch(prompt_id, client, error), if given, is called once it was queued on client
+        (error None) or was rejected. With first=True it is sent before the other held prompts
+        of its class (for prompts moved off a server that went down).
+        """
+        _check_priority(priority)
+        with self._cond:
+            if self._stop:
+                raise _report_error(ComfyAPIError("Feeder is stopped."))
+            entry = _HeldPrompt(prompt_id, prompt_bytes, on_dispatch, priority, tenant)
+            if first:
+                self._held.push_front(entry)
+            else:
+                self._held.push(entry)
+            self._held_ids.add(prompt_id)
+            self._cond.notify_all()
+
+    def stats(self):
+        """
+        Returns {'held', 'queued', 'dispatched', 'completed', 'jobs_per_minute', 'wait'}: prompts
+        waiting locally, prompts in the server queues, totals sent and finished, the completion
+        rate over the last minute, and per priority class {'held', 'count', 'mean', 'p95', 'max'}
+        where count is the number of prompts sent and the others are seconds they were held
+        (over the last _WAIT_SAMPLES of them).
+        """
+        with self._cond:
+            now = time.monotonic()
+            self._trim(now)
+            window = min(self._THROUGHPUT_WINDOW, now - self._started) if self._started else 0
+            wait = {}
+            for priority in _PRIORITIES:
+                samples = sorted(self._waits[priority])
+                wait[priority] = {
+                    "held": self._held.count(priority),
+                    "count": self._wait_counts[priority],
+                    "mean": sum(samples) / len(samples) if samples else 0.0,
+                    "p95": samples[int(0.95 * (len(samples) - 1))] if samples else 0.0,
+                    "max": samples[-1] if samples else 0.0,
+                }
+            return {
+                "held": len(self._held),
+                "queued": len(self._owners),
+                "dispatched": self._dispatched,
+                "completed": self._completed,
+                "jobs_per_minute": len(self._completions) * 60.0 / window if window > 0 else 0.0,
+                "wait": wait,
+            }
+
+    def _trim(self, now):
+        while self._completions and self._completions[0] < now - self._THROUGHPUT_WINDOW:
+            self._completions.popleft()
+
+    def _complete(self, prompt_id, now):
+        """Frees prompt_id's slot. Call with self._cond held."""
+        client = self._owners.pop(prompt_id, None)
+        if client is None:
+            return
+        self._inflight[client].discard(prompt_id)
+        self._heard[client] = now
+        self._completed += 1
+        self._completions.append(now)
+        self._cond.notify_all()
+
+    def _on_finished(self, prompt_id):
+        with self._cond:
+            self._complete(prompt_id, time.monotonic())
+
+    def _free_client(self, now, priority):
+        """Returns the usable client with the fewest prompts in flight, if it has a free slot for priority."""
+        limit = self.max_queued + (self._INTERACTIVE_SLOTS if priority == "interactive" else 0)
+        candidates = [c for c in self._clients
+                      if self._paused_until[c] <= now and len(self._inflight[c]) < limit]
+        return min(candidates, key=lambda c: len(self._inflight[c])) if candidates else None
+
+    def _reconcile(self, client):
+        """
+        Frees the slots of prompts no longer in client's server queue. If the server does not
+        answer, all its slots are freed and it is skipped for a while, so held prompts go to
+        the other servers (its prompts are not counted as completed).
+        """
+        queue_data = client.get_queue(timeout=10)
+        with self._cond:
+            now = time.monotonic()
+            self._heard[client] = now
+            if queue_data is None:
+                lost = self._inflight[client]
+                if lost:
+                    _logger.warning("Server %s is not answering, freeing the slots of its %d prompts", client.base_url, len(lost))
+                for prompt_id in lost:
+                    self._owners.pop(prompt_id, None)
+                self._inflight[client] = set()
+                self._paused_until[client] = now + self._RETRY_DELAY
+                self._cond.notify_all()
+                return
+            queued = _queued_prompt_ids(queue_data)
+            for prompt_id in list(self._inflight[client] - queued):
+                self._complete(prompt_id, now)
+
+    def _send(self, client, entry):
+        prompt_id = entry.prompt_id
+        try:
+            client.queue_prompt_bytes(entry.prompt_bytes, prompt_id=prompt_id, front=(entry.priority == "interactive"))
+            error = None
+        except ComfyAPIError as e:
+            error = e
+        with self._cond:
+            cancelled = prompt_id in self._cancelled
+            if error is not None:
+                self._owners.pop(prompt_id, None)
+                self._inflight[client].discard(prompt_id)
+            if error is not None and _is_server_failure(error) and not cancelled:
+                # Try again, first in line, once some server is usable
+                _logger.warning("Server %s did not accept prompt %s, holding it: %s", client.base_url, prompt_id, error)
+                self._paused_until[client] = time.monotonic() + self._RETRY_DELAY
+                self._held.requeue(entry)
+                return
+            self._held_ids.discard(prompt_id)
+            self._cancelled.discard(prompt_id)
+            if error is None:
+                now = time.monotonic()
+                self._dispatched += 1
+                self._waits[entry.priority].append(now - entry.enqueued_at)
+                self._wait_counts[entry.priority] += 1
+                if self._started is None:
+                    self._started = now
+        if cancelled and error is not None:
+            client.report_failed(prompt_id, CancelledError(f"Prompt {prompt_id} was cancelled before it was queued."))
+            return
+        if error is not None:
+            _logger.warning("Failed to queue held prompt %s: %s", prompt_id, error)
+            client.report_failed(prompt_id, error)
+        if entry.on_dispatch: entry.on_dispatch(prompt_id, client, error)
+        if cancelled:
+            try:
+                client.cancel([prompt_id])
+            except ComfyAPIError as e:
+                _logger.warning("Could not cancel prompt %s on %s: %s", prompt_id, client.base_url, e)
+
+    def _run(self):
+        last_report = time.monotonic()
+        while True:
+            with self._cond:
+                if self._stop:
+                    return
+                now = time.monotonic()
+                entry = self._held.peek()
+                client = self._free_client(now, entry.priority) if entry is not None else None
+                stale = []
+                if client is not None:
+                    self._held.pop()
+                    self._inflight[client].add(entry.prompt_id) # Reserve the slot before sending
+                    self._owners[entry.prompt_id] = client
+                else:
+                    stale = [c for c in self._clients
+                             if self._inflight[c] and now - self._heard[c] >= self._RECONCILE_INTERVAL]
+                    if not stale:
+                        self._cond.wait(timeout=1)
+                busy = self._held or self._owners
+            if client is not None:
+                self._send(client, entry)
+            for stale_client in stale:
+                self._reconcile(stale_client)
+            if busy and time.monotonic() - last_report >= self._REPORT_INTERVAL:
+                last_report = time.monotonic()
+                stats = self.stats()
+                _logger.info("Feeder: %.1f jobs/min, %s queued, %s held", stats['jobs_per_minute'], stats['queued'], stats['held'])
@@ -0,0 +1,149 @@
+import logging
+import math
+import time
+from io import BytesIO
+
+from .client import ComfyAPIError, _report_error
+
+_logger = logging.getLogger(__name__)
+
+_FORMATS = {"JPEG": ".jpg", "WEBP": ".webp"}
+_MIN_EDGE = 128 # Never shrink the longest edge below this many pixels
+_SCALE_MARGIN = 0.85 # Scale estimates aim under the limit so one resize usually fits
+_GOOD_ENOUGH = 0.85 # Stop searching once a fitting encode uses this much of the limit
+
+
+def _import_pil():
+    try:
+        from PIL import Image
+    except Exception:
+        raise _report_error(ComfyAPIError("Pillow is required to resize large images. Install with `pip install pillow`"))
+    return Image
+
+
+def _fit_image(image_path, max_size_bytes, max_dimension=1024, quality=85, min_quality=20, image_format="JPEG", max_probes=2):
+    """
+    Re-encodes an image so it fits in max_size_bytes, usually in two or three encodes.
+
+    - JPEG sources are decoded at reduced scale with Image.draft, other formats are shrunk with
+      Image.reduce, before the final LANCZOS resize to max_dimension.
+    - If the start quality is too large, one encode at min_quality tells whether quality alone
+      can fit; if not, the image is scaled by the bytes-per-pixel estimate in a single step.
+    - Otherwise the quality between the two measurements is found by interpolating log(size),
+      with at most max_probes extra encodes; the best quality that fits is kept.
+
+    Returns (data, extension, stats) where stats reports the chosen quality, pixel size, byte
+    size, number of encodes, per-stage timings in seconds ('load', 'resize', 'encode') and
+    'fits', which is False (and a warning is logged) if even a _MIN_EDGE image at min_quality
+    is larger than max_size_bytes; data is then that smallest encode.
+    """
+    image_format = image_format.upper()
+    if image_format not in _FORMATS:
+        raise ValueError(f"Unsupported image_format '{image_format}'; use 'JPEG' or 'WEBP'.")
+    Image = _import_pil()
+    timings = {"load": 0.0, "resize": 0.0, "encode": 0.0}
+    encodes = 0
+
+    start = time.perf_counter()
+    try:
+        img = Image.open(image_path)
+        width, height = img.size
+        if max(width, height) > max_dimension and img.format == "JPEG":
+            # Let the JPEG decoder downscale by 1/2, 1/4 or 1/8 while decoding
+            scale = max_dimension / float(max(width, height))
+            img.draft("RGB", (math.ceil(width * scale), math.ceil(height * scale)))
+        img.load()
+    except Exception as e:
+        raise _report_error(ComfyAPIError(f"Failed to open image for processing: {e}"))
+
+    if "transparency" in img.info:
+        # Palette (or single colour key) transparency is lost by a plain RGB conversion
+        img = img.convert("RGBA")
+    # Handle alpha channels: JPEG has none, so flatten onto a white background
+    if img.mode in ("RGBA", "LA") and image_format == "JPEG":
+        background = Image.new("RGB", img.size, (255, 255, 255))
+        background.paste(img, mask=img.split()[-1])
+        img = background
+    elif img.mode not in ("RGB", "RGBA"):
+        img = img.convert("RGBA" if image_format == "WEBP" and "A" in img.getbands() else "RGB")
+    timings["load"] = time.perf_counter() - start
+
+    def resize(image, longest_edge):
+        start = time.perf_counter()
+        scale = longest_edge / float(max(image.size))
+        factor = int(1 / scale)
+        if factor >= 2:
+            # Cheap integer box reduction first, LANCZOS only for the remainder
+            image = image.reduce(factor)
+            scale = longest_edge / float(max(image.size))
+        if scale < 1:
+            new_size = (max(1, int(image.size[0] * scale)), max(1, int(image.size[1] * scale)))
+            image = image.resize(new_size, Image.LANCZOS)
+        timings["resize"] += time.perf_counter() - start
+        return image
+
+    def encode(image, q):
+        nonlocal encodes
+        start = time.perf_counter()
+        buffer = BytesIO()
+        if image_format == "JPEG":
+            image.save(buffer, format="JPEG", quality=q, optimize=True)
+        else:
+            image.save(buffer, format="WEBP", quality=q, method=4)
+        encodes += 1
+        timings["encode"] += time.perf_counter() - start
+        return buffer.getvalue()
+
+    if max(img.size) > max_dimension:
+        img = resize(img, max_dimension)
+
+    quality = max(quality, min_quality)
+    data = encode(img, quality)
+    best = (quality, data) if len(data) <= max_size_bytes else None
+
+    if best is None:
+        high = (quality, len(data)) # Known too large
+        data = encode(img, min_quality)
+        resized = False
+        while len(data) > max_size_bytes and max(img.size) > _MIN_EDGE:
+            # Quality alone can't fit: bytes scale roughly with pixel count
+            scale = math.sqrt(max_size_bytes * _SCALE_MARGIN / len(data))
+            img = resize(img, max(_MIN_EDGE, int(max(img.size) * min(scale, 0.9))))
+            data = encode(img, min_quality)
+            resized = True
+        best = (min_quality, data)
+
+        # Search quality only when it alone was enough; a resized image stays at min_quality
+        low = (min_quality, len(data))
+        probes = 0
+        while not resized and high[0] - low[0] > 1 and probes < max_probes:
+            # Interpolate log(size) between the closest measurements on either side of the limit
+            log_low, log_high = math.log(low[1]), math.log(high[1])
+            fraction = (math.log(max_size_bytes) - log_low) / (log_high - log_low) if log_high > log_low else 0.5
+            q = int(low[0] + fraction * (high[0] - low[0]))
+            q = min(max(q, low[0] + 1), high[0] - 1)
+            data = encode(img, q)
+            probes += 1
+            if len(data) <= max_size_bytes:
+                best = (q, data)
+                low = (q, len(data))
+                if len(data) >= max_size_bytes * _GOOD_ENOUGH:
+                    break
+            else:
+                high = (q, len(data))
+
+    final_quality, data = best
+    fits = len(data) <= max_size_bytes
+    if not fits:
+        _logger.warning("Could not fit %s in %s bytes; smallest encode (%sx%s at quality %s) is %s bytes",
+                        image_path, max_size_bytes, img.size[0], img.size[1], final_quality, len(data))
+    stats = {
+        "format": image_format,
+        "quality": final_quality,
+        "size": img.size,
+        "bytes": len(data),
+        "fits": fits,
+        "encodes": encodes,
+        "timings": timings,
+    }
+    return data, _FORMATS[image_format], stats
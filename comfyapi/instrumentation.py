@@ -0,0 +1,243 @@
+"""
+Timings and counters of what the clients do, for export to a metrics system.
+
+Nothing is measured until a hook is added with `add_instrumentation`; until then every
+instrumented call site costs one check of an empty tuple. A hook is any object with
+
+    timing(phase, seconds)          # one measured phase of one prompt or request
+    count(name, value, labels)      # a counter increment; labels is a dict of strings
+
+Phases:
+    serialize    encoding a workflow (or rendering a template) into prompt JSON
+    submit       the POST to /prompt
+    queue_wait   time from submission to completion not spent executing: waiting in the
+                 server's queue, plus the time it took to notice the prompt finished
+    execution    the server's own execution time (from its history status messages)
+    download     fetching one output file
+
+Counters:
+    http_requests   (method, endpoint, status) every HTTP response received
+    retries         (method, endpoint) every retry of a failed request
+    errors          (kind) every ComfyAPIError raised or reported (once each), by exception class;
+                    cancellations are not counted
+    download_bytes  bytes of output files received
+
+`MetricsRecorder` keeps them in memory; `PrometheusHook` and `OpenTelemetryHook` export them
+through the respective client libraries, which are imported only when the hook is created.
+Log output goes through the standard `logging` module under the "comfyapi" logger.
+"""
+import collections
+import contextlib
+import logging
+import threading
+import time
+import urllib.parse
+
+_logger = logging.getLogger(__name__)
+
+_hooks = () # Replaced, never mutated, so call sites can iterate without a lock
+_hooks_lock = threading.Lock()
+
+_NO_SPAN = contextlib.nullcontext()
+
+
+def add_instrumentation(hook):
+    """Starts sending timings and counters to hook. Returns hook."""
+    global _hooks
+    with _hooks_lock:
+        if hook not in _hooks:
+            _hooks = _hooks + (hook,)
+    return hook
+
+
+def remove_instrumentation(hook):
+    """Stops sending timings and counters to hook."""
+    global _hooks
+    with _hooks_lock:
+        _hooks = tuple(h for h in _hooks if h is not hook)
+
+
+def _enabled():
+    return bool(_hooks)
+
+
+def _timing(phase, seconds):
+    for hook in _hooks:
+        try:
+            hook.timing(phase, seconds)
+        except Exception:
+            _logger.exception("Instrumentation hook %r failed", hook)
+
+
+def _count(name, value=1, **labels):
+    for hook in _hooks:
+        try:
+            hook.count(name, value, labels)
+        except Exception:
+            _logger.exception("Instrumentation hook %r failed", hook)
+
+
+class _Span:
+    __slots__ = ("phase", "start")
+
+    def __init__(self, phase):
+        self.phase = phase
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        _timing(self.phase, time.perf_counter() - self.start)
+
+
+def _span(phase):
+    """Context manager timing its body as phase; a shared no-op while no hook is added."""
+    return _Span(phase) if _hooks else _NO_SPAN
+
+
+def _endpoint(url):
+    """The path of a request URL with prompt IDs and file names stripped, for use as a label."""
+    path = urllib.parse.urlsplit(url).path or "/"
+    if path.startswith("/history/"):
+        return "/history/{prompt_id}"
+    return path
+
+
+def _count_response(response, *args, **kwargs):
+    """requests response hook counting every response by method, endpoint and status."""
+    if _hooks:
+        _count("http_requests", method=response.request.method, endpoint=_endpoint(response.url),
+               status=str(response.status_code))
+    return response
+
+
+class MetricsRecorder:
+    """
+    Hook that keeps counters and per-phase timing summaries in memory:
+
+        recorder = comfyapi.add_instrumentation(comfyapi.MetricsRecorder())
+        ...
+        recorder.snapshot()["timings"]["execution"]["p95"]
+    """
+
+    _SAMPLES = 1000 # Most recent timings per phase kept for percentiles
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = collections.Counter() # (name, sorted label items) -> value
+        self._timings = {} # phase -> [count, total, max, deque of recent samples]
+
+    def timing(self, phase, seconds):
+        with self._lock:
+            summary = self._timings.get(phase)
+            if summary is None:
+                summary = self._timings[phase] = [0, 0.0, 0.0, collections.deque(maxlen=self._SAMPLES)]
+            summary[0] += 1
+            summary[1] += seconds
+            summary[2] = max(summary[2], seconds)
+            summary[3].append(seconds)
+
+    def count(self, name, value, labels):
+        with self._lock:
+            self._counters[(name, tuple(sorted(labels.items())))] += value
+
+    def snapshot(self):
+        """
+        Returns {'counters': {name: {label string: value}}, 'timings': {phase: {count, total,
+        mean, p95, max}}}, where a label string looks like 'endpoint=/prompt,method=POST'.
+        """
+        with self._lock:
+            counters = {}
+            for (name, labels), value in self._counters.items():
+                counters.setdefault(name, {})[",".join(f"{k}={v}" for k, v in labels)] = value
+            timings = {}
+            for phase, (count, total, longest, samples) in self._timings.items():
+                ordered = sorted(samples)
+                timings[phase] = {
+                    "count": count,
+                    "total": total,
+                    "mean": total / count,
+                    "p95": ordered[int(0.95 * (len(ordered) - 1))],
+                    "max": longest,
+                }
+        return {"counters": counters, "timings": timings}
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._timings.clear()
+
+
+class PrometheusHook:
+    """
+    Hook exporting through prometheus_client: one Counter per counter name
+    (`comfyapi_http_requests_total`, ...) and a `comfyapi_phase_seconds` Histogram by phase.
+    Requires `pip install prometheus-client`; serve the registry as usual (e.g. start_http_server).
+    """
+
+    def __init__(self, registry=None, namespace="comfyapi", buckets=None):
+        try:
+            import prometheus_client
+        except ImportError:
+            from .client import ComfyAPIError, _report_error
+            raise _report_error(ComfyAPIError("PrometheusHook requires prometheus_client. Install it with: pip install prometheus-client"))
+        self._prometheus = prometheus_client
+        self._registry = registry if registry is not None else prometheus_client.REGISTRY
+        self._namespace = namespace
+        self._lock = threading.Lock()
+        self._counters = {} # name -> Counter
+        options = {"buckets": buckets} if buckets is not None else {}
+        self._histogram = prometheus_client.Histogram(
+            "phase_seconds", "Time spent per phase of a prompt.", ["phase"],
+            namespace=namespace, registry=self._registry, **options)
+
+    def timing(self, phase, seconds):
+        self._histogram.labels(phase=phase).observe(seconds)
+
+    def count(self, name, value, labels):
+        counter = self._counters.get(name)
+        if counter is None:
+            with self._lock:
+                counter = self._counters.get(name)
+                if counter is None:
+                    counter = self._prometheus.Counter(
+                        name, f"comfyapi {name.replace('_', ' ')}.", sorted(labels),
+                        namespace=self._namespace, registry=self._registry)
+                    self._counters[name] = counter
+        (counter.labels(**labels) if labels else counter).inc(value)
+
+
+class OpenTelemetryHook:
+    """
+    Hook exporting through the OpenTelemetry metrics API: a `comfyapi.<name>` Counter per
+    counter name and a `comfyapi.phase.duration` Histogram (seconds) with a `phase` attribute.
+    Uses the global meter provider unless a meter is given. Requires `pip install opentelemetry-api`.
+    """
+
+    def __init__(self, meter=None):
+        if meter is None:
+            try:
+                from opentelemetry import metrics
+            except ImportError:
+                from .client import ComfyAPIError, _report_error
+                raise _report_error(ComfyAPIError("OpenTelemetryHook requires opentelemetry-api. Install it with: pip install opentelemetry-api"))
+            meter = metrics.get_meter("comfyapi")
+        self._meter = meter
+        self._lock = threading.Lock()
+        self._counters = {} # name -> Counter
+        self._histogram = meter.create_histogram("comfyapi.phase.duration", unit="s",
+                                                 description="Time spent per phase of a prompt.")
+
+    def timing(self, phase, seconds):
+        self._histogram.record(seconds, {"phase": phase})
+
+    def count(self, name, value, labels):
+        counter = self._counters.get(name)
+        if counter is None:
+            with self._lock:
+                counter = self._counters.get(name)
+                if counter is None:
+                    counter = self._meter.create_counter(f"comfyapi.{name}")
+                    self._counters[name] = counter
+        counter.add(value, labels)
@@ -0,0 +1,426 @@
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from .client import (ComfyAPIError, CancelledError, HistoryError, QueueError, _first_output_image, _history_error,
+                     _index_outputs, _report_error)
+from .cache import _result_key
+
+_logger = logging.getLogger(__name__)
+
+
+class _JobRecord:
+    """
+    One submitted prompt. Supports read-only job["prompt_id"] / job["status"] item access so
+    code written against the old list-of-dicts `manager.queue` keeps working.
+    """
+    __slots__ = ("prompt_id", "status", "submitted_at", "finished_at", "outputs", "error", "server", "cached")
+
+    def __init__(self, prompt_id, submitted_at=None, server=None, status="queued"):
+        self.prompt_id = prompt_id
+        self.status = status # "held" (not sent to a server yet), "queued", "finished", "error" or "cancelled"
+        self.submitted_at = submitted_at if submitted_at is not None else time.time()
+        self.finished_at = None
+        self.outputs = None # (filename, url) or an output index, once known
+        self.error = None
+        self.server = server # Base URL of the server running the prompt, if known
+        self.cached = False # True if outputs (an output index) came from the result cache
+
+    def __getitem__(self, key):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key, default=None):
+        return getattr(self, key, default) if key in self.__slots__ else default
+
+    def __repr__(self):
+        return f"_JobRecord(prompt_id={self.prompt_id!r}, status={self.status!r})"
+
+
+class _JobRegistry:
+    """
+    Jobs submitted through a manager, indexed by prompt_id.
+
+    Lookups and status changes are O(1). Pending jobs are kept in submission order and
+    finished (or failed) jobs in completion order, so `pending()` and `finished_since(t)`
+    only touch the jobs they return. At most `max_finished` completed jobs are retained;
+    the oldest are evicted first. With a JobJournal, submissions and status changes are
+    also appended to it.
+    """
+
+    def __init__(self, max_finished=10000, journal=None):
+        self.max_finished = max_finished
+        self.journal = journal
+        self._jobs = {} # prompt_id -> _JobRecord, in submission order
+        self._pending = {} # prompt_id -> _JobRecord, used as an ordered set
+        self._finished = OrderedDict() # prompt_id -> _JobRecord, in completion order
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._jobs)
+
+    def __contains__(self, prompt_id):
+        return prompt_id in self._jobs
+
+    def add(self, prompt_id, server=None, status="queued", prompt_bytes=None, priority=None, tenant=None):
+        """
+        Registers a newly submitted (or held) prompt and returns its record. prompt_bytes,
+        priority and tenant are only journaled (the prompt is needed to send a held one later).
+        """
+        with self._lock:
+            record = self._jobs.get(prompt_id)
+            if record is not None:
+                return record
+            record = _JobRecord(prompt_id, server=server, status=status)
+            self._jobs[prompt_id] = record
+            self._pending[prompt_id] = record
+        if self.journal is not None:
+            self.journal.submitted(prompt_id, server, status, prompt_bytes=prompt_bytes if status == "held" else None,
+                                   priority=priority, tenant=tenant)
+        return record
+
+    def restore(self, prompt_id, server, status="queued", submitted_at=None, finished_at=None, error=None):
+        """Re-registers a prompt read back from the journal, without journaling it again."""
+        with self._lock:
+            record = self._jobs.get(prompt_id)
+            if record is not None:
+                return record
+            record = _JobRecord(prompt_id, submitted_at=submitted_at, server=server, status=status)
+            self._jobs[prompt_id] = record
+            if status in ("finished", "error", "cancelled"):
+                record.finished_at = finished_at if finished_at is not None else time.time()
+                record.error = error
+                self._finished[prompt_id] = record
+                while len(self._finished) > self.max_finished:
+                    evicted, _ = self._finished.popitem(last=False)
+                    del self._jobs[evicted]
+            else:
+                self._pending[prompt_id] = record
+            return record
+
+    def get(self, prompt_id):
+        return self._jobs.get(prompt_id)
+
+    def mark_dispatched(self, prompt_id, server):
+        """Records that a held prompt has been queued on server."""
+        with self._lock:
+            record = self._jobs.get(prompt_id)
+            if record is None or record.status != "held":
+                return
+            record.status = "queued"
+            record.server = server
+        if self.journal is not None:
+            self.journal.dispatched(prompt_id, server)
+
+    def mark_cached(self, prompt_id, outputs):
+        """Records that prompt_id was answered from the result cache with an output index."""
+        with self._lock:
+            record = self._jobs.get(prompt_id)
+            if record is not None:
+                record.cached = True
+        self._complete(prompt_id, "finished", outputs=outputs)
+
+    def reassign(self, prompt_id, server, server_prompt_id=None):
+        """
+        Records that prompt_id is now running on another server (e.g. after a failover),
+        under server_prompt_id there if that differs from prompt_id.
+        """
+        with self._lock:
+            record = self._jobs.get(prompt_id)
+            if record is None:
+                return
+            record.server = server
+        if self.journal is not None:
+            self.journal.moved(prompt_id, server, server_prompt_id)
+
+    def mark_finished(self, prompt_id, outputs=None):
+        self._complete(prompt_id, "finished", outputs=outputs)
+
+    def mark_error(self, prompt_id, error):
+        self._complete(prompt_id, "error", error=_report_error(error))
+
+    def mark_cancelled(self, prompt_id, error):
+        """Records that prompt_id was cancelled (error is the CancelledError its waiters got), unless it already completed."""
+        with self._lock:
+            record = self._jobs.get(prompt_id)
+            if record is None or prompt_id in self._finished:
+                return
+        self._complete(prompt_id, "cancelled", error=error)
+
+    def _complete(self, prompt_id, status, outputs=None, error=None):
+        with self._lock:
+            record = self._jobs.get(prompt_id)
+            if record is None:
+                return
+            record.status = status
+            if outputs is not None:
+                record.outputs = outputs
+            record.error = error
+            if prompt_id in self._finished:
+                return # Already completed; keep its place in completion order
+            record.finished_at = time.time()
+            self._pending.pop(prompt_id, None)
+            self._finished[prompt_id] = record
+            while len(self._finished) > self.max_finished:
+                evicted, _ = self._finished.popitem(last=False)
+                del self._jobs[evicted]
+        if self.journal is not None:
+            self.journal.finished(prompt_id, status, error)
+
+    def pending(self):
+        """Returns the records of jobs not yet finished, oldest submission first."""
+        with self._lock:
+            return list(self._pending.values())
+
+    def finished_since(self, timestamp=None):
+        """
+        Returns the records of jobs that finished or failed at or after `timestamp`
+        (a time.time() value; all retained ones if None), in completion order.
+        """
+        with self._lock:
+            if timestamp is None:
+                return list(self._finished.values())
+            records = []
+            for record in reversed(self._finished.values()):
+                if record.finished_at < timestamp:
+                    break
+                records.append(record)
+        records.reverse()
+        return records
+
+    def records(self):
+        """Returns every retained record in submission order."""
+        with self._lock:
+            return list(self._jobs.values())
+
+
+class _JobQueries:
+    """
+    Job lookups shared by ComfyAPIManager, AsyncComfyAPIManager and ComfyClusterManager.
+    Subclasses create `self._jobs = _JobRegistry(...)` in __init__, and may set
+    `self.result_cache` to a ResultCache (the synchronous managers' find_output is used
+    to index finished outputs for it, and `_client_for_server` to wait for identical prompts
+    another manager sharing the cache queued). With a JobJournal passed to the registry,
+    `resume()` re-attaches to the prompts journaled by an earlier process.
+    """
+
+    result_cache = None
+
+    @property
+    def journal(self):
+        """The JobJournal submissions are recorded in, or None."""
+        return self._jobs.journal
+
+    @property
+    def queue(self):
+        """
+        Read-only snapshot (a tuple) of the tracked jobs' records in submission order; each supports
+        job["prompt_id"] / job["status"]. Unlike the old list, it cannot be appended to or edited.
+        """
+        return tuple(self._jobs.records())
+
+    def get_job(self, prompt_id):
+        """Returns the job record for prompt_id (status, submitted_at, finished_at, outputs, error, server), or None."""
+        return self._jobs.get(prompt_id)
+
+    def pending_jobs(self):
+        """Returns the records of submitted jobs that have not finished yet, oldest first."""
+        return self._jobs.pending()
+
+    def finished_jobs(self, since=None):
+        """Returns the records of jobs that finished or failed at or after `since` (a time.time() value)."""
+        return self._jobs.finished_since(since)
+
+    def _on_dispatch(self, prompt_id, client, error):
+        """Feeder callback: a held prompt was queued on client, or rejected with error."""
+        if error is not None:
+            self._jobs.mark_error(prompt_id, error)
+            if self.result_cache is not None:
+                self.result_cache.release(prompt_id)
+        else:
+            self._jobs.mark_dispatched(prompt_id, client.base_url)
+            if self.result_cache is not None:
+                self.result_cache.placed(prompt_id, client.base_url)
+
+    def _client_for_server(self, server):
+        """Returns this manager's client for the server at base URL server, or None."""
+        return None
+
+    def _claim_result(self, prompt_bytes):
+        """
+        Looks an encoded prompt up in the result cache. Returns (prompt_id, True) if it is
+        answered by a cached result or joins an identical prompt in flight, and otherwise
+        (prompt_id to submit it under, False); (None, False) without a result cache.
+        """
+        if self.result_cache is None:
+            return None, False
+        fresh = str(uuid.uuid4())
+        prompt_id, entry = self.result_cache.claim(_result_key(prompt_bytes), fresh)
+        if entry is not None:
+            _logger.info("Result cache hit: reusing the outputs of prompt %s", prompt_id)
+            self._jobs.add(prompt_id, server=entry["server"])
+            self._jobs.mark_cached(prompt_id, entry["outputs"])
+            return prompt_id, True
+        if prompt_id != fresh:
+            if prompt_id not in self._jobs and not self._follow(prompt_id):
+                return None, False # Another manager's prompt on a server this one cannot wait on
+            _logger.debug("Identical prompt %s is already running; sharing it", prompt_id)
+            return prompt_id, True
+        return prompt_id, False
+
+    def _follow(self, prompt_id):
+        """
+        Tracks a prompt another manager sharing the result cache has queued, if it is on a
+        server this manager talks to. Returns False if it is not (or is still held).
+        """
+        server = self.result_cache.server_of(prompt_id)
+        client = self._client_for_server(server) if server is not None else None
+        if client is None:
+            return False
+        self._jobs.add(prompt_id, server=server)
+        client.note_foreign([prompt_id]) # Its completion is reported to the other manager's socket
+        return True
+
+    def _store_result(self, prompt_id, outcome=None):
+        """Adds a finished prompt's output index to the result cache if it was claimed there."""
+        key = self.result_cache.key_for(prompt_id)
+        if key is None:
+            return
+        index = outcome if isinstance(outcome, dict) else self.find_output(prompt_id, all_outputs=True)
+        if not index:
+            self.result_cache.release(prompt_id)
+            return
+        job = self._jobs.get(prompt_id)
+        self.result_cache.store(key, prompt_id, job.server if job is not None else None, index)
+
+    def _note_params(self, outcomes):
+        """Passes batch outcomes through, journaling the seed or slot values of each submitted prompt."""
+        for outcome in outcomes:
+            if self._jobs.journal is not None and outcome['status'] == 'success':
+                params = outcome['values'] if 'values' in outcome else {'seed': outcome['seed']}
+                self._jobs.journal.params(outcome['uid'], params)
+            yield outcome
+
+    def _journaled(self):
+        """
+        Reads the journal for resume(). Returns (every journaled prompt_id in submission order,
+        {server: [entry]} for prompts sent to a server, [entry] for held ones), leaving out
+        prompts this manager already tracks. Raises ComfyAPIError without a journal.
+        """
+        journal = self._jobs.journal
+        if journal is None:
+            raise _report_error(ComfyAPIError("resume() needs a manager created with journal=JobJournal(path)."))
+        prompt_ids, sent, held = [], {}, []
+        for entry in journal.jobs():
+            prompt_ids.append(entry["prompt_id"])
+            if entry["prompt_id"] in self._jobs:
+                continue
+            if entry["status"] == "held":
+                held.append(entry)
+            else:
+                sent.setdefault(entry["server"], []).append(entry)
+        return prompt_ids, sent, held
+
+    def _restore_entry(self, entry, known):
+        """
+        Re-registers a journaled prompt that was sent to a server (known: whether the server
+        still has it, or None if this manager does not use that server). Prompts the server
+        lost, or that are on another server, fail with QueueError, without a server.
+        """
+        prompt_id, status, server = entry["prompt_id"], entry["status"], entry["server"]
+        if status == "cancelled":
+            self._jobs.restore(prompt_id, server, status, entry["submitted_at"], entry["finished_at"],
+                               CancelledError(entry["error"] or f"Prompt {prompt_id} was cancelled."))
+            return
+        if server is None:
+            # Rejected before it reached a server
+            self._jobs.restore(prompt_id, None, "error", entry["submitted_at"], entry["finished_at"],
+                               QueueError(entry["error"] or f"Prompt {prompt_id} was never queued."))
+            return
+        if known:
+            # Finished prompts are re-read from the server's history when waited for
+            self._jobs.restore(prompt_id, server, status, entry["submitted_at"], entry["finished_at"])
+            return
+        if known is None:
+            _logger.warning("Journaled prompt %s was sent to %s, which this manager does not use", prompt_id, server)
+            error = QueueError(f"Prompt {prompt_id} was sent to {server}, which this manager does not use.")
+        else:
+            _logger.warning("Journaled prompt %s is no longer known to %s", prompt_id, server)
+            error = QueueError(f"Prompt {prompt_id} is no longer known to {server} (the server may have restarted).")
+        if status in ("finished", "error"):
+            self._jobs.restore(prompt_id, None, "error", entry["submitted_at"], entry["finished_at"], error)
+        else:
+            self._jobs.restore(prompt_id, None, status, entry["submitted_at"])
+            self._jobs.mark_error(prompt_id, error)
+
+    def _reclaim_held(self, entry, server=None):
+        """Re-registers a journaled held prompt, as queued on server if it turned out to be there already."""
+        self._jobs.restore(entry["prompt_id"], None, "held", entry["submitted_at"])
+        if server is not None:
+            # Sent just before the earlier process stopped, without the dispatch reaching the journal
+            self._jobs.mark_dispatched(entry["prompt_id"], server)
+
+    def _known_outcome(self, prompt_id, all_outputs=False):
+        """
+        Returns the outcome of a job that can be answered without a server: a cached one (see
+        _cached_outcome), or the error of one that was cancelled or never reached a server.
+        None for other jobs.
+        """
+        job = self._jobs.get(prompt_id)
+        if job is not None and (job.status == "cancelled" or (job.status == "error" and job.server is None)):
+            return job.error
+        return self._cached_outcome(prompt_id, all_outputs)
+
+    def _cached_outcome(self, prompt_id, all_outputs=False):
+        """
+        Returns the outcome of a job answered from the result cache: its output index, or
+        (filename, url) of its first image, or HistoryError if it has none. None for other jobs.
+        """
+        job = self._jobs.get(prompt_id)
+        if job is None or not job.cached:
+            return None
+        if all_outputs:
+            return job.outputs
+        record = _first_output_image(job.outputs)
+        if record is None:
+            return HistoryError(f"Cached prompt {prompt_id} has no output image.")
+        return record["filename"], record["url"]
+
+    def _mark_cancelled(self, prompt_ids):
+        """Marks jobs cancelled by cancel_batch, releasing their result cache claims."""
+        for prompt_id in prompt_ids:
+            self._jobs.mark_cancelled(prompt_id, CancelledError(f"Prompt {prompt_id} was cancelled."))
+            if self.result_cache is not None:
+                self.result_cache.release(prompt_id)
+
+    def _check_history(self, prompt_id, prompt_history, base_url):
+        """
+        Records what a prompt's history entry reports (for check_queue): its output index, or
+        the ExecutionError it failed with. Returns True if it finished successfully.
+        """
+        if not prompt_history:
+            return False # ComfyUI only writes history once a prompt has finished executing
+        error = _history_error(prompt_id, prompt_history)
+        self._record_outcome(prompt_id, error if error is not None else _index_outputs(prompt_history, base_url))
+        return error is None
+
+    def _record_outcome(self, prompt_id, outcome):
+        """Records a (filename, url) / output index result, or the exception a job failed with."""
+        job = self._jobs.get(prompt_id)
+        if job is not None and (job.cached or job.status == "cancelled"):
+            return # Keeps the cached output index, or the cancellation
+        if isinstance(outcome, CancelledError):
+            self._jobs.mark_cancelled(prompt_id, outcome)
+            if self.result_cache is not None:
+                self.result_cache.release(prompt_id)
+        elif isinstance(outcome, Exception):
+            self._jobs.mark_error(prompt_id, outcome)
+            if self.result_cache is not None:
+                self.result_cache.release(prompt_id)
+        else:
+            self._jobs.mark_finished(prompt_id, outcome)
+            if self.result_cache is not None:
+                self._store_result(prompt_id, outcome)
@@ -0,0 +1,246 @@
+"""
+Opt-in durable journal of submitted prompts, for re-attaching to them after a restart.
+
+Prompt IDs returned by `batch_submit` normally live only in the manager's memory, so a
+worker that restarts mid-batch orphans prompts that are still running (or already
+finished) on the server. With a `JobJournal` passed to a manager, every submission, its
+parameters and its state changes are appended to a JSONL file, and the manager's
+`resume()` re-attaches to those prompts on the server instead of submitting them again.
+"""
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from .template import _encode
+
+
+def _json_line(record, raw=None):
+    """One journal line: record as compact JSON, with already-encoded JSON spliced in as record["prompt"]."""
+    encoded = json.dumps(record, separators=(",", ":"), default=str).encode("utf-8")
+    if raw is not None:
+        encoded = encoded[:-1] + b',"prompt":' + raw + b"}"
+    return encoded + b"\n"
+
+
+def _apply(jobs, offsets, record, offset, has_prompt):
+    """Folds one journal record into jobs (prompt_id -> state dict) and offsets (prompt_id -> offset of its prompt line)."""
+    op, prompt_id = record["op"], record["id"]
+    if op == "submit":
+        job = jobs.setdefault(prompt_id, {"prompt_id": prompt_id, "params": None, "server_prompt_id": None,
+                                          "finished_at": None, "error": None})
+        tenant = record.get("tenant")
+        job.update(status=record.get("status", "queued"), server=record.get("server"),
+                   submitted_at=record.get("t"), priority=record.get("priority", "normal"),
+                   tenant=tuple(tenant) if isinstance(tenant, list) else tenant) # Tuples come back as lists
+        if "params" in record:
+            job["params"] = record["params"]
+        if has_prompt:
+            offsets[prompt_id] = offset
+        return
+    job = jobs.get(prompt_id)
+    if job is None:
+        return
+    if op == "params":
+        job["params"] = record.get("params")
+    elif op == "dispatch":
+        if job["status"] == "held":
+            job["status"] = "queued"
+        job["server"] = record.get("server")
+    elif op == "move":
+        job["server"], job["server_prompt_id"] = record.get("server"), record.get("server_id")
+    elif op == "finish":
+        job.update(status=record.get("status"), finished_at=record.get("t"), error=record.get("error"))
+
+
+class JobJournal:
+    """
+    Append-only JSONL log of a manager's prompts: one line per submission (with the encoded
+    prompt for prompts held locally, so they can still be sent after a restart), per batch
+    parameter set (seed or sweep values) and per state change (dispatched, moved, finished).
+
+    Every line is written to the OS right away, so a crashed process loses nothing; fsync
+    is batched to once every `sync_interval` seconds by a background thread, so a power
+    loss can lose at most that much. `sync_interval=0` syncs every line.
+
+    The file is read once when the journal is opened; after that the state of every prompt
+    is kept in memory and updated as lines are written, so `jobs()` does not re-read it.
+    The file grows with every prompt; `compact()` rewrites it without finished prompts.
+    """
+
+    def __init__(self, path, sync_interval=1.0):
+        self.path = path
+        self.sync_interval = sync_interval
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._closed = False
+        self._wakeup = threading.Event()
+        self._jobs, self._offsets = self._load()
+        self._file = self._open()
+        self._thread = None
+        if sync_interval:
+            self._thread = threading.Thread(target=self._sync_loop, name="comfyapi-journal", daemon=True)
+            self._thread.start()
+
+    def _load(self):
+        """Folds the lines already in the file. Returns (jobs, offsets) as kept by _apply."""
+        jobs = OrderedDict()
+        offsets = {}
+        if not os.path.exists(self.path):
+            return jobs, offsets
+        with open(self.path, "rb") as f:
+            offset = 0
+            for line in f:
+                start, offset = offset, offset + len(line)
+                try:
+                    record = json.loads(line)
+                    _apply(jobs, offsets, record, start, "prompt" in record)
+                except (ValueError, KeyError, TypeError):
+                    continue # Torn or foreign line; skipped
+        return jobs, offsets
+
+    def _open(self):
+        """Opens the file for appending, first ending a line torn by a crash."""
+        if os.path.exists(self.path) and os.path.getsize(self.path):
+            with open(self.path, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                torn = f.read(1) != b"\n"
+            if torn:
+                with open(self.path, "ab") as f:
+                    f.write(b"\n")
+        return open(self.path, "ab")
+
+    def _write(self, record, raw=None):
+        line = _json_line(record, raw)
+        with self._lock:
+            if self._closed:
+                return
+            _apply(self._jobs, self._offsets, record, self._file.tell(), raw is not None)
+            self._file.write(line)
+            self._file.flush() # Survives a crash of this process
+            if self.sync_interval:
+                self._dirty = True
+            else:
+                os.fsync(self._file.fileno())
+
+    def _sync_loop(self):
+        while not self._wakeup.wait(self.sync_interval):
+            self.sync()
+
+    def sync(self):
+        """Forces everything written so far to disk."""
+        with self._lock:
+            if self._closed or not self._dirty:
+                return
+            self._dirty = False
+            os.fsync(self._file.fileno())
+
+    # --- Records (called by the managers' job registry) ---
+
+    def submitted(self, prompt_id, server=None, status="queued", prompt_bytes=None, priority=None, tenant=None):
+        record = {"op": "submit", "id": prompt_id, "server": server, "status": status, "t": time.time()}
+        if priority is not None:
+            record["priority"] = priority
+        if tenant is not None:
+            record["tenant"] = tenant
+        self._write(record, prompt_bytes)
+
+    def params(self, prompt_id, params):
+        self._write({"op": "params", "id": prompt_id, "params": params})
+
+    def dispatched(self, prompt_id, server):
+        self._write({"op": "dispatch", "id": prompt_id, "server": server})
+
+    def moved(self, prompt_id, server, server_prompt_id):
+        self._write({"op": "move", "id": prompt_id, "server": server, "server_id": server_prompt_id})
+
+    def finished(self, prompt_id, status, error=None):
+        record = {"op": "finish", "id": prompt_id, "status": status, "t": time.time()}
+        if error is not None:
+            record["error"] = str(error)
+        self._write(record)
+
+    # --- Reading ---
+
+    def jobs(self):
+        """
+        Returns the state of every journaled prompt in submission order, as dicts with
+        'prompt_id', 'status' ("held", "queued", "finished", "error" or "cancelled"), 'server',
+        'server_prompt_id' (after a cluster failover), 'params', 'priority', 'tenant',
+        'submitted_at', 'finished_at' and 'error' (its message).
+        """
+        with self._lock:
+            return [dict(job) for job in self._jobs.values()]
+
+    def prompts(self, prompt_ids):
+        """Returns {prompt_id: encoded prompt} for those of prompt_ids that were journaled while held."""
+        with self._lock:
+            if not self._closed:
+                self._file.flush()
+            offsets = {prompt_id: self._offsets[prompt_id] for prompt_id in prompt_ids if prompt_id in self._offsets}
+            prompts = {}
+            for prompt_id, offset in offsets.items():
+                prompt_bytes = self._read_prompt(offset)
+                if prompt_bytes is not None:
+                    prompts[prompt_id] = prompt_bytes
+            return prompts
+
+    def _read_prompt(self, offset):
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            try:
+                record = json.loads(f.readline())
+            except ValueError:
+                return None
+        return _encode(record["prompt"]) if "prompt" in record else None
+
+    def compact(self):
+        """
+        Rewrites the journal with one line per prompt that has not finished, dropping finished,
+        failed and cancelled ones. Only call it once their outcomes have been collected.
+        """
+        with self._lock: # Held throughout, so no line written meanwhile is lost by the rewrite
+            if not self._closed:
+                self._file.flush()
+            jobs = OrderedDict()
+            offsets = {}
+            temp_path = self.path + ".tmp"
+            with open(temp_path, "wb") as f:
+                for prompt_id, job in self._jobs.items():
+                    if job["status"] in ("finished", "error", "cancelled"):
+                        continue
+                    jobs[prompt_id] = job
+                    record = {"op": "submit", "id": prompt_id, "server": job["server"], "status": job["status"],
+                              "t": job["submitted_at"], "priority": job["priority"]}
+                    if job["tenant"] is not None:
+                        record["tenant"] = job["tenant"]
+                    if job["params"] is not None:
+                        record["params"] = job["params"]
+                    raw = self._read_prompt(self._offsets[prompt_id]) if prompt_id in self._offsets else None
+                    if raw is not None:
+                        offsets[prompt_id] = f.tell()
+                    f.write(_json_line(record, raw))
+                    if job["server_prompt_id"] is not None:
+                        f.write(_json_line({"op": "move", "id": prompt_id, "server": job["server"],
+                                            "server_id": job["server_prompt_id"]}))
+                f.flush()
+                os.fsync(f.fileno())
+            if not self._closed:
+                self._file.close()
+            os.replace(temp_path, self.path)
+            self._jobs, self._offsets = jobs, offsets
+            if not self._closed:
+                self._file = open(self.path, "ab")
+                self._dirty = False
+
+    def close(self):
+        """Syncs and closes the file and stops the sync thread. The state read by jobs() stays available."""
+        self._wakeup.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+        self.sync()
+        with self._lock:
+            if not self._closed:
+                self._closed = True
+                self._file.close()
@@ -0,0 +1,133 @@
+import copy
+import json
+import uuid
+
+from .instrumentation import _span
+
+_UNSET = object()
+_SEPARATORS = (",", ":")
+
+
+def _normalize_key(container, key):
+    """Lists are indexed with ints; workflow paths may spell indices as digit strings."""
+    if isinstance(container, list) and isinstance(key, str) and key.isdigit():
+        return int(key)
+    return key
+
+
+def _copy_with_value(workflow, path, value):
+    """
+    Returns a copy of workflow with value set at path.
+    Only the containers along the path are copied; everything else is shared with workflow.
+    """
+    try:
+        root = copy.copy(workflow)
+        target = root
+        for key in path[:-1]:
+            key = _normalize_key(target, key)
+            child = copy.copy(target[key])
+            target[key] = child
+            target = child
+        target[_normalize_key(target, path[-1])] = value
+        return root
+    except (KeyError, IndexError, TypeError) as e:
+        raise ValueError(f"Invalid path {path} for workflow structure: {e}")
+
+
+def _encode(value):
+    """
+    Canonical JSON (sorted keys, no whitespace, UTF-8). Every prompt is sent in this form, so
+    the result cache can hash the bytes as they are.
+    """
+    return json.dumps(value, sort_keys=True, separators=_SEPARATORS, ensure_ascii=False).encode('utf-8')
+
+
+class WorkflowTemplate:
+    """
+    A workflow compiled once into pre-encoded JSON fragments with named parameter slots.
+
+    Rendering splices the JSON encoding of each bound value between the fixed fragments,
+    so only the slot values are serialized per request:
+
+        template = WorkflowTemplate(workflow, prompt=["6", "inputs", "text"], seed=["3", "inputs", "seed"])
+        body = template.render_prompt(prompt="a cat", seed=42)
+
+    Slots that are not bound at render time keep the workflow's value at compile time.
+    A slot path may name a new key in an existing dict, in which case it must always be bound.
+    The template is independent of any server or client ID and can be shared between managers.
+    """
+
+    def __init__(self, workflow, **slots):
+        if workflow is None:
+            raise ValueError("No workflow loaded.")
+        if not slots:
+            raise ValueError("A template needs at least one named slot.")
+        self.slots = {}
+        self._defaults = {}
+        markers = {}
+        token = uuid.uuid4().hex
+        marked = workflow
+        for name, path in slots.items():
+            if not isinstance(path, (list, tuple)) or not path:
+                raise ValueError(f"Slot '{name}' must be a non-empty path list.")
+            self.slots[name] = list(path)
+            default = self._read(workflow, path)
+            if default is not _UNSET:
+                self._defaults[name] = _encode(default)
+            markers[name] = f"@@comfyapi-slot:{token}:{name}@@"
+            marked = _copy_with_value(marked, path, markers[name])
+
+        encoded = json.dumps(marked, sort_keys=True, separators=_SEPARATORS, ensure_ascii=False)
+        positions = []
+        for name, marker in markers.items():
+            quoted = json.dumps(marker)
+            index = encoded.find(quoted)
+            if index < 0:
+                # Another slot's path replaced an ancestor of this one
+                raise ValueError(f"Slot '{name}' overlaps another slot's path.")
+            positions.append((index, len(quoted), name))
+        positions.sort()
+
+        self._fragments = []
+        self._order = []
+        cursor = 0
+        for index, length, name in positions:
+            self._fragments.append(encoded[cursor:index].encode('utf-8'))
+            self._order.append(name)
+            cursor = index + length
+        self._fragments.append(encoded[cursor:].encode('utf-8'))
+
+    @staticmethod
+    def _read(workflow, path):
+        """Returns the value at path, _UNSET if only the final dict key is missing, or raises ValueError."""
+        target = workflow
+        try:
+            for key in path[:-1]:
+                target = target[_normalize_key(target, key)]
+            final_key = _normalize_key(target, path[-1])
+            if isinstance(target, dict) and final_key not in target:
+                return _UNSET
+            return target[final_key]
+        except (KeyError, IndexError, TypeError) as e:
+            raise ValueError(f"Invalid path {list(path)} for workflow structure: {e}")
+
+    def render_prompt(self, **values):
+        """Returns the UTF-8 JSON encoding of the workflow with the given slot values."""
+        unknown = set(values) - set(self.slots)
+        if unknown:
+            raise ValueError(f"Unknown template slot(s): {sorted(unknown)}")
+        with _span("serialize"):
+            parts = [self._fragments[0]]
+            for name, fragment in zip(self._order, self._fragments[1:]):
+                if name in values:
+                    parts.append(_encode(values[name]))
+                elif name in self._defaults:
+                    parts.append(self._defaults[name])
+                else:
+                    raise ValueError(f"Template slot '{name}' has no default and must be bound.")
+                parts.append(fragment)
+            return b"".join(parts)
+
+    def render(self, **values):
+        """Returns the workflow dict with the given slot values (decoded; mainly for inspection)."""
+        return json.loads(self.render_prompt(**values))
@@ -0,0 +1,206 @@
+import copy
+import json
+import logging
+import os
+import base64
+
+from .client import ComfyAPIError, _report_error
+from .template import WorkflowTemplate, _normalize_key
+from .imaging import _fit_image
+
+
+_logger = logging.getLogger(__name__)
+
+_UNSET = object()
+
+
+class _OverlayNode:
+    """One step of an overlay path: an optional replacement value plus edits below it."""
+    __slots__ = ("value", "children")
+
+    def __init__(self):
+        self.value = _UNSET
+        self.children = {}
+
+
+class _WorkflowOverlay:
+    """
+    A base workflow plus a sparse trie of path -> value edits.
+
+    `set()` validates and records an edit in O(path length) without copying anything.
+    `materialize()` builds the edited workflow once, copying only the containers on
+    edited paths and sharing everything else with the base (which is never mutated).
+    """
+    __slots__ = ("base", "_root", "_dirty")
+
+    def __init__(self, base):
+        self.base = base
+        self._root = _OverlayNode()
+        self._dirty = False
+
+    def set(self, path, value):
+        """Records value at path. Raises ValueError (leaving the overlay untouched) if path is invalid."""
+        if not path:
+            raise ValueError("Path must contain at least one key.")
+        keys = []
+        container = self.base
+        node = self._root
+        try:
+            # Walk the edited view of the workflow: an edited value shadows the base below it
+            for key in path[:-1]:
+                key = _normalize_key(container, key)
+                child = node.children.get(key) if node is not None else None
+                if child is not None and child.value is not _UNSET:
+                    container = child.value
+                elif isinstance(container, (dict, list)):
+                    container = container[key]
+                else:
+                    raise TypeError(f"'{type(container).__name__}' object is not subscriptable")
+                keys.append(key)
+                node = child
+            final_key = _normalize_key(container, path[-1])
+            if isinstance(container, list):
+                container[final_key] # Lists can only be assigned existing indices
+            elif not isinstance(container, dict):
+                raise TypeError(f"'{type(container).__name__}' object does not support item assignment")
+            keys.append(final_key)
+        except (KeyError, IndexError, TypeError) as e:
+            raise ValueError(f"Invalid path {path} for workflow structure: {e}")
+
+        node = self._root
+        for key in keys:
+            node = node.children.setdefault(key, _OverlayNode())
+        node.value = value
+        node.children = {} # Earlier edits below this path are superseded
+        self._dirty = True
+
+    def materialize(self):
+        """
+        Returns the edited workflow. The result becomes the new base, so it is built at most
+        once per batch of edits and direct changes made to it are kept.
+        """
+        if self._dirty:
+            self.base = self._apply(self.base, self._root)
+            self._root = _OverlayNode()
+            self._dirty = False
+        return self.base
+
+    @classmethod
+    def _apply(cls, container, node):
+        result = list(container) if isinstance(container, list) else dict(container)
+        for key, child in node.children.items():
+            source = child.value if child.value is not _UNSET else result[key]
+            result[key] = cls._apply(source, child) if child.children else source
+        return result
+
+
+class _WorkflowEditor:
+    """
+    Workflow loading and editing shared by ComfyAPIManager and AsyncComfyAPIManager.
+    These methods only touch the local workflow and never perform network I/O.
+    """
+
+    _overlay = None
+
+    @property
+    def workflow(self):
+        """The current workflow with all pending edits applied."""
+        if self._overlay is None:
+            return None
+        return self._overlay.materialize()
+
+    @workflow.setter
+    def workflow(self, value):
+        # Copied once here so the overlay's base never shares containers with the caller's dict
+        self._overlay = _WorkflowOverlay(copy.deepcopy(value)) if value is not None else None
+
+    def load_workflow(self, filepath):
+        """Loads a workflow from a JSON file and stores it locally."""
+        try:
+            with open(filepath, 'r', encoding='utf-8') as f:
+                self._overlay = _WorkflowOverlay(json.load(f)) # Freshly parsed, nothing to copy
+        except FileNotFoundError:
+            raise _report_error(ComfyAPIError(f"Workflow file not found: {filepath}"))
+        except json.JSONDecodeError:
+            raise _report_error(ComfyAPIError(f"Failed to decode JSON from workflow file: {filepath}"))
+        except Exception as e:
+            raise _report_error(ComfyAPIError(f"Error loading workflow file {filepath}: {e}"))
+
+    def edit_workflow(self, path, value):
+        """
+        Sets value at path in the stored workflow.
+        Edits are recorded copy-on-write and applied once, the next time self.workflow is
+        read (e.g. on submit), so an edit costs O(path length) however large the workflow is.
+        An invalid path raises ValueError and leaves the workflow unchanged.
+        """
+        if self._overlay is None:
+            raise ValueError("No workflow loaded.")
+        self._overlay.set(path, value)
+
+    def compile_template(self, **slots):
+        """
+        Compiles the current workflow into a WorkflowTemplate with named parameter slots, e.g.
+        compile_template(prompt=["6", "inputs", "text"], seed=["3", "inputs", "seed"]).
+        """
+        return WorkflowTemplate(self.workflow, **slots)
+
+    def set_base64_image(self, node_id, image_path, temp_name=None, max_size_bytes=1000000, max_dimension=1024, jpeg_quality=85, min_quality=20, image_format="JPEG"):
+        """
+        Encodes a local image and injects it into a Base64ImageLoader node.
+
+        This method will automatically resize and recompress large images so the base64 payload
+        remains reasonably small and quick to transmit. It requires Pillow (`pip install pillow`) to
+        perform image processing; if Pillow is not available, a helpful error is raised when resizing is needed.
+        Fitting usually takes two or three encodes: the quality is interpolated between measured
+        sizes and, when quality alone is not enough, the scale is estimated from bytes per pixel.
+
+        :param node_id: The ID of the node (string or int)
+        :param image_path: Path to the local image file
+        :param temp_name: Optional custom name for the file on the server
+        :param max_size_bytes: Maximum allowed size in bytes for the encoded image (default 1,000,000)
+        :param max_dimension: Maximum width/height for the image in pixels (default 1024)
+        :param jpeg_quality: Starting quality for recompression (default 85)
+        :param min_quality: Minimum quality to attempt before further resizing (default 20)
+        :param image_format: "JPEG" (default) or "WEBP" for recompressed images; WebP keeps alpha
+        :return: A dict describing the result: 'resized' (bool), 'bytes', 'fits' (False if even the
+                 smallest recompression exceeds max_size_bytes; it is used anyway), and when the image was
+                 recompressed 'format', 'quality', 'size', 'encodes' and per-stage 'timings' in seconds
+        """
+        if not os.path.isfile(image_path):
+            raise FileNotFoundError(f"Local image not found at: {image_path}")
+
+        original_size = os.path.getsize(image_path)
+        final_temp_name = temp_name or os.path.basename(image_path)
+
+        # If the file is already small enough, use it directly
+        if original_size <= max_size_bytes:
+            with open(image_path, "rb") as image_file:
+                processed_bytes = image_file.read()
+            stats = {"resized": False, "bytes": len(processed_bytes), "fits": True}
+        else:
+            processed_bytes, extension, stats = _fit_image(
+                image_path, max_size_bytes, max_dimension=max_dimension,
+                quality=jpeg_quality, min_quality=min_quality, image_format=image_format)
+            stats["resized"] = True
+            # Ensure temp name reflects the output format
+            final_temp_name = os.path.splitext(final_temp_name)[0] + extension
+            timings = stats["timings"]
+            _logger.debug("Resized %s to %sx%s %s q%s (%s bytes) in %s encodes; load %.3fs, resize %.3fs, encode %.3fs",
+                          os.path.basename(image_path), stats['size'][0], stats['size'][1], stats['format'],
+                          stats['quality'], stats['bytes'], stats['encodes'],
+                          timings['load'], timings['resize'], timings['encode'])
+
+        # Encode to base64
+        encoded_string = base64.b64encode(processed_bytes).decode('utf-8')
+
+        # 3. Use edit_workflow to update the node's input fields
+        node_id_str = str(node_id)
+
+        # Set the base64 string
+        self.edit_workflow([node_id_str, "inputs", "image_base64"], encoded_string)
+
+        # Set the metadata fields
+        self.edit_workflow([node_id_str, "inputs", "image_name"], final_temp_name)
+        # Note: image_path is set to the original path for traceability
+        self.edit_workflow([node_id_str, "inputs", "image_path"], image_path)
+        return stats
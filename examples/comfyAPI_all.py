@@ -40,7 +40,9 @@ print("Batch results:", results)
 if errors:
     print("Errors during batch:", errors)
 
-for filename, url in results:
-    manager.download_output(url, save_path=str(out_dir), filename=filename)
+saved, download_errors = manager.download_outputs(results, save_path=str(out_dir), concurrency=8)
+print("Saved:", saved)
+if download_errors:
+    print("Download errors:", download_errors)
 
 print("All done.")
\ No newline at end of file
@@ -2,7 +2,6 @@ import comfyapi as com
 import gradio as gr
 import random
 import sys
-import time
 
 # Ensure BASE_URL includes scheme
 if len(sys.argv) > 1:
@@ -20,7 +19,10 @@ manager.set_base_url(BASE_URL)
 WORKFLOW_PATH = "./workflow.json"
 manager.load_workflow(WORKFLOW_PATH)
 
-def main(prompt, height, width, seed, random_seed, steps, model):
+# Prompt each browser session is waiting for, so its Cancel button can stop it on the server
+active_prompts = {}
+
+def main(prompt, height, width, seed, random_seed, steps, model, session=None):
     try:
         # Always work on a fresh copy
         manager.load_workflow(WORKFLOW_PATH)
@@ -33,18 +35,21 @@ def main(prompt, height, width, seed, random_seed, steps, model):
         manager.edit_workflow(["3", "inputs", "steps"], steps)
         manager.edit_workflow(["10", "inputs", "ckpt_name"], model)
 
-        prompt_id = manager.submit_workflow()
-        # Wait for finish (blocking)
-        while not manager.check_queue(prompt_id):
-            print("Waiting for workflow to finish...")
-            time.sleep(1)
-        url, filename = manager.find_output(prompt_id, with_filename=True)
-        if url is None:
-            return None, "No output image found."
+        # Runs ahead of any batch work queued on the same server
+        prompt_id = manager.submit_workflow(priority="interactive")
+        active_prompts[session] = prompt_id
+        # Returns as soon as the server reports the prompt finished (no fixed-interval polling)
+        filename, url = manager.wait_for_finish(prompt_id)
         print(f"Workflow finished successfully! Output URL: {url}")
         return url, None
+    except com.CancelledError:
+        return None, "Cancelled."
+    except com.HistoryError:
+        return None, "No output image found."
     except Exception as e:
         return None, f"Error: {str(e)}"
+    finally:
+        active_prompts.pop(session, None)
 
 # --- BEAUTIFYING THE UI FOR GRADIO 5.x ---
 CUSTOM_CSS = '''
@@ -72,21 +77,30 @@ with gr.Blocks(theme=gr.themes.Soft(), css=CUSTOM_CSS) as demo:
                 random_seed = gr.Checkbox(label="Randomize Seed", value=False)
             steps_slider = gr.Slider(minimum=1, maximum=150, value=20, label="Steps", interactive=True)
             model = gr.Dropdown(choices=["WAI-ANI-HENTAI-PONYXL.safetensors", "WAI-ANI-Illustrious-PONYXL-v.13.safetensors", "Realistic_vision.safetensors"], label="Model", interactive=True)
-            submit_button = gr.Button("✨ Generate Image", elem_id="submit_btn")
+            with gr.Row():
+                submit_button = gr.Button("✨ Generate Image", elem_id="submit_btn")
+                cancel_button = gr.Button("Cancel", elem_id="cancel_btn")
         with gr.Column():
             output_image = gr.Image(label="Result", elem_id="output_img")
             error_box = gr.Textbox(label="Error", interactive=False, visible=False, elem_id="error_box")
 
-    def handle_submit(*args):
-        img_url, error = main(*args)
+    def handle_submit(*args, request: gr.Request):
+        img_url, error = main(*args, session=request.session_hash)
         if error:
             return img_url, gr.update(value=error, visible=True)
         return img_url, gr.update(value="", visible=False)
 
+    def handle_cancel(request: gr.Request):
+        # Frees the GPU right away; the waiting handler returns "Cancelled."
+        prompt_id = active_prompts.get(request.session_hash)
+        if prompt_id:
+            manager.cancel(prompt_id)
+
     submit_button.click(
         fn=handle_submit,
         inputs=[prompt_textbox, height_slider, width_slider, seed, random_seed, steps_slider, model],
         outputs=[output_image, error_box]
     )
+    cancel_button.click(fn=handle_cancel)
 
 demo.launch(share=True)
@@ -19,6 +19,9 @@ setup(
         'requests>=2.20.0',
         'websocket-client>=1.0.0', 
     ],
+    extras_require={
+        'async': ['aiohttp>=3.8'],
+    },
     python_requires='>=3.7', 
     classifiers=[
         'Programming Language :: Python :: 3',
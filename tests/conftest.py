@@ -0,0 +1,49 @@
+"""Shared fixtures: every test runs against the offline mock server in benchmarks/mock_comfyui.py."""
+import os
+import sys
+
+import pytest
+
+_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+sys.path.insert(0, _ROOT)
+sys.path.insert(0, os.path.join(_ROOT, "benchmarks"))
+
+from mock_comfyui import MockServer  # noqa: E402
+
+import comfyapi  # noqa: E402
+
+WORKFLOW = os.path.join(_ROOT, "examples", "workflow_t2i.json")
+SEED_PATH = ["3", "inputs", "seed"]
+
+
+@pytest.fixture
+def start_server():
+    """Starts mock servers on demand (start_server(latency=..., ...)) and stops them afterwards."""
+    servers = []
+
+    def start(**kwargs):
+        kwargs.setdefault("latency", 0.01)
+        server = MockServer(**kwargs).start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        try:
+            server.stop()
+        except OSError:
+            pass # Already killed
+
+
+@pytest.fixture
+def server(start_server):
+    return start_server()
+
+
+@pytest.fixture
+def manager(server):
+    manager = comfyapi.ComfyAPIManager()
+    manager.set_base_url(server.url)
+    manager.load_workflow(WORKFLOW)
+    yield manager
+    manager.close()
@@ -0,0 +1,79 @@
+import asyncio
+
+import comfyapi
+
+from conftest import WORKFLOW
+
+
+async def _with_manager(server, body):
+    manager = comfyapi.AsyncComfyAPIManager()
+    manager.set_base_url(server.url)
+    manager.load_workflow(WORKFLOW)
+    try:
+        return await body(manager)
+    finally:
+        await manager.close()
+
+
+def test_batch_completes_over_websocket(server):
+    async def body(manager):
+        uids = await manager.batch_submit(num_seeds=20)
+        return uids, await manager.wait_and_get_all_outputs(uids, max_wait_time=10)
+
+    uids, (results, errors) = asyncio.run(_with_manager(server, body))
+    assert len(uids) == 20 and len(results) == 20 and not errors
+
+
+def test_partial_batch_failure_keeps_successes(start_server):
+    server = start_server(failure_rate=0.5, seed=1)
+
+    async def body(manager):
+        uids = await manager.batch_submit(num_seeds=10)
+        return await manager.wait_and_get_all_outputs(uids, max_wait_time=10)
+
+    results, errors = asyncio.run(_with_manager(server, body))
+    assert len(results) + len(errors) == 10 and results and errors
+    assert all(isinstance(error, comfyapi.ExecutionError) for error in errors)
+
+
+def test_cancel_batch(start_server):
+    server = start_server(latency=5)
+
+    async def body(manager):
+        uids = await manager.batch_submit(num_seeds=4)
+        cancelled = await manager.cancel_batch(uids)
+        return uids, cancelled, await manager.wait_and_get_all_outputs(uids, max_wait_time=2)
+
+    uids, cancelled, (results, errors) = asyncio.run(_with_manager(server, body))
+    assert cancelled == uids and not results
+    assert all(isinstance(error, comfyapi.CancelledError) for error in errors)
+
+
+def test_poller_survives_a_failed_check(server):
+    async def body(manager):
+        calls = []
+        check = manager._check
+
+        async def flaky_check(prompt_ids):
+            calls.append(list(prompt_ids))
+            if len(calls) == 1:
+                raise comfyapi.HistoryError("History unavailable")
+            return await check(prompt_ids)
+        manager._check = flaky_check
+        uid = await manager.submit_workflow()
+        return await manager.wait_for_finish(uid, max_wait_time=10), calls
+
+    (filename, url), calls = asyncio.run(_with_manager(server, body))
+    assert filename.endswith(".png") and len(calls) >= 2
+
+
+def test_wait_for_finish_returns_a_known_outcome(server):
+    async def body(manager):
+        uid = await manager.submit_workflow()
+        first = await manager.wait_for_finish(uid, max_wait_time=10)
+        manager._cached_outcome = lambda prompt_id, all_outputs=False: first
+        manager._track = None # A known outcome must not be waited for again
+        return first, await manager.wait_for_finish(uid, max_wait_time=10)
+
+    first, second = asyncio.run(_with_manager(server, body))
+    assert second == first
@@ -0,0 +1,50 @@
+import itertools
+import threading
+import time
+
+import pytest
+
+import comfyapi
+from comfyapi.client import _collect_batch, _submit_seeds, _submit_variants
+
+WORKFLOW = {"3": {"class_type": "KSampler", "inputs": {"seed": 0}}}
+
+
+def test_submissions_stay_within_the_worker_pool():
+    lock = threading.Lock()
+    in_flight, peak = [0], [0]
+
+    def submit_bytes(prompt_bytes):
+        with lock:
+            in_flight[0] += 1
+            peak[0] = max(peak[0], in_flight[0])
+        time.sleep(0.01)
+        with lock:
+            in_flight[0] -= 1
+        return prompt_bytes.decode("utf-8")
+
+    outcomes = list(_submit_seeds(submit_bytes, WORKFLOW, ["3", "inputs", "seed"], seeds=list(range(40)), concurrency=4))
+    assert len(outcomes) == 40 and peak[0] <= 4
+    assert [outcome["seed"] for outcome in sorted(outcomes, key=lambda o: o["index"])] == list(range(40))
+
+
+def test_variants_are_consumed_lazily():
+    template = comfyapi.WorkflowTemplate(WORKFLOW, seed=["3", "inputs", "seed"])
+    variants = ({"seed": seed} for seed in itertools.count())
+    outcomes = _submit_variants(lambda prompt_bytes: "uid", template, variants, concurrency=2)
+    for _ in zip(range(5), outcomes):
+        pass
+    outcomes.close()
+    assert next(variants)["seed"] <= 5 + 2 * 2 # Only a bounded window was rendered ahead
+
+
+def test_failed_seeds_are_skipped_unless_all_fail():
+    def submit_bytes(prompt_bytes):
+        if b'"seed":1' in prompt_bytes:
+            raise comfyapi.QueueError("rejected")
+        return prompt_bytes.decode("utf-8")
+
+    uids = _collect_batch(_submit_seeds(submit_bytes, WORKFLOW, ["3", "inputs", "seed"], seeds=[0, 1, 2]))
+    assert len(uids) == 2
+    with pytest.raises(comfyapi.QueueError):
+        _collect_batch(_submit_seeds(submit_bytes, WORKFLOW, ["3", "inputs", "seed"], seeds=[1]))
@@ -0,0 +1,15 @@
+import bench
+
+
+def test_scenario_runs_against_the_mock_process():
+    row = bench.run_scenario(5, output_size=1024, downloads=2)
+    assert row["jobs"] == 5 and row["errors"] == 0
+    assert row["submit_per_s"] > 0 and row["download_mb_per_s"] > 0
+
+
+def test_compare_reports_only_real_regressions():
+    baseline = [dict(dict.fromkeys(bench._METRICS, 50.0), jobs=100, submit_per_s=1000.0, cpu_ms_per_job=2.0)]
+    rows = [dict(baseline[0], submit_per_s=500.0, cpu_ms_per_job=2.1)]
+    regressions = bench.compare(rows, baseline, tolerance=0.25)
+    assert len(regressions) == 1 and "submit_per_s" in regressions[0]
+    assert bench.compare(baseline, baseline, tolerance=0.25) == []
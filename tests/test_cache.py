@@ -0,0 +1,66 @@
+import comfyapi
+from comfyapi.cache import _result_key
+from comfyapi.template import _encode
+
+from conftest import SEED_PATH, WORKFLOW
+
+
+def _manager(server, cache):
+    manager = comfyapi.ComfyAPIManager(result_cache=cache)
+    manager.set_base_url(server.url)
+    manager.load_workflow(WORKFLOW)
+    return manager
+
+
+def _prompts(server):
+    return server.state.stats()["counters"].get("POST /prompt", 0)
+
+
+def test_template_and_workflow_encode_the_same_bytes(manager):
+    manager.edit_workflow(SEED_PATH, 7)
+    template = comfyapi.WorkflowTemplate(manager.workflow, seed=SEED_PATH)
+    assert template.render_prompt(seed=7) == _encode(manager.workflow)
+    assert _result_key(template.render_prompt(seed=7)) == _result_key(_encode(manager.workflow))
+
+
+def test_finished_prompt_is_answered_from_the_cache(server, tmp_path):
+    cache = comfyapi.ResultCache(str(tmp_path / "results.jsonl"))
+    manager = _manager(server, cache)
+    try:
+        prompt_id = manager.submit_workflow()
+        result = manager.wait_for_finish(prompt_id)
+        assert manager.submit_workflow() == prompt_id
+        assert manager.wait_for_finish(prompt_id) == result
+        assert _prompts(server) == 1 and manager.get_job(prompt_id).cached
+    finally:
+        manager.close()
+    assert cache._file is None # Closed with its only manager
+
+
+def test_shared_cache_joins_a_prompt_running_on_the_same_server(start_server):
+    server = start_server(latency=0.3)
+    cache = comfyapi.ResultCache()
+    first, second = _manager(server, cache), _manager(server, cache)
+    try:
+        prompt_id = first.submit_workflow()
+        assert second.submit_workflow() == prompt_id
+        assert second.get_job(prompt_id).server == server.url
+        assert second.wait_for_finish(prompt_id, max_wait_time=10)[1].startswith(server.url)
+        assert _prompts(server) == 1
+    finally:
+        first.close()
+        second.close()
+
+
+def test_shared_cache_runs_again_for_a_manager_on_another_server(start_server):
+    servers = [start_server(latency=0.3) for _ in range(2)]
+    cache = comfyapi.ResultCache()
+    first, second = _manager(servers[0], cache), _manager(servers[1], cache)
+    try:
+        prompt_id = first.submit_workflow()
+        other_id = second.submit_workflow()
+        assert other_id != prompt_id and _prompts(servers[1]) == 1
+        assert second.wait_for_finish(other_id, max_wait_time=10)[1].startswith(servers[1].url)
+    finally:
+        first.close()
+        second.close()
@@ -0,0 +1,75 @@
+import time
+
+import pytest
+
+import comfyapi
+
+from conftest import WORKFLOW
+
+
+@pytest.mark.parametrize("max_queued", [None, 2])
+def test_cancel_batch_dequeues_and_interrupts(start_server, max_queued):
+    server = start_server(latency=5)
+    manager = comfyapi.ComfyAPIManager(max_queued=max_queued)
+    manager.set_base_url(server.url)
+    manager.load_workflow(WORKFLOW)
+    try:
+        uids = manager.batch_submit(num_seeds=6)
+        while not server.state.queue_state()["queue_running"]:
+            time.sleep(0.01)
+        running = server.state.queue_state()["queue_running"][0][1]
+        while manager.get_job(running).status == "held": # Accepted, but the feeder is still recording it
+            time.sleep(0.01)
+        assert manager.cancel_batch(uids) == uids
+        started = time.monotonic()
+        results, errors = manager.wait_and_get_all_outputs(uids)
+        assert time.monotonic() - started < 1
+        assert not results and all(isinstance(error, comfyapi.CancelledError) for error in errors)
+        assert all(manager.get_job(uid).status == "cancelled" for uid in uids)
+        state = server.state.queue_state()
+        assert not state["queue_pending"]
+        assert server.state.counters["POST /interrupt"] == 1
+        with pytest.raises(comfyapi.CancelledError):
+            manager.wait_for_finish(uids[0])
+        # The server keeps working
+        server.state.latency = 0.01
+        manager.wait_for_finish(manager.submit_workflow())
+    finally:
+        manager.close()
+
+
+def test_finished_prompts_are_not_cancelled(manager):
+    uid = manager.submit_workflow()
+    manager.wait_for_finish(uid)
+    assert not manager.cancel(uid)
+    assert manager.get_job(uid).status == "finished"
+
+
+def test_cancellations_are_not_errors(start_server):
+    recorder = comfyapi.add_instrumentation(comfyapi.MetricsRecorder())
+    server = start_server(latency=5)
+    manager = comfyapi.ComfyAPIManager()
+    manager.set_base_url(server.url)
+    manager.load_workflow(WORKFLOW)
+    try:
+        uids = manager.batch_submit(num_seeds=5)
+        assert len(manager.cancel_batch(uids)) == 5
+        manager.wait_and_get_all_outputs(uids)
+        assert "errors" not in recorder.snapshot()["counters"]
+    finally:
+        manager.close()
+        comfyapi.remove_instrumentation(recorder)
+
+
+def test_cluster_cancels_on_every_server(start_server):
+    servers = [start_server(latency=5) for _ in range(2)]
+    cluster = comfyapi.ComfyClusterManager([server.url for server in servers])
+    cluster.load_workflow(WORKFLOW)
+    try:
+        uids = cluster.batch_submit(num_seeds=6)
+        assert cluster.cancel_batch(uids) == uids
+        results, errors = cluster.wait_and_get_all_outputs(uids)
+        assert not results and all(isinstance(error, comfyapi.CancelledError) for error in errors)
+        assert not any(server.state.queue_state()["queue_pending"] for server in servers)
+    finally:
+        cluster.close()
@@ -0,0 +1,76 @@
+import collections
+import time
+
+import comfyapi
+
+from conftest import WORKFLOW
+
+
+def _cluster(servers, **kwargs):
+    cluster = comfyapi.ComfyClusterManager([server.url for server in servers], **kwargs)
+    cluster.load_workflow(WORKFLOW)
+    return cluster
+
+
+def test_batch_is_spread_over_servers(start_server):
+    servers = [start_server(latency=0.05) for _ in range(2)]
+    cluster = _cluster(servers)
+    try:
+        uids = cluster.batch_submit(num_seeds=20)
+        spread = collections.Counter(cluster.get_job(uid).server for uid in uids)
+        assert set(spread) == {server.url for server in servers}
+        results, errors = cluster.wait_and_get_all_outputs(uids)
+        assert len(results) == 20 and not errors
+    finally:
+        cluster.close()
+
+
+def test_prompts_fail_over_from_a_dead_server(start_server):
+    servers = [start_server(latency=0.05) for _ in range(2)]
+    cluster = _cluster(servers, failover_after=0.5)
+    try:
+        uids = cluster.batch_submit(num_seeds=20)
+        victim = servers[1]
+        assert victim.state.queue_state()["queue_pending"] # Still has prompts to lose
+        victim.kill()
+        results, errors = cluster.wait_and_get_all_outputs(uids, max_wait_time=30)
+        assert len(results) == 20 and not errors
+        assert all(url.startswith(servers[0].url) for _, url in results)
+        # New prompts avoid the dead server
+        assert cluster.get_job(cluster.submit_workflow()).server == servers[0].url
+    finally:
+        cluster.close()
+
+
+def test_failover_goes_through_the_feeder(start_server):
+    servers = [start_server(latency=0.5) for _ in range(2)]
+    cluster = _cluster(servers, failover_after=0.5, max_queued=2)
+    try:
+        uids = cluster.batch_submit(num_seeds=8)
+        cluster._get_feeder()._RECONCILE_INTERVAL = 0.5
+        while len(servers[1].state.queue_state()["queue_pending"]) < 1:
+            time.sleep(0.01)
+        servers[1].kill()
+        results, errors = cluster.wait_and_get_all_outputs(uids, max_wait_time=30)
+        assert len(results) == 8 and not errors
+        # Moved prompts waited for a free slot instead of piling onto the surviving server
+        assert servers[0].state.max_pending <= 2
+        assert cluster.feeder_stats()["queued"] == 0
+    finally:
+        cluster.close()
+
+
+def test_failover_keeps_the_priority(start_server):
+    servers = [start_server(latency=0.05) for _ in range(2)]
+    cluster = _cluster(servers, failover_after=0.5)
+    try:
+        uid = cluster.submit_workflow(priority="interactive")
+        server = cluster.get_job(uid).server
+        sent = []
+        survivor = next(backend.client for url, backend in cluster._backends.items() if url != server)
+        queue_prompt_bytes = survivor.queue_prompt_bytes
+        survivor.queue_prompt_bytes = lambda *args, **kwargs: sent.append(kwargs.get("front")) or queue_prompt_bytes(*args, **kwargs)
+        client, _ = cluster._failover(uid, server)
+        assert client is survivor and sent == [True]
+    finally:
+        cluster.close()
@@ -0,0 +1,126 @@
+import asyncio
+import hashlib
+import os
+import time
+
+import pytest
+
+import comfyapi
+from comfyapi.client import _resume_action
+
+
+def _view_url(server, filename):
+    return f"{server.url}/view?filename={filename}&type=output"
+
+
+def _etag(data):
+    return '"%s"' % hashlib.sha1(data).hexdigest()[:16] # As sent by the mock server
+
+
+def test_dropped_download_resumes_with_range(server, tmp_path):
+    server.state.view_truncate = 20000
+    client = comfyapi.ComfyClient()
+    client.set_base_url(server.url)
+    path = client.download_output(_view_url(server, "a.png"), str(tmp_path), chunk_size=4096)
+    assert open(path, "rb").read() == server.state.output_bytes()
+    assert server.state.view_truncate_hits >= 3 # 64 KiB arrived in several resumed pieces
+    assert os.listdir(tmp_path) == ["a.png"]
+
+
+def test_stale_partial_of_reused_filename_is_not_spliced(server, tmp_path):
+    old = server.state.output_bytes()
+    (tmp_path / "a.png.part").write_bytes(old[:10000])
+    (tmp_path / "a.png.part.validator").write_text(_etag(old))
+    server.state._output_blob = os.urandom(len(old)) # A newer output under the same name
+    client = comfyapi.ComfyClient()
+    client.set_base_url(server.url)
+    path = client.download_output(_view_url(server, "a.png"), str(tmp_path))
+    assert open(path, "rb").read() == server.state.output_bytes()
+    assert os.listdir(tmp_path) == ["a.png"]
+
+
+def test_partial_without_validator_is_discarded(server, tmp_path):
+    (tmp_path / "a.png.part").write_bytes(b"x" * 1000)
+    client = comfyapi.ComfyClient()
+    client.set_base_url(server.url)
+    path = client.download_output(_view_url(server, "a.png"), str(tmp_path))
+    assert open(path, "rb").read() == server.state.output_bytes()
+
+
+def test_complete_partial_is_kept_on_416(server, tmp_path):
+    data = server.state.output_bytes()
+    (tmp_path / "a.png.part").write_bytes(data)
+    (tmp_path / "a.png.part.validator").write_text(_etag(data))
+    received = []
+    client = comfyapi.ComfyClient()
+    client.set_base_url(server.url)
+    path = client.download_output(_view_url(server, "a.png"), str(tmp_path), progress_callback=lambda *args: received.append(args))
+    assert open(path, "rb").read() == data
+    assert received == [] # Nothing downloaded again
+    assert server.state.counters["GET /view"] == 1
+
+
+def test_misplaced_range_is_not_saved_as_the_whole_file(server, tmp_path):
+    data = server.state.output_bytes()
+    (tmp_path / "a.png.part").write_bytes(data[:10000])
+    (tmp_path / "a.png.part.validator").write_text(_etag(data))
+    server.state.view_range_shift = 1000 # 206 from byte 9000 for a request from byte 10000
+    client = comfyapi.ComfyClient()
+    client.set_base_url(server.url)
+    path = client.download_output(_view_url(server, "a.png"), str(tmp_path))
+    assert open(path, "rb").read() == data
+    assert server.state.counters["GET /view"] == 2 # The ranged request, then the whole file
+
+
+def test_async_misplaced_range_restarts(server, tmp_path):
+    data = server.state.output_bytes()
+    (tmp_path / "a.png.part").write_bytes(data[:10000])
+    (tmp_path / "a.png.part.validator").write_text(_etag(data))
+    server.state.view_range_shift = 1000
+
+    async def run():
+        manager = comfyapi.AsyncComfyAPIManager()
+        manager.set_base_url(server.url)
+        try:
+            return await manager.download_output(_view_url(server, "a.png"), str(tmp_path))
+        finally:
+            await manager.close()
+
+    assert open(asyncio.run(run()), "rb").read() == data
+
+
+@pytest.mark.parametrize("status, content_range, offset, action", [
+    (200, None, 0, "write"),
+    (200, None, 500, "write"), # If-Range failed: the whole, newer file
+    (206, "bytes 0-99/100", 0, "write"),
+    (206, "bytes 50-99/100", 0, None), # Never asked for a range
+    (206, "bytes 50-99/100", 50, "append"),
+    (206, "bytes 40-99/100", 50, "restart"),
+    (416, "bytes */100", 100, "complete"),
+    (416, "bytes */120", 100, "restart"),
+    (204, None, 50, None),
+])
+def test_resume_action(status, content_range, offset, action):
+    assert _resume_action(status, content_range, offset) == action
+
+
+def test_downloads_run_in_parallel(manager, server, tmp_path):
+    server.state.view_delay = 0.3
+    results = [(f"{i}.png", _view_url(server, f"{i}.png")) for i in range(8)]
+    started = time.monotonic()
+    saved, errors = manager.download_outputs(results, save_path=str(tmp_path), concurrency=8)
+    assert not errors and len(saved) == 8
+    assert time.monotonic() - started < 8 * 0.3 / 2 # Serial downloads would take 8 * view_delay
+
+
+def test_files_already_downloaded_are_skipped(manager, server, tmp_path):
+    results = [("a.png", _view_url(server, "a.png"))]
+    assert manager.download_outputs(results, save_path=str(tmp_path))[0] == [str(tmp_path / "a.png")]
+    assert manager.download_outputs(results, save_path=str(tmp_path))[0] == [str(tmp_path / "a.png")]
+    assert server.state.counters["GET /view"] == 1 and server.state.counters["HEAD /view"] == 1
+
+
+def test_wait_and_download_overlaps_execution(manager, tmp_path):
+    uids = manager.batch_submit(num_seeds=4)
+    saved, errors = manager.wait_and_download_outputs(uids, save_path=str(tmp_path))
+    assert not errors and len(saved) == 4
@@ -0,0 +1,65 @@
+import comfyapi
+from comfyapi.feeder import _FairQueue, _HeldPrompt
+
+from conftest import WORKFLOW
+
+
+def test_max_queued_bounds_the_server_queue(server):
+    manager = comfyapi.ComfyAPIManager(max_queued=3)
+    manager.set_base_url(server.url)
+    manager.load_workflow(WORKFLOW)
+    try:
+        uids = manager.batch_submit(num_seeds=20)
+        assert manager.feeder_stats()["held"] > 0
+        results, errors = manager.wait_and_get_all_outputs(uids)
+        assert len(results) == 20 and not errors
+        # Without the feeder all 20 would be pending at once
+        assert server.state.max_pending <= 3
+        assert manager.feeder_stats()["completed"] == 20
+    finally:
+        manager.close()
+
+
+def test_interactive_prompts_skip_held_batch(server):
+    manager = comfyapi.ComfyAPIManager(max_queued=1)
+    manager.set_base_url(server.url)
+    manager.load_workflow(WORKFLOW)
+    try:
+        batch = manager.batch_submit(num_seeds=10)
+        urgent = manager.submit_workflow(priority="interactive")
+        manager.wait_for_finish(urgent)
+        started = server.state.stats()["started_at"]
+        # At most the prompts already on the server ran before it
+        assert sum(1 for uid in batch if started.get(uid, float("inf")) < started[urgent]) <= 2
+        manager.wait_and_get_all_outputs(batch)
+    finally:
+        manager.close()
+
+
+def _held(prompt_id, tenant=None, priority="batch"):
+    return _HeldPrompt(prompt_id, b"{}", None, priority, tenant)
+
+
+def test_tenants_share_sends_by_weight():
+    queue = _FairQueue({"a": 2})
+    for i in range(6):
+        queue.push(_held(f"a{i}", "a"))
+        queue.push(_held(f"b{i}", "b"))
+    sent = [queue.pop().tenant for _ in range(6)]
+    assert sent.count("a") == 4 and sent.count("b") == 2
+
+
+def test_classes_are_sent_in_priority_order():
+    queue = _FairQueue()
+    queue.push(_held("batch"))
+    queue.push(_held("normal", priority="normal"))
+    queue.push(_held("interactive", priority="interactive"))
+    assert [entry.prompt_id for entry in queue.drain()] == ["interactive", "normal", "batch"]
+
+
+def test_requeued_prompt_can_be_popped_again():
+    queue = _FairQueue()
+    queue.push(_held("a"))
+    entry = queue.pop() # Its tenant has nothing else queued
+    queue.requeue(entry) # As after a server failed to accept it
+    assert queue.pop() is entry and len(queue) == 0
@@ -0,0 +1,40 @@
+import comfyapi
+
+
+def _history_requests(server):
+    counters = server.state.stats()["counters"]
+    return counters.get("GET /history/{id}", 0) + counters.get("GET /history", 0)
+
+
+def test_finished_prompts_are_served_from_the_history_cache(manager, server):
+    prompt_id = manager.submit_workflow()
+    filename, url = manager.wait_for_finish(prompt_id)
+    before = _history_requests(server)
+    assert manager.find_output(prompt_id, with_filename=True) == (url, filename)
+    assert manager.find_output(prompt_id, all_outputs=True)
+    assert manager.check_queue(prompt_id)
+    assert manager.client.get_history(prompt_id)["status"]["status_str"] == "success"
+    assert _history_requests(server) == before
+
+
+def test_one_history_fetch_per_completion(manager, server):
+    manager.wait_for_finish(manager.submit_workflow()) # Connects the WebSocket
+    before = _history_requests(server)
+    uids = manager.batch_submit(num_seeds=10)
+    results, errors = manager.wait_and_get_all_outputs(uids)
+    assert len(results) == 10 and not errors
+    for uid in uids:
+        manager.find_output(uid)
+    assert _history_requests(server) - before <= len(uids)
+
+
+def test_unfinished_prompts_are_not_cached(start_server):
+    server = start_server(latency=0.5)
+    client = comfyapi.ComfyClient(server.url)
+    try:
+        prompt_id = client.queue_prompt({"3": {"class_type": "KSampler", "inputs": {}}})
+        assert client.get_history(prompt_id) is None
+        assert client.get_history(prompt_id) is None
+        assert server.state.counters["GET /history/{id}"] == 2
+    finally:
+        client.close()
@@ -0,0 +1,59 @@
+import io
+import logging
+import os
+
+import pytest
+
+Image = pytest.importorskip("PIL.Image")
+
+import comfyapi  # noqa: E402
+from comfyapi.imaging import _fit_image  # noqa: E402
+
+
+def _noise(tmp_path, name, size=(1600, 1200), mode="RGB", **save):
+    image = Image.frombytes("RGB", size, os.urandom(size[0] * size[1] * 3))
+    if mode != "RGB":
+        image = image.convert(mode)
+    path = str(tmp_path / name)
+    image.save(path, **save)
+    return path
+
+
+@pytest.mark.parametrize("image_format", ["JPEG", "WEBP"])
+def test_fit_image_fits_the_limit_in_a_few_encodes(tmp_path, image_format):
+    path = _noise(tmp_path, "noise.png")
+    data, extension, stats = _fit_image(path, 200000, image_format=image_format)
+    assert stats["fits"] and len(data) <= 200000
+    assert max(stats["size"]) <= 1024 and stats["encodes"] <= 6
+    assert extension == (".jpg" if image_format == "JPEG" else ".webp")
+
+
+def test_fit_image_reports_a_limit_it_cannot_meet(tmp_path, caplog):
+    path = _noise(tmp_path, "noise.png")
+    with caplog.at_level(logging.WARNING, logger="comfyapi"):
+        data, _, stats = _fit_image(path, 100)
+    assert not stats["fits"] and len(data) > 100
+    assert "Could not fit" in caplog.text
+
+
+def test_webp_keeps_palette_transparency(tmp_path):
+    image = Image.new("P", (1200, 1200), 0)
+    image.putpalette([255, 0, 0] + [0, 0, 255] * 255)
+    image.paste(1, (0, 0, 600, 1200))
+    path = str(tmp_path / "palette.png")
+    image.save(path, transparency=0)
+    data, _, stats = _fit_image(path, 50000, image_format="WEBP")
+    out = Image.open(io.BytesIO(data))
+    assert out.mode == "RGBA"
+    assert out.getpixel((out.size[0] - 1, 0))[3] == 0 # The transparent half stays transparent
+    assert out.getpixel((0, 0))[3] == 255
+
+
+def test_set_base64_image_logs_at_debug_level(tmp_path, caplog):
+    manager = comfyapi.ComfyAPIManager()
+    manager.workflow = {"10": {"class_type": "Base64ImageLoader", "inputs": {"image": "", "filename": ""}}}
+    path = _noise(tmp_path, "noise.png")
+    with caplog.at_level(logging.DEBUG, logger="comfyapi"):
+        stats = manager.set_base64_image(10, path, max_size_bytes=200000)
+    assert stats["resized"] and stats["fits"]
+    assert [record.levelno for record in caplog.records if "Resized" in record.getMessage()] == [logging.DEBUG]
@@ -0,0 +1,67 @@
+import logging
+
+import pytest
+
+import comfyapi
+from comfyapi.client import _history_error
+from comfyapi.instrumentation import _span
+
+from conftest import WORKFLOW
+
+
+@pytest.fixture
+def recorder():
+    recorder = comfyapi.add_instrumentation(comfyapi.MetricsRecorder())
+    yield recorder
+    comfyapi.remove_instrumentation(recorder)
+
+
+def test_library_logger_has_a_null_handler():
+    assert any(isinstance(handler, logging.NullHandler) for handler in logging.getLogger("comfyapi").handlers)
+
+
+def test_errors_count_once_where_reported(recorder, start_server):
+    _history_error("unused", {"status": {"status_str": "error"}}) # Built, never raised
+    assert "errors" not in recorder.snapshot()["counters"]
+    server = start_server(failure_rate=1.0)
+    manager = comfyapi.ComfyAPIManager()
+    manager.set_base_url(server.url)
+    manager.load_workflow(WORKFLOW)
+    try:
+        uids = manager.batch_submit(num_seeds=3)
+        results, errors = manager.wait_and_get_all_outputs(uids)
+        assert len(errors) == 3
+        assert recorder.snapshot()["counters"]["errors"] == {"kind=ExecutionError": 3}
+    finally:
+        manager.close()
+
+
+
+def test_phases_and_requests_are_recorded(recorder, manager, tmp_path):
+    prompt_id = manager.submit_workflow()
+    filename, url = manager.wait_for_finish(prompt_id)
+    manager.download_output(url, save_path=str(tmp_path))
+    snapshot = recorder.snapshot()
+    for phase in ("serialize", "submit", "queue_wait", "execution", "download"):
+        assert snapshot["timings"][phase]["count"] >= 1, phase
+    assert snapshot["counters"]["http_requests"]["endpoint=/prompt,method=POST,status=200"] == 1
+    assert snapshot["counters"]["download_bytes"][""] == (tmp_path / filename).stat().st_size
+
+
+def test_failing_hook_does_not_break_requests(manager):
+    class Broken:
+        def timing(self, phase, seconds):
+            raise RuntimeError("hook bug")
+
+        def count(self, name, value, labels):
+            raise RuntimeError("hook bug")
+
+    hook = comfyapi.add_instrumentation(Broken())
+    try:
+        assert manager.wait_for_finish(manager.submit_workflow())
+    finally:
+        comfyapi.remove_instrumentation(hook)
+
+
+def test_nothing_is_timed_without_a_hook():
+    assert _span("serialize") is _span("submit") # The shared no-op
@@ -0,0 +1,48 @@
+import time
+
+import pytest
+
+from comfyapi.jobs import _JobRegistry
+
+
+def test_oldest_finished_jobs_are_evicted():
+    jobs = _JobRegistry(max_finished=2)
+    for prompt_id in ("a", "b", "c", "d"):
+        jobs.add(prompt_id)
+    for prompt_id in ("a", "b", "c"):
+        jobs.mark_finished(prompt_id)
+    assert jobs.get("a") is None and "a" not in jobs
+    assert [record.prompt_id for record in jobs.finished_since()] == ["b", "c"]
+    assert [record.prompt_id for record in jobs.pending()] == ["d"]
+
+
+def test_finished_since_returns_later_completions_in_order():
+    jobs = _JobRegistry()
+    for prompt_id in ("a", "b", "c"):
+        jobs.add(prompt_id)
+    jobs.mark_finished("b")
+    time.sleep(0.01)
+    cutoff = time.time()
+    time.sleep(0.01)
+    jobs.mark_error("c", RuntimeError("boom"))
+    jobs.mark_finished("a")
+    assert [record.prompt_id for record in jobs.finished_since(cutoff)] == ["c", "a"]
+    assert jobs.get("c")["status"] == "error"
+    assert [record.prompt_id for record in jobs.pending()] == []
+
+
+def test_pending_jobs_keep_submission_order(manager, server):
+    server.state.latency = 5
+    uids = manager.batch_submit(num_seeds=3, concurrency=1)
+    assert [job.prompt_id for job in manager.pending_jobs()] == uids
+    assert manager.get_job(uids[1])["status"] == "queued"
+
+
+def test_queue_is_a_read_only_snapshot(manager):
+    uid = manager.submit_workflow()
+    queue = manager.queue
+    assert isinstance(queue, tuple) and queue[0]["prompt_id"] == uid
+    with pytest.raises(AttributeError):
+        queue.append({"prompt_id": "other"})
+    manager.submit_workflow()
+    assert len(queue) == 1 and len(manager.queue) == 2
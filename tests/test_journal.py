@@ -0,0 +1,124 @@
+import threading
+
+import pytest
+
+import comfyapi
+
+from conftest import WORKFLOW
+
+
+def _manager(server, path, **kwargs):
+    manager = comfyapi.ComfyAPIManager(journal=comfyapi.JobJournal(str(path)), **kwargs)
+    manager.set_base_url(server.url)
+    manager.load_workflow(WORKFLOW)
+    return manager
+
+
+@pytest.mark.parametrize("max_queued", [None, 2])
+def test_resume_reattaches_without_resubmitting(start_server, tmp_path, max_queued):
+    server = start_server(latency=0.05)
+    path = tmp_path / "jobs.jsonl"
+    manager = _manager(server, path, max_queued=max_queued)
+    uids = manager.batch_submit(seeds=list(range(8)))
+    manager.close() # As if the worker restarted mid-batch
+    resumed = _manager(server, path, max_queued=max_queued)
+    try:
+        assert sorted(resumed.resume()) == sorted(uids)
+        results, errors = resumed.wait_and_get_all_outputs(uids)
+        assert len(results) == 8 and not errors
+        assert server.state.counters["POST /prompt"] == 8
+        assert sorted(job["params"]["seed"] for job in resumed.journal.jobs()) == list(range(8))
+    finally:
+        resumed.close()
+
+
+def test_prompts_lost_by_a_restarted_server_fail(start_server, tmp_path):
+    path = tmp_path / "jobs.jsonl"
+    server = start_server(latency=5)
+    manager = _manager(server, path)
+    uids = manager.batch_submit(seeds=[1, 2])
+    manager.close()
+    server.stop()
+    restarted = start_server(port=int(server.url.rsplit(":", 1)[1])) # Same URL, empty queue and history
+    resumed = _manager(restarted, path)
+    try:
+        resumed.resume()
+        results, errors = resumed.wait_and_get_all_outputs(uids)
+        assert not results and all("no longer known" in str(error) for error in errors)
+    finally:
+        resumed.close()
+
+
+def test_resume_leaves_prompts_of_other_servers_alone(start_server, tmp_path):
+    path = tmp_path / "jobs.jsonl"
+    first, second = start_server(latency=5), start_server()
+    manager = _manager(first, path)
+    uids = manager.batch_submit(seeds=[1, 2])
+    manager.close()
+    resumed = _manager(second, path)
+    try:
+        resumed.resume()
+        errors = [resumed.get_job(uid).error for uid in uids]
+        assert all(isinstance(error, comfyapi.QueueError) and first.url in str(error) for error in errors)
+        assert "GET /history" not in second.state.stats()["counters"]
+    finally:
+        resumed.close()
+
+
+def test_closing_the_manager_closes_the_journal(server, tmp_path):
+    manager = _manager(server, tmp_path / "jobs.jsonl")
+    journal = manager.journal
+    manager.wait_for_finish(manager.submit_workflow())
+    manager.close()
+    assert journal._closed and not journal._thread.is_alive()
+    assert [job["status"] for job in journal.jobs()] == ["finished"]
+
+
+def test_state_survives_reopening_and_compaction(tmp_path):
+    path = str(tmp_path / "jobs.jsonl")
+    journal = comfyapi.JobJournal(path)
+    journal.submitted("held", status="held", prompt_bytes=b'{"1":{"inputs":{}}}', tenant=("team", 1))
+    journal.submitted("done", server="http://a")
+    journal.params("done", {"seed": 3})
+    journal.finished("done", "finished")
+    journal.submitted("moved", server="http://a")
+    journal.moved("moved", "http://b", "other-id")
+    live = journal.jobs()
+    journal.close()
+    reopened = comfyapi.JobJournal(path)
+    try:
+        assert reopened.jobs() == live
+        reopened.compact()
+        assert [job["prompt_id"] for job in reopened.jobs()] == ["held", "moved"]
+        assert reopened.prompts(["held", "moved"]) == {"held": b'{"1":{"inputs":{}}}'}
+        reopened.submitted("late", server="http://a")
+    finally:
+        reopened.close()
+    compacted = comfyapi.JobJournal(path)
+    try:
+        assert [job["prompt_id"] for job in compacted.jobs()] == ["held", "moved", "late"]
+        assert compacted.jobs()[0]["tenant"] == ("team", 1)
+        assert compacted.jobs()[1]["server_prompt_id"] == "other-id"
+        assert compacted.prompts(["held"]) == {"held": b'{"1":{"inputs":{}}}'}
+    finally:
+        compacted.close()
+
+
+def test_compact_keeps_lines_written_meanwhile(tmp_path):
+    journal = comfyapi.JobJournal(str(tmp_path / "jobs.jsonl"), sync_interval=0.001)
+
+    def submit(worker):
+        for i in range(500):
+            journal.submitted(f"{worker}-{i}")
+
+    threads = [threading.Thread(target=submit, args=(worker,)) for worker in range(4)]
+    for thread in threads:
+        thread.start()
+    for _ in range(20):
+        journal.compact()
+    for thread in threads:
+        thread.join()
+    journal.finished("0-0", "finished")
+    journal.compact()
+    assert len(journal.jobs()) == 1999
+    journal.close()
@@ -0,0 +1,28 @@
+import comfyapi
+
+from conftest import WORKFLOW
+
+
+def _manager(server):
+    manager = comfyapi.ComfyAPIManager()
+    manager.set_base_url(server.url)
+    manager.load_workflow(WORKFLOW)
+    return manager
+
+
+def test_managers_keep_their_own_server_and_jobs(start_server):
+    first_server, second_server = start_server(), start_server()
+    first, second = _manager(first_server), _manager(second_server)
+    try:
+        assert first.client is not second.client
+        first.edit_workflow(["3", "inputs", "seed"], 1)
+        uid = first.submit_workflow()
+        filename, url = first.wait_for_finish(uid)
+        assert url.startswith(first_server.url)
+        assert second.get_job(uid) is None and not second.queue
+        assert second.workflow["3"]["inputs"]["seed"] != 1
+        assert "POST /prompt" not in second_server.state.stats()["counters"]
+        assert second.wait_for_finish(second.submit_workflow())[1].startswith(second_server.url)
+    finally:
+        first.close()
+        second.close()
@@ -0,0 +1,78 @@
+import asyncio
+import time
+
+import comfyapi
+
+from conftest import WORKFLOW
+
+
+def test_all_outputs_indexes_every_file(manager, server):
+    server.state.extra_outputs = True
+    prompt_id = manager.submit_workflow()
+    index = manager.wait_for_finish(prompt_id, all_outputs=True)
+    records = [record for records in index.values() for record in records]
+    assert sorted(record["kind"] for record in records) == ["gifs", "images", "images"]
+    assert {record["type"] for record in records} == {"output", "temp"}
+    video = next(record for record in records if record["kind"] == "gifs")
+    assert video["subfolder"] == "videos" and "subfolder=videos" in video["url"]
+    assert manager.find_output(prompt_id, all_outputs=True) == index
+
+
+def _wait_for_history(server, prompt_id):
+    while not server.state.history(prompt_id):
+        time.sleep(0.01)
+
+
+def _drop_images(server):
+    """Leaves only the video output in every history entry."""
+    for entry in server.state._history.values():
+        entry["outputs"] = {node: output for node, output in entry["outputs"].items() if "gifs" in output}
+
+
+def test_check_queue_sees_non_image_outputs(manager, server):
+    server.state.extra_outputs = True
+    prompt_id = manager.submit_workflow()
+    _wait_for_history(server, prompt_id)
+    _drop_images(server)
+    assert manager.check_queue(prompt_id)
+    assert manager.get_job(prompt_id).status == "finished"
+
+
+def test_async_check_queue_sees_non_image_outputs(server):
+    async def run():
+        manager = comfyapi.AsyncComfyAPIManager()
+        manager.set_base_url(server.url)
+        manager.load_workflow(WORKFLOW)
+        try:
+            server.state.extra_outputs = True
+            prompt_id = await manager.submit_workflow()
+            while not server.state.history(prompt_id):
+                await asyncio.sleep(0.01)
+            _drop_images(server)
+            return await manager.check_queue(prompt_id)
+        finally:
+            await manager.close()
+
+    assert asyncio.run(run())
+
+
+def test_check_queue_reports_server_failures(manager, server):
+    server.state.failure_rate = 1.0
+    prompt_id = manager.submit_workflow()
+    _wait_for_history(server, prompt_id)
+    assert not manager.check_queue(prompt_id)
+    assert manager.get_job(prompt_id).status == "error"
+
+
+def test_cluster_check_queue_keeps_failed_payload(start_server):
+    server = start_server(failure_rate=1.0)
+    cluster = comfyapi.ComfyClusterManager([server.url])
+    cluster.load_workflow(WORKFLOW)
+    try:
+        prompt_id = cluster.submit_workflow()
+        _wait_for_history(server, prompt_id)
+        assert not cluster.check_queue(prompt_id)
+        assert cluster.get_job(prompt_id).status == "error"
+        assert prompt_id in cluster._payloads # Can still be resubmitted elsewhere
+    finally:
+        cluster.close()
@@ -0,0 +1,42 @@
+from comfyapi.client import _ExecutionStats, _poll_delay, _structure_key
+
+WORKFLOW = {"3": {"class_type": "KSampler", "inputs": {"seed": 1, "model": ["4", 0]}},
+            "4": {"class_type": "CheckpointLoaderSimple", "inputs": {"ckpt_name": "a.safetensors"}}}
+
+
+def _history(prompt_id, seconds, prompt=WORKFLOW):
+    return {"prompt": [0, prompt_id, prompt, {}, []],
+            "status": {"messages": [["execution_start", {"timestamp": 1000}],
+                                    ["execution_success", {"timestamp": 1000 + seconds * 1000}]]}}
+
+
+def test_poll_delay_waits_for_the_expected_finish():
+    assert _poll_delay(3.0, 4) == (3.0, 0)
+    assert _poll_delay(600.0, 0) == (30, 0) # Re-checked while deep in the queue
+
+
+def test_poll_delay_backs_off_without_an_estimate():
+    delays = []
+    misses = 0
+    for _ in range(8):
+        delay, misses = _poll_delay(None, misses)
+        delays.append(delay)
+    assert delays[:3] == [0.25, 0.5, 1.0] and delays[-1] == 5
+
+
+def test_scalar_inputs_share_a_structure_key():
+    other_seed = {**WORKFLOW, "3": {"class_type": "KSampler", "inputs": {"seed": 2, "model": ["4", 0]}}}
+    relinked = {**WORKFLOW, "3": {"class_type": "KSampler", "inputs": {"seed": 1, "model": ["5", 0]}}}
+    assert _structure_key(WORKFLOW) == _structure_key(other_seed) != _structure_key(relinked)
+
+
+def test_etas_add_up_the_prompts_ahead():
+    stats = _ExecutionStats()
+    assert stats.etas({"queue_running": [], "queue_pending": [[1, "p", WORKFLOW]]}) == {} # Nothing learned yet
+    stats.record("done", _history("done", 4))
+    stats.record("done", _history("done", 100)) # Counted once
+    queue_data = {"queue_running": [[0, "r", WORKFLOW]],
+                  "queue_pending": [[2, "b", WORKFLOW], [1, "a", WORKFLOW]]}
+    stats.etas(queue_data, now=100.0) # "r" is first seen running now
+    etas = stats.etas(queue_data, now=101.0)
+    assert etas == {"r": 3.0, "a": 7.0, "b": 11.0}
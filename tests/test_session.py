@@ -0,0 +1,36 @@
+import comfyapi
+
+
+def test_requests_share_one_keep_alive_session(server):
+    client = comfyapi.ComfyClient(server.url)
+    try:
+        session = client._get_session()
+        for _ in range(5):
+            client.get_queue()
+        assert client._get_session() is session
+        assert len(server.state.connections) == 1
+    finally:
+        client.close()
+
+
+def test_unavailable_responses_are_retried(server):
+    recorder = comfyapi.add_instrumentation(comfyapi.MetricsRecorder())
+    client = comfyapi.ComfyClient(server.url, retries=3, backoff_factor=0)
+    try:
+        server.state.unavailable = 2
+        assert client.get_queue() == {"queue_running": [], "queue_pending": []}
+        assert server.state.stats()["counters"]["GET /queue"] == 3
+        assert recorder.snapshot()["counters"]["retries"] == {"endpoint=/queue,method=GET": 2}
+    finally:
+        client.close()
+        comfyapi.remove_instrumentation(recorder)
+
+
+def test_retries_give_up_after_the_configured_count(server):
+    client = comfyapi.ComfyClient(server.url, retries=1, backoff_factor=0)
+    try:
+        server.state.unavailable = 5
+        assert client.get_queue() is None
+        assert server.state.stats()["counters"]["GET /queue"] == 2
+    finally:
+        client.close()
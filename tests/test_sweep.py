@@ -0,0 +1,42 @@
+import asyncio
+
+import pytest
+
+import comfyapi
+
+from conftest import SEED_PATH, WORKFLOW
+
+CFG_PATH = ["3", "inputs", "cfg"]
+
+
+def test_sweep_returns_rows_in_grid_order(manager):
+    table = manager.sweep({"seed": (SEED_PATH, [1, 2, 3]), "cfg": (CFG_PATH, [5.0, 7.5])})
+    assert list(table) == [(1, 5.0), (1, 7.5), (2, 5.0), (2, 7.5), (3, 5.0), (3, 7.5)]
+    assert {row["status"] for row in table.values()} == {"finished"}
+
+
+@pytest.mark.parametrize("params, mode", [
+    ({"seed": (SEED_PATH, [1, 1])}, "product"),
+    ({"seed": (SEED_PATH, [1, 1]), "cfg": (CFG_PATH, [5.0, 5.0])}, "zip"),
+    ({"model": (["3", "inputs", "model"], [["4", 0]])}, "product"),
+])
+def test_bad_sweep_keys_fail_before_submitting(manager, server, params, mode):
+    with pytest.raises(ValueError):
+        manager.sweep(params, mode=mode)
+    assert "POST /prompt" not in server.state.counters
+
+
+def test_async_sweep(server):
+    async def run():
+        manager = comfyapi.AsyncComfyAPIManager()
+        manager.set_base_url(server.url)
+        manager.load_workflow(WORKFLOW)
+        try:
+            return await manager.sweep({"seed": (SEED_PATH, list(range(20))), "cfg": (CFG_PATH, [5.0, 7.5])},
+                                       concurrency=4)
+        finally:
+            await manager.close()
+
+    table = asyncio.run(run())
+    assert list(table) == [(seed, cfg) for seed in range(20) for cfg in (5.0, 7.5)]
+    assert {row["status"] for row in table.values()} == {"finished"}
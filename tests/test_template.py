@@ -0,0 +1,38 @@
+import json
+
+import pytest
+
+import comfyapi
+
+from conftest import WORKFLOW
+
+SLOTS = {"seed": ["3", "inputs", "seed"], "text": ["6", "inputs", "text"], "cfg": ["3", "inputs", "cfg"]}
+
+
+def _edited(values):
+    manager = comfyapi.ComfyAPIManager()
+    manager.load_workflow(WORKFLOW)
+    for name, value in values.items():
+        manager.edit_workflow(SLOTS[name], value)
+    return manager.workflow
+
+
+@pytest.mark.parametrize("values", [
+    {"seed": 42, "text": "a cat", "cfg": 7.5},
+    {"seed": 2**32 - 1, "text": 'quotes " and \\ backslashes, unicode é中, newline\n'},
+    {"text": {"nested": [1, None, True]}},
+    {},
+])
+def test_render_matches_the_edited_workflow(values):
+    manager = comfyapi.ComfyAPIManager()
+    manager.load_workflow(WORKFLOW)
+    template = comfyapi.WorkflowTemplate(manager.workflow, **SLOTS)
+    assert json.loads(template.render_prompt(**values)) == _edited(values)
+
+
+def test_unknown_slot_is_rejected():
+    manager = comfyapi.ComfyAPIManager()
+    manager.load_workflow(WORKFLOW)
+    template = comfyapi.WorkflowTemplate(manager.workflow, seed=SLOTS["seed"])
+    with pytest.raises(ValueError):
+        template.render_prompt(steps=3)
@@ -0,0 +1,57 @@
+import json
+import threading
+import time
+
+import comfyapi
+from comfyapi.client import _PromptWatcher
+
+from conftest import SEED_PATH, WORKFLOW
+
+
+def _workflow():
+    with open(WORKFLOW) as f:
+        return json.load(f)
+
+
+def test_watcher_reports_completions_and_errors():
+    reported = []
+    watcher = _PromptWatcher(None, lambda prompt_id, error: reported.append((prompt_id, error)))
+    watcher._handle_message({"type": "executing", "data": {"node": "9", "prompt_id": "a"}})
+    watcher._handle_message({"type": "executing", "data": {"node": None, "prompt_id": "a"}})
+    watcher._handle_message({"type": "execution_error", "data": {"prompt_id": "b", "node_id": "3", "node_type": "KSampler",
+                                                                 "exception_message": "boom"}})
+    watcher._handle_message({"type": "execution_interrupted", "data": {"prompt_id": "c"}})
+    watcher._handle_message({"type": "status", "data": {"status": {}}})
+    assert [prompt_id for prompt_id, _ in reported] == ["a", "b", "c"]
+    assert reported[0][1] is None
+    assert isinstance(reported[1][1], comfyapi.ExecutionError) and "node 3 (KSampler): boom" in str(reported[1][1])
+    assert isinstance(reported[2][1], comfyapi.ExecutionError)
+
+
+def test_completion_arrives_over_websocket_not_polling(start_server):
+    server = start_server(latency=0.3)
+    client = comfyapi.ComfyClient(server.url)
+    try:
+        prompt_id = client.queue_prompt(_workflow())
+        started = time.monotonic()
+        filename, output_url = client.wait_for_finish(prompt_id, poll_interval=30)
+        assert time.monotonic() - started < 5 # A poll every 30 s would not have seen it yet
+        assert filename.endswith(".png") and output_url.startswith(server.url)
+    finally:
+        client.close()
+
+
+def test_one_scheduler_tracks_every_pending_prompt(start_server):
+    server = start_server(latency=0.02)
+    client = comfyapi.ComfyClient(server.url)
+    trackers = [thread.name for thread in threading.enumerate()].count("comfyapi-tracker") # Of other clients
+    try:
+        uids = client.batch_submit(_workflow(), SEED_PATH, num_seeds=30)
+        results, errors = client.wait_and_get_all_outputs(uids, max_wait_time=30)
+        assert len(results) == 30 and not errors
+        assert [thread.name for thread in threading.enumerate()].count("comfyapi-tracker") <= trackers + 1
+        counters = server.state.stats()["counters"]
+        history_requests = counters.get("GET /history/{id}", 0) + counters.get("GET /history", 0)
+        assert history_requests <= 2 * len(uids) # Not one poll per waiter per interval
+    finally:
+        client.close()
@@ -0,0 +1,43 @@
+import asyncio
+import hashlib
+
+import comfyapi
+
+
+def _image(tmp_path, name, data):
+    path = tmp_path / name
+    path.write_bytes(data)
+    return str(path)
+
+
+def test_same_content_is_uploaded_once(manager, server, tmp_path):
+    first = _image(tmp_path, "a.PNG", b"\x89PNG first image")
+    copy = _image(tmp_path, "b.png", b"\x89PNG first image")
+    other = _image(tmp_path, "c.png", b"\x89PNG second image")
+    name = manager.upload_image(first)
+    assert name == hashlib.sha256(b"\x89PNG first image").hexdigest()[:32] + ".png"
+    assert manager.upload_image(copy) == name
+    assert manager.upload_image(other) != name
+    assert server.state.counters["POST /upload/image"] == 2
+    assert server.state._uploads[name] == b"\x89PNG first image"
+
+
+def test_set_image_points_the_node_at_the_upload(manager, tmp_path):
+    manager.workflow = {"10": {"class_type": "LoadImage", "inputs": {"image": "old.png"}}}
+    name = manager.set_image(10, _image(tmp_path, "in.png", b"\x89PNG input"))
+    assert manager.workflow["10"]["inputs"]["image"] == name
+
+
+def test_async_upload_uses_the_hash_cache(server, tmp_path):
+    path = _image(tmp_path, "a.png", b"\x89PNG async image")
+
+    async def run():
+        manager = comfyapi.AsyncComfyAPIManager()
+        manager.set_base_url(server.url)
+        try:
+            return [await manager.upload_image(path) for _ in range(3)]
+        finally:
+            await manager.close()
+
+    names = asyncio.run(run())
+    assert len(set(names)) == 1 and server.state.counters["POST /upload/image"] == 1
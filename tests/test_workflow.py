@@ -0,0 +1,42 @@
+import pytest
+
+import comfyapi
+
+from conftest import WORKFLOW
+
+
+def _manager(workflow):
+    manager = comfyapi.ComfyAPIManager()
+    manager.workflow = workflow
+    return manager
+
+
+def test_failed_edit_leaves_the_workflow_unchanged():
+    manager = _manager({"3": {"inputs": {"seed": 1, "cfg": 7}}})
+    manager.edit_workflow(["3", "inputs", "seed"], 2)
+    before = manager.workflow
+    with pytest.raises(ValueError):
+        manager.edit_workflow(["3", "inputs", "seed", "deeper"], 3)
+    with pytest.raises(ValueError):
+        manager.edit_workflow(["9", "inputs", "seed"], 3)
+    assert manager.workflow == before == {"3": {"inputs": {"seed": 2, "cfg": 7}}}
+
+
+def test_workflow_is_isolated_from_the_callers_dict():
+    original = {"3": {"inputs": {"seed": 1}}, "4": {"inputs": {"steps": 20}}}
+    manager = _manager(original)
+    manager.edit_workflow(["3", "inputs", "seed"], 2)
+    edited = manager.workflow
+    edited["4"]["inputs"]["steps"] = 30
+    assert original == {"3": {"inputs": {"seed": 1}}, "4": {"inputs": {"steps": 20}}}
+    original["3"]["inputs"]["seed"] = 5
+    assert manager.workflow["3"]["inputs"]["seed"] == 2
+
+
+def test_later_edits_supersede_earlier_ones_below_them():
+    manager = comfyapi.ComfyAPIManager()
+    manager.load_workflow(WORKFLOW)
+    manager.edit_workflow(["3", "inputs", "seed"], 1)
+    manager.edit_workflow(["3", "inputs"], {"seed": 2})
+    manager.edit_workflow(["3", "inputs", "seed"], 3)
+    assert manager.workflow["3"]["inputs"] == {"seed": 3}